@@ -2,12 +2,10 @@
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 import os
 import uvicorn
-import json
 import logging
 
 # Configurar logging
@@ -15,7 +13,18 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Importa os módulos refatorados
-from utils.clip_classifier import load_classifier, get_device_info
+from utils.clip_classifier import get_device_info
+from utils.model_lifecycle import MODEL_LOAD_IN_BACKGROUND, get_liveness, get_readiness, start_model_loading
+from utils.detection_pool import DETECTION_BACKEND, DETECTION_WORKERS, start_detection_pool, stop_detection_pool
+from utils.job_queue import JOB_WORKERS, start_job_queue, stop_job_queue
+from utils.access_log import AccessLogMiddleware, start_access_logging, stop_access_logging
+from utils.metrics import MetricsMiddleware
+from utils.request_timing import TimingMiddleware
+from utils.sampling_profiler import start_sampling_profiler_if_enabled, stop_sampling_profiler
+from utils.tracing import TraceMiddleware, start_tracing, stop_tracing
+from utils.slow_requests import SlowRequestMiddleware
+from utils.serialization import FastJSONResponse
+from utils.crop_storage import start_crop_storage, stop_crop_storage
 
 # Importa os routers
 from routers.clothing import router as clothing_router
@@ -23,9 +32,15 @@ from routers.body_parts import router as body_parts_router
 from routers.analysis import router as analysis_router
 from routers.config import router as config_router
 from routers.static_files import router as static_files_router
+from routers.video import router as video_router
+from routers.stream import router as stream_router
+from routers.jobs import router as jobs_router
+from routers.metrics import router as metrics_router
+from routers.admin import router as admin_router
 
 app = FastAPI(
     title="CLIP Clothing & Body Parts API",
+    default_response_class=FastJSONResponse,
     description="""
     ## API para classificação de roupas e detecção de partes do corpo
     
@@ -40,6 +55,11 @@ app = FastAPI(
     - `/api/v1/body-parts/detect` - Detecção de partes do corpo
     - `/api/v1/body-parts/extract` - Extração e salvamento de partes
     - `/api/v1/analysis/complete` - Análise completa
+    - `/api/v1/analysis/complete/stream` - Análise completa com resultados progressivos (NDJSON/SSE)
+    - `/api/v1/video/analyze` - Análise de outfit em vídeo
+    - `/api/v1/stream/ws` - Análise em tempo real (WebSocket)
+    - `/api/v1/jobs` - Jobs assíncronos (submissão, consulta e cancelamento)
+    - `/metrics` - Métricas no formato do Prometheus
     """,
     version="2.0.0",
     openapi_tags=[
@@ -55,6 +75,18 @@ app = FastAPI(
             "name": "Analysis",
             "description": "Endpoints para análise completa combinando classificação e detecção"
         },
+        {
+            "name": "Video Analysis",
+            "description": "Endpoints para análise de outfit em vídeos curtos"
+        },
+        {
+            "name": "Live Stream",
+            "description": "WebSocket para análise em tempo real de um feed de câmera"
+        },
+        {
+            "name": "Jobs",
+            "description": "Fila persistente de jobs para análises pesadas"
+        },
         {
             "name": "Configuration",
             "description": "Endpoints para configuração da API"
@@ -62,71 +94,32 @@ app = FastAPI(
         {
             "name": "Static Files",
             "description": "Endpoints para acessar arquivos estáticos salvos"
+        },
+        {
+            "name": "Metrics",
+            "description": "Métricas para Prometheus (latência por rota e por estágio, filas, caches e memória)"
+        },
+        {
+            "name": "Admin",
+            "description": "Diagnóstico (exige X-Admin-Token): perfis das requisições com ?profile=1 e profiler de amostragem contínuo"
         }
     ]
 )
 
-# Middleware para capturar erros de parsing
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    """Middleware para logar detalhes das requisições e capturar erros de parsing"""
-    
-    # Log da requisição
-    logger.info(f"{request.method} {request.url}")
-    logger.info(f"   Headers: {dict(request.headers)}")
-    
-    # Capturar o body da requisição para debugging
-    body_content = None
-    try:
-        if request.method in ["POST", "PUT", "PATCH"]:
-            # Verificar se é multipart/form-data (upload de arquivo)
-            content_type = request.headers.get("content-type", "")
-            
-            if "multipart/form-data" in content_type:
-                logger.info("   Content-Type: multipart/form-data (upload de arquivo)")
-                # Para multipart, não tentar parsear como JSON
-                body_bytes = await request.body()
-                if body_bytes:
-                    body_content = body_bytes.decode('utf-8', errors='ignore')
-                    logger.info(f"   Body (multipart): {body_content[:200]}...")  # Primeiros 200 chars
-            else:
-                # Para outros tipos, tentar ler como texto/JSON
-                body_bytes = await request.body()
-                if body_bytes:
-                    body_content = body_bytes.decode('utf-8')
-                    logger.info(f"   Body (raw): {body_content[:500]}...")  # Primeiros 500 chars
-                    
-                    # Tentar parsear como JSON apenas se não for multipart
-                    try:
-                        body_json = json.loads(body_content)
-                        logger.info(f"   Body (JSON): {json.dumps(body_json, indent=2)[:500]}...")
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Erro ao parsear JSON: {e}")
-                        logger.error(f"   Body inválido: {body_content}")
-                    
-    except Exception as e:
-        logger.error(f"Erro ao ler body: {e}")
-    
-    # Processar a requisição
-    try:
-        response = await call_next(request)
-        logger.info(f"{request.method} {request.url} - Status: {response.status_code}")
-        return response
-    except Exception as e:
-        logger.error(f"Erro na requisição: {e}")
-        return JSONResponse(
-            status_code=500,
-            content={
-                "error": "Internal server error",
-                "detail": str(e),
-                "request_info": {
-                    "method": request.method,
-                    "url": str(request.url),
-                    "headers": dict(request.headers),
-                    "body_preview": body_content[:200] if body_content else None
-                }
-            }
-        )
+# Captura das requisições lentas para replay_requests.py (dentro do TimingMiddleware, para ler os estágios)
+app.add_middleware(SlowRequestMiddleware)
+
+# Tempo de cada estágio no header Server-Timing (e ?profile=1 para administradores)
+app.add_middleware(TimingMiddleware)
+
+# Spans do pipeline (OpenTelemetry/OTLP ou JSONL) quando TRACE_EXPORTER está definido
+app.add_middleware(TraceMiddleware)
+
+# Métricas por rota (contagem e latência) para o Prometheus
+app.add_middleware(MetricsMiddleware)
+
+# Log de acesso estruturado (uma linha JSON por requisição, sem ler o body)
+app.add_middleware(AccessLogMiddleware)
 
 # Configuração de CORS para permitir qualquer requisição
 app.add_middleware(
@@ -148,9 +141,31 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 @app.on_event("startup")
 async def load_models():
     """Carrega os modelos na inicialização da API"""
-    print("🔄 Carregando modelos...")
-    load_classifier()
-    print("✅ Modelos carregados com sucesso!")
+    start_access_logging()
+    start_crop_storage()
+    start_sampling_profiler_if_enabled()
+    start_tracing()
+    print("🔄 Carregando modelos..." + (" (em segundo plano)" if MODEL_LOAD_IN_BACKGROUND else ""))
+    # CLIP, YOLO e pose em paralelo, seguidos da inferência de aquecimento
+    start_model_loading()
+    if DETECTION_BACKEND == "process":
+        print(f"🔄 Iniciando pool de detecção com {DETECTION_WORKERS} processo(s)...")
+        start_detection_pool(DETECTION_WORKERS)
+    if JOB_WORKERS > 0:
+        print(f"🔄 Iniciando fila de jobs com {JOB_WORKERS} worker(s)...")
+        start_job_queue(JOB_WORKERS)
+    if not MODEL_LOAD_IN_BACKGROUND:
+        print("✅ Modelos carregados com sucesso!")
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    """Encerra os workers de jobs, os processos de detecção e a escrita de recortes ao desligar a API"""
+    stop_job_queue()
+    stop_detection_pool()
+    stop_crop_storage()
+    stop_sampling_profiler()
+    stop_tracing()
+    stop_access_logging()
 
 @app.get("/")
 async def root():
@@ -171,19 +186,43 @@ async def root():
             "clothing": "/api/v1/clothing/classify",
             "body_parts": "/api/v1/body-parts/detect",
             "analysis": "/api/v1/analysis/complete",
-            "config": "/api/v1/config/margin"
+            "video": "/api/v1/video/analyze",
+            "stream": "/api/v1/stream/ws",
+            "jobs": "/api/v1/jobs",
+            "config": "/api/v1/config/margin",
+            "metrics": "/metrics"
         }
     }
 
 @app.get("/health")
 async def health_check():
     """Verificação de saúde da API"""
+    ready = get_readiness()["ready"]
     return {
         "status": "healthy",
+        "ready": ready,
         "device": get_device_info(),
-        "features_available": True
+        "features_available": ready
     }
 
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: o processo responde (não depende dos modelos)"""
+    return get_liveness()
+
+@app.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness: modelos carregados e aquecidos
+    
+    Returns:
+        200 quando pronta, 503 enquanto carrega ou se algum modelo falhou; o corpo
+        traz o estado e os tempos de carregamento e aquecimento de cada modelo
+    """
+    readiness = get_readiness()
+    readiness["device"] = get_device_info()
+    return FastJSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
 # Handler para erros de validação de requisição
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
@@ -191,16 +230,16 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     logger.error(f"Erro de validação na requisição: {exc}")
     logger.error(f"   URL: {request.url}")
     logger.error(f"   Method: {request.method}")
-    logger.error(f"   Headers: {dict(request.headers)}")
     
-    # Tentar capturar o body da requisição
+    # Prévia limitada do body (uploads multipart não são decodificados)
     body_content = None
     try:
-        if request.method in ["POST", "PUT", "PATCH"]:
+        content_type = request.headers.get("content-type", "")
+        if request.method in ["POST", "PUT", "PATCH"] and "multipart/form-data" not in content_type:
             body_bytes = await request.body()
             if body_bytes:
-                body_content = body_bytes.decode('utf-8')
-                logger.error(f"   Body: {body_content}")
+                body_content = body_bytes[:500].decode('utf-8', errors='replace')
+                logger.error(f"   Body ({len(body_bytes)} bytes): {body_content}")
     except Exception as e:
         logger.error(f"   Erro ao ler body: {e}")
     
@@ -210,7 +249,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         logger.error(f"   Tipo: {error.get('type', 'N/A')}")
         logger.error(f"   Mensagem: {error.get('msg', 'N/A')}")
     
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=422,
         content={
             "error": "Validation Error",
@@ -232,7 +271,7 @@ async def http_exception_handler(request: Request, exc: StarletteHTTPException):
     logger.error(f"   URL: {request.url}")
     logger.error(f"   Method: {request.method}")
     
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=exc.status_code,
         content={
             "error": "HTTP Error",
@@ -251,6 +290,11 @@ app.include_router(body_parts_router)
 app.include_router(analysis_router)
 app.include_router(config_router)
 app.include_router(static_files_router)
+app.include_router(video_router)
+app.include_router(stream_router)
+app.include_router(jobs_router)
+app.include_router(metrics_router)
+app.include_router(admin_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
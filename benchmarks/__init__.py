@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks dos modelos (bench_models.py) e da camada de serviço (bench_serving.py).
+
+Rodar a partir da raiz do repositório:
+
+    python -m benchmarks.bench_models --output data/bench_models.json
+"""
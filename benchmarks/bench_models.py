@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks dos estágios dos modelos (CPU).
+
+Mede a detecção completa, o YOLO e a pose isolados, a classificação CLIP,
+a análise de cor, a análise da imagem inteira e as funções de
+compatibilidade, em imagens sintéticas determinísticas em várias resoluções
+(e, opcionalmente, em uma pasta de fixtures). O relatório JSON traz
+p50/p95, throughput e o pico de memória de cada benchmark; com --baseline,
+sai com código 1 se alguma métrica piorar além de --threshold. Uso:
+
+    python -m benchmarks.bench_models --save-baseline benchmarks/baseline_models.json
+    python -m benchmarks.bench_models --baseline benchmarks/baseline_models.json --threshold 0.15
+    python -m benchmarks.bench_models --only yolo,pose --resolutions 640x960
+"""
+import argparse
+import os
+import sys
+import time
+
+# CPU e resultados sem cache (antes de importar torch e os módulos da API)
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("RESULT_CACHE_ENABLED", "false")
+
+import numpy as np
+
+from benchmarks.common import (
+    DEFAULT_RESOLUTIONS, REPORT_FORMAT, environment_info, finish, load_fixture_images, measure,
+    parse_resolutions, synthetic_person_image
+)
+
+# Regiões da silhueta sintética (frações da altura), usadas para montar as peças classificadas
+_PART_REGIONS = {"head": (0.04, 0.20), "torso": (0.16, 0.52), "legs": (0.48, 0.90), "feet": (0.86, 0.98)}
+
+
+def _part_crops(image):
+    """Recortes das peças da silhueta sintética"""
+    width, height = image.size
+    crops = {}
+    for part_name, (top, bottom) in _PART_REGIONS.items():
+        crops[part_name] = image.crop((width // 4, int(top * height), 3 * width // 4, int(bottom * height)))
+    return crops
+
+
+def build_classified_parts(classifier, image):
+    """
+    Peças classificadas no formato das rotas de análise (entrada da compatibilidade)
+
+    Preparado uma vez, fora das medições.
+    """
+    classified = {}
+    for part_name, crop in _part_crops(image).items():
+        classifications = classifier.classify_image(crop, part_name)
+        classified[part_name] = {
+            "predictions": classifications,
+            "top_prediction": classifier.get_top_prediction(classifications),
+            "color_analysis": classifier.detect_clothing_color(crop)
+        }
+    return classified
+
+
+def build_benchmarks(images, classifier, detector):
+    """
+    Lista de (nome, função) medidos
+
+    Args:
+        images: Lista de (rótulo, imagem PIL)
+        classifier: CLIPClassifier carregado
+        detector: BodyPartsDetector
+    """
+    benchmarks = []
+    for label, image in images:
+        rgb = np.asarray(image)
+        torso = _part_crops(image)["torso"]
+        benchmarks += [
+            (f"detect_body_parts[{label}]", lambda rgb=rgb: detector.detect_body_parts(rgb)),
+            (f"yolo[{label}]", lambda rgb=rgb: detector.yolo_model(rgb, verbose=False)),
+            (f"pose[{label}]", lambda rgb=rgb: detector._process_pose(rgb)),
+            (f"classify_image[{label}]", lambda image=image: classifier.classify_image(image)),
+            (f"detect_clothing_color[{label}]", lambda torso=torso: classifier.detect_clothing_color(torso)),
+            (f"analyze_image_colors[{label}]", lambda torso=torso: classifier._analyze_image_colors(torso)),
+        ]
+
+    # Peças classificadas da imagem de resolução intermediária (a compatibilidade não depende da resolução)
+    reference = images[len(images) // 2][1]
+    classified_parts = build_classified_parts(classifier, reference)
+    selected = {**classified_parts["torso"]["top_prediction"],
+                "color": classified_parts["torso"]["color_analysis"].get("color")}
+    for label, image in images:
+        benchmarks.append((
+            f"analyze_complete_outfit_image[{label}]",
+            lambda image=image: classifier.analyze_complete_outfit_image(image, classified_parts)
+        ))
+    benchmarks += [
+        ("analyze_outfit_compatibility", lambda: classifier.analyze_outfit_compatibility(classified_parts)),
+        ("get_compatible_items", lambda: classifier.get_compatible_items(selected, top_k=5)),
+        ("get_color_compatibility", lambda: classifier.get_color_compatibility("red", top_k=5)),
+        ("get_outfit_suggestions", lambda: classifier.get_outfit_suggestions([selected], top_k=3)),
+    ]
+    return benchmarks
+
+
+def _selected(name: str, only) -> bool:
+    if not only:
+        return True
+    base = name.split("[", 1)[0]
+    return any(item == base or item in name for item in only)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks dos estágios dos modelos (CPU)")
+    parser.add_argument("--resolutions", default=DEFAULT_RESOLUTIONS,
+                        help="Resoluções das imagens sintéticas (nome=LxA separados por vírgula)")
+    parser.add_argument("--fixtures", default=None, help="Pasta com imagens adicionais")
+    parser.add_argument("--seed", type=int, default=0, help="Semente das imagens sintéticas")
+    parser.add_argument("--only", default="", help="Benchmarks a rodar (nomes ou trechos, separados por vírgula)")
+    parser.add_argument("--list", action="store_true", help="Lista os benchmarks e sai")
+    parser.add_argument("--iterations", type=int, default=20, help="Execuções medidas (mínimo)")
+    parser.add_argument("--warmup", type=int, default=3, help="Execuções descartadas")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="Tempo mínimo de medição por benchmark")
+    parser.add_argument("--max-seconds", type=float, default=60.0, help="Tempo máximo de medição por benchmark")
+    parser.add_argument("--threads", type=int, default=None, help="Threads do torch (fixe para comparar execuções)")
+    parser.add_argument("--output", default=None, help="Grava o relatório JSON")
+    parser.add_argument("--baseline", default=None, help="Relatório de referência para a comparação")
+    parser.add_argument("--save-baseline", default=None, help="Grava o relatório como nova linha de base")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Piora relativa tolerada (0.10 = 10%%)")
+    parser.add_argument("--rss-threshold", type=float, default=None, help="Piora tolerada no pico de memória")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="Diferenças de latência tratadas como ruído")
+    args = parser.parse_args()
+
+    import torch
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+
+    images = [
+        (name, synthetic_person_image(width, height, args.seed))
+        for name, width, height in parse_resolutions(args.resolutions)
+    ] + load_fixture_images(args.fixtures)
+    if not images:
+        print("❌ Nenhuma imagem (verifique --resolutions e --fixtures)")
+        return 2
+
+    print("🔄 Carregando modelos...")
+    started = time.perf_counter()
+    from utils.clip_classifier import classifier
+    from utils.body_parts_detector import detector
+    classifier.load_model()
+    detector.load_models()
+    load_seconds = time.perf_counter() - started
+
+    only = [item.strip() for item in args.only.split(",") if item.strip()]
+    benchmarks = [item for item in build_benchmarks(images, classifier, detector) if _selected(item[0], only)]
+    if args.list:
+        for name, _ in benchmarks:
+            print(name)
+        return 0
+
+    results = {}
+    for name, func in benchmarks:
+        print(f"🔄 {name}...")
+        results[name] = measure(func, args.warmup, args.iterations, args.min_seconds, args.max_seconds)
+
+    report = {
+        "format": REPORT_FORMAT,
+        "suite": "models",
+        "created": round(time.time(), 3),
+        "environment": environment_info(),
+        "config": {
+            "resolutions": args.resolutions,
+            "fixtures": args.fixtures,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "min_seconds": args.min_seconds,
+            "threads": torch.get_num_threads(),
+            "model_load_seconds": round(load_seconds, 3)
+        },
+        "results": results
+    }
+    return finish(report, args.output, args.baseline, args.save_baseline,
+                  args.threshold, args.rss_threshold, args.min_delta_ms)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark de carga da camada de serviço, com modelos falsos (benchmarks/stubs.py).
+
+Dispara requisições concorrentes contra os endpoints da API e mede, por
+endpoint, throughput, percentis de latência, taxa de erro e a mediana dos
+estágios do header Server-Timing. Os modelos são trocados por backends
+determinísticos com latência configurável, então roda offline (sem GPU,
+sem download de pesos) e mede o custo do roteamento, dos middlewares, do
+decode, da serialização e das filas, não o dos modelos. Alvos:
+
+- em processo (padrão): a API roda no mesmo event loop do gerador de carga
+- --spawn: sobe `python -m benchmarks.stubs` em um uvicorn local
+- --url: uma API já em execução (com modelos reais ou falsos)
+
+Uso:
+
+    python -m benchmarks.bench_serving --concurrency 8 --duration 20
+    python -m benchmarks.bench_serving --endpoints analysis:3,classify_raw:1 --requests 500 --spawn
+    python -m benchmarks.bench_serving --save-baseline benchmarks/baseline_serving.json
+    python -m benchmarks.bench_serving --baseline benchmarks/baseline_serving.json --threshold 0.15
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.common import (
+    REPORT_FORMAT, environment_info, finish, parse_resolutions, peak_rss_mb, percentile,
+    reset_peak_rss, synthetic_person_image
+)
+
+# Endpoints disponíveis: nome -> (método, caminho, formato do corpo)
+ENDPOINTS = {
+    "health": ("GET", "/health", None),
+    "classify": ("POST", "/api/v1/clothing/classify", "multipart"),
+    "classify_base64": ("POST", "/api/v1/clothing/classify/base64", "base64:image"),
+    "classify_raw": ("POST", "/api/v1/clothing/classify/raw", "raw"),
+    "detect": ("POST", "/api/v1/body-parts/detect", "multipart"),
+    "detect_base64": ("POST", "/api/v1/body-parts/detect/base64", "base64:image"),
+    "detect_raw": ("POST", "/api/v1/body-parts/detect/raw", "raw"),
+    "analysis": ("POST", "/api/v1/analysis/complete", "multipart"),
+    "analysis_base64": ("POST", "/api/v1/analysis/complete/base64", "base64:image_base64"),
+    "analysis_raw": ("POST", "/api/v1/analysis/complete/raw", "raw"),
+}
+
+DEFAULT_MIX = "analysis:2,analysis_raw:1,classify:2,classify_raw:1,detect:1,health:1"
+
+
+def parse_mix(value: str) -> List[Tuple[str, float]]:
+    """
+    Lê a mistura de endpoints ("analysis:3,classify:1"; sem peso vale 1)
+
+    Returns:
+        Lista de (endpoint, peso)
+    """
+    mix = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition(":")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Endpoint desconhecido: {name} (disponíveis: {', '.join(ENDPOINTS)})")
+        mix.append((name, float(weight or 1)))
+    return mix
+
+
+def encode_images(resolution: str, count: int, seed: int, quality: int = 90) -> List[bytes]:
+    """JPEGs sintéticos distintos (sementes diferentes: cada requisição não é um acerto de cache)"""
+    _, width, height = parse_resolutions(resolution)[0]
+    images = []
+    for index in range(count):
+        buffer = io.BytesIO()
+        synthetic_person_image(width, height, seed + index).save(buffer, format="JPEG", quality=quality)
+        images.append(buffer.getvalue())
+    return images
+
+
+def build_request(endpoint: str, image_bytes: bytes) -> Tuple[str, str, Dict]:
+    """Método, caminho e argumentos do httpx para um endpoint"""
+    method, path, body = ENDPOINTS[endpoint]
+    if body is None:
+        return method, path, {}
+    if body == "multipart":
+        return method, path, {"files": {"file": ("image.jpg", image_bytes, "image/jpeg")}}
+    if body == "raw":
+        return method, path, {"content": image_bytes, "headers": {"Content-Type": "image/jpeg"}}
+    field = body.split(":", 1)[1]
+    return method, path, {"json": {field: base64.b64encode(image_bytes).decode("ascii")}}
+
+
+def parse_server_timing(value: str) -> Dict[str, float]:
+    """Durações (ms) do header Server-Timing"""
+    stages = {}
+    for metric in filter(None, (item.strip() for item in value.split(","))):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            if param.startswith("dur="):
+                stages[name] = float(param[4:])
+    return stages
+
+
+# ---------------------------------------------------------------------------
+# Gerador de carga
+# ---------------------------------------------------------------------------
+
+class LoadGenerator:
+    """
+    Clientes concorrentes em um loop asyncio
+
+    Cada cliente pega a próxima requisição da sequência (endpoint sorteado
+    pela mistura com semente fixa, imagem em rodízio) até atingir o total de
+    requisições ou a duração.
+    """
+
+    def __init__(self, client, mix: List[Tuple[str, float]], images: List[bytes], concurrency: int,
+                 total_requests: Optional[int] = None, duration: Optional[float] = None,
+                 seed: int = 0, timeout: float = 60.0):
+        self.client = client
+        self.images = images
+        self.concurrency = concurrency
+        self.total_requests = total_requests
+        self.duration = duration
+        self.timeout = timeout
+        self._names = [name for name, _ in mix]
+        self._weights = [weight for _, weight in mix]
+        self._rng = random.Random(seed)
+        self._issued = 0
+        self._deadline = None
+        self.samples = []  # (endpoint, segundos, status, erro, estágios)
+
+    def _next(self) -> Optional[Tuple[str, bytes]]:
+        if self.total_requests is not None and self._issued >= self.total_requests:
+            return None
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return None
+        endpoint = self._rng.choices(self._names, self._weights)[0]
+        image_bytes = self.images[self._issued % len(self.images)]
+        self._issued += 1
+        return endpoint, image_bytes
+
+    async def _request(self, endpoint: str, image_bytes: bytes):
+        method, path, kwargs = build_request(endpoint, image_bytes)
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, timeout=self.timeout, **kwargs)
+            await response.aread()
+            elapsed = time.perf_counter() - started
+            error = None if response.status_code < 400 else f"HTTP {response.status_code}"
+            stages = parse_server_timing(response.headers.get("server-timing", ""))
+            return endpoint, elapsed, response.status_code, error, stages
+        except Exception as e:
+            return endpoint, time.perf_counter() - started, 0, type(e).__name__, {}
+
+    async def _worker(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            self.samples.append(await self._request(*item))
+
+    async def warmup(self, requests_per_endpoint: int):
+        """Requisições descartadas (primeiras alocações, imports tardios, threads dos pools)"""
+        for name in self._names:
+            for index in range(requests_per_endpoint):
+                await self._request(name, self.images[index % len(self.images)])
+
+    async def run(self) -> float:
+        """Executa a carga e retorna a duração em segundos"""
+        self.samples = []
+        self._issued = 0
+        started = time.perf_counter()
+        if self.duration:
+            self._deadline = started + self.duration
+        await asyncio.gather(*(self._worker() for _ in range(self.concurrency)))
+        return time.perf_counter() - started
+
+
+def summarize(samples: List[Tuple], wall_seconds: float) -> Dict[str, Dict]:
+    """
+    Estatísticas por endpoint (e do total em "all")
+
+    Os percentis e o throughput consideram só as respostas bem-sucedidas; as
+    falhas entram na taxa de erro.
+    """
+    groups = defaultdict(list)
+    for sample in samples:
+        groups[sample[0]].append(sample)
+        groups["all"].append(sample)
+
+    results = {}
+    for name in sorted(groups, key=lambda item: (item == "all", item)):
+        group = groups[name]
+        ok = [elapsed for _, elapsed, _, error, _ in group if error is None]
+        errors = Counter(error for _, _, _, error, _ in group if error is not None)
+        stages = defaultdict(list)
+        for _, _, _, error, timings in group:
+            if error is None:
+                for stage, duration in timings.items():
+                    stages[stage].append(duration)
+        results[name] = {
+            "requests": len(group),
+            "errors": sum(errors.values()),
+            "error_rate": round(sum(errors.values()) / len(group), 4),
+            "error_types": dict(errors),
+            "status": dict(Counter(str(status) for _, _, status, _, _ in group)),
+            "p50_ms": round(percentile(ok, 0.50) * 1000, 3),
+            "p90_ms": round(percentile(ok, 0.90) * 1000, 3),
+            "p95_ms": round(percentile(ok, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(ok, 0.99) * 1000, 3),
+            "mean_ms": round(sum(ok) / len(ok) * 1000, 3) if ok else 0.0,
+            "max_ms": round(max(ok) * 1000, 3) if ok else 0.0,
+            "throughput_per_s": round(len(ok) / wall_seconds, 3) if wall_seconds else 0.0,
+            "stages_p50_ms": {stage: round(percentile(values, 0.50), 3) for stage, values in sorted(stages.items())}
+        }
+    return results
+
+
+# ---------------------------------------------------------------------------
+# Alvos
+# ---------------------------------------------------------------------------
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def spawn_stub_server(args, env: Dict[str, str]) -> Tuple[subprocess.Popen, str]:
+    """Sobe a API com modelos falsos em um uvicorn local e espera o /health/ready"""
+    import httpx
+    port = args.port or _free_port()
+    command = [
+        sys.executable, "-m", "benchmarks.stubs", "--port", str(port),
+        "--clip-image-ms", str(args.clip_image_ms), "--clip-call-ms", str(args.clip_call_ms),
+        "--yolo-ms", str(args.yolo_ms), "--pose-ms", str(args.pose_ms)
+    ]
+    process = subprocess.Popen(command, env={**os.environ, **env})
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Servidor encerrou na inicialização (código {process.returncode})")
+        try:
+            if httpx.get(f"{url}/health/ready", timeout=1).status_code == 200:
+                return process, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Servidor não respondeu em {args.startup_timeout:.0f}s")
+
+
+async def run_load(args, mix, images, url: Optional[str]) -> Tuple[List[Tuple], float, Optional[float]]:
+    """
+    Executa aquecimento e carga contra o alvo
+
+    Returns:
+        (amostras, duração em segundos, pico de memória em MB; None fora do processo)
+    """
+    import httpx
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async def drive(client):
+        generator = LoadGenerator(client, mix, images, args.concurrency, args.requests, args.duration,
+                                  args.seed, args.timeout)
+        if args.warmup:
+            print(f"🔄 Aquecimento ({args.warmup} por endpoint)...")
+            await generator.warmup(args.warmup)
+        reset_peak_rss()
+        print(f"🔄 Carga: {args.concurrency} clientes, "
+              f"{f'{args.requests} requisições' if args.requests else f'{args.duration:.0f}s'}...")
+        wall = await generator.run()
+        return generator.samples, wall
+
+    if url:
+        async with httpx.AsyncClient(base_url=url, limits=limits) as client:
+            samples, wall = await drive(client)
+        return samples, wall, None
+
+    from benchmarks.stubs import StubLatency, install_stubs
+    install_stubs(StubLatency(args.clip_image_ms, args.clip_call_ms, args.yolo_ms, args.pose_ms))
+    from api import app
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", limits=limits) as client:
+            samples, wall = await drive(client)
+    return samples, wall, peak_rss_mb()
+
+
+def print_summary(results: Dict[str, Dict]):
+    """Taxa de erro, p99 e estágios (complementa a tabela de common.print_results)"""
+    width = max((len(name) for name in results), default=10)
+    print(f"\n{'endpoint':<{width}}  {'reqs':>6}  {'erros':>6}  {'p99 ms':>9}  estágios (p50 ms)")
+    for name, result in results.items():
+        stages = " ".join(f"{stage}={duration:g}" for stage, duration in result["stages_p50_ms"].items())
+        print(f"{name:<{width}}  {result['requests']:>6}  {result['error_rate'] * 100:>5.1f}%  "
+              f"{result['p99_ms']:>9.2f}  {stages}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de carga da camada de serviço (modelos falsos)")
+    parser.add_argument("--endpoints", default=DEFAULT_MIX,
+                        help=f"Mistura de endpoints com pesos (disponíveis: {', '.join(ENDPOINTS)})")
+    parser.add_argument("--concurrency", type=int, default=8, help="Clientes simultâneos")
+    parser.add_argument("--requests", type=int, default=None, help="Total de requisições (padrão: usa --duration)")
+    parser.add_argument("--duration", type=float, default=15.0, help="Duração da carga em segundos")
+    parser.add_argument("--warmup", type=int, default=2, help="Requisições descartadas por endpoint")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Timeout por requisição (s)")
+    parser.add_argument("--resolution", default="640x960", help="Resolução das imagens (LxA)")
+    parser.add_argument("--images", type=int, default=16, help="Imagens distintas em rodízio")
+    parser.add_argument("--seed", type=int, default=0, help="Semente das imagens e da mistura")
+    parser.add_argument("--cache", action="store_true", help="Mantém os caches de resultado e de embeddings")
+    parser.add_argument("--clip-image-ms", type=float, default=20.0, help="Latência do CLIP por imagem")
+    parser.add_argument("--clip-call-ms", type=float, default=2.0, help="Latência fixa por chamada ao CLIP")
+    parser.add_argument("--yolo-ms", type=float, default=30.0, help="Latência do YOLO por imagem")
+    parser.add_argument("--pose-ms", type=float, default=25.0, help="Latência da pose por chamada")
+    parser.add_argument("--url", default=None, help="API já em execução (não usa os modelos falsos)")
+    parser.add_argument("--spawn", action="store_true", help="Sobe a API com modelos falsos em um uvicorn local")
+    parser.add_argument("--port", type=int, default=None, help="Porta do uvicorn local (padrão: livre)")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="Espera pela inicialização (s)")
+    parser.add_argument("--output", default=None, help="Grava o relatório JSON")
+    parser.add_argument("--baseline", default=None, help="Relatório de referência para a comparação")
+    parser.add_argument("--save-baseline", default=None, help="Grava o relatório como nova linha de base")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Piora relativa tolerada (0.10 = 10%%)")
+    parser.add_argument("--rss-threshold", type=float, default=None, help="Piora tolerada no pico de memória")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Diferenças de latência tratadas como ruído")
+    parser.add_argument("--max-error-rate", type=float, default=0.0, help="Taxa de erro tolerada (0.01 = 1%%)")
+    args = parser.parse_args()
+
+    if not args.requests and not args.duration:
+        print("❌ Informe --requests ou --duration")
+        return 2
+    if args.requests:
+        args.duration = None
+    try:
+        mix = parse_mix(args.endpoints)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 2
+
+    # Antes de importar a API: os caches leem as variáveis na importação
+    env = {"JOB_WORKERS": os.getenv("JOB_WORKERS", "0")}
+    if not args.cache:
+        env.update(RESULT_CACHE_ENABLED="false", EMBEDDING_CACHE_ENABLED="false")
+    # Recortes gravados em uma pasta temporária (não polui static/)
+    crop_dir = None
+    if "CROP_STORAGE_DIR" not in os.environ:
+        crop_dir = tempfile.mkdtemp(prefix="bench-crops-")
+        env["CROP_STORAGE_DIR"] = crop_dir
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+    print(f"🔄 Gerando {args.images} imagens {args.resolution}...")
+    images = encode_images(args.resolution, args.images, args.seed)
+
+    process = None
+    url = args.url
+    if url:
+        target = "url"
+    elif args.spawn:
+        target = "uvicorn"
+        print("🔄 Subindo a API com modelos falsos...")
+        process, url = spawn_stub_server(args, env)
+    else:
+        target = "in-process"
+        os.environ.update(env)
+    try:
+        samples, wall, peak = asyncio.run(run_load(args, mix, images, url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+        if crop_dir:
+            shutil.rmtree(crop_dir, ignore_errors=True)
+
+    results = summarize(samples, wall)
+    results["all"]["peak_rss_mb"] = peak
+    print_summary(results)
+    print()
+
+    report = {
+        "format": REPORT_FORMAT,
+        "suite": "serving",
+        "created": round(time.time(), 3),
+        "environment": environment_info(),
+        "config": {
+            "target": target,
+            "url": args.url,
+            "endpoints": args.endpoints,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "duration": args.duration,
+            "wall_seconds": round(wall, 3),
+            "resolution": args.resolution,
+            "images": args.images,
+            "seed": args.seed,
+            "cache": args.cache,
+            "stub_latency_ms": None if args.url else {
+                "clip_image": args.clip_image_ms, "clip_call": args.clip_call_ms,
+                "yolo": args.yolo_ms, "pose": args.pose_ms
+            }
+        },
+        "results": results
+    }
+    exit_code = finish(report, args.output, args.baseline, args.save_baseline,
+                       args.threshold, args.rss_threshold, args.min_delta_ms)
+
+    failing = {name: result["error_rate"] for name, result in results.items()
+               if result["error_rate"] > args.max_error_rate}
+    if failing:
+        print(f"❌ Taxa de erro acima de {args.max_error_rate * 100:.1f}%: "
+              + ", ".join(f"{name}={rate * 100:.1f}%" for name, rate in failing.items()))
+        exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
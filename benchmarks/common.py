@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Utilitários compartilhados dos benchmarks: imagens determinísticas, medição,
+memória do processo, relatório JSON e comparação com uma linha de base.
+"""
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Resoluções padrão (largura x altura, retrato como as fotos de corpo inteiro)
+DEFAULT_RESOLUTIONS = "small=320x480,medium=640x960,large=1280x1920"
+
+# Métricas comparadas e o sentido de piora
+HIGHER_IS_WORSE = ("p50_ms", "p95_ms", "peak_rss_mb")
+LOWER_IS_WORSE = ("throughput_per_s",)
+
+REPORT_FORMAT = "fashion-extractor-bench/1"
+
+_IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+# ---------------------------------------------------------------------------
+# Imagens
+# ---------------------------------------------------------------------------
+
+def parse_resolutions(value: str) -> List[Tuple[str, int, int]]:
+    """
+    Lê uma lista de resoluções ("small=320x480,medium=640x960" ou "320x480,640x960")
+
+    Returns:
+        Lista de (nome, largura, altura)
+    """
+    resolutions = []
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, size = item.rpartition("=")
+        width, height = (int(number) for number in size.lower().split("x"))
+        resolutions.append((name or size, width, height))
+    return resolutions
+
+
+def synthetic_person_image(width: int, height: int, seed: int = 0) -> Image.Image:
+    """
+    Imagem determinística com uma silhueta vestida sobre um fundo com ruído
+
+    Cabeça, tronco, pernas e pés em cores sólidas com textura leve: não é uma
+    foto, mas exercita os mesmos caminhos (recortes, cores dominantes, CLIP)
+    com custo proporcional à resolução.
+
+    Args:
+        width: Largura em pixels
+        height: Altura em pixels
+        seed: Semente do ruído
+
+    Returns:
+        Imagem PIL RGB
+    """
+    rng = np.random.default_rng(seed)
+    # Fundo em gradiente vertical com ruído
+    gradient = np.linspace(200, 140, height, dtype=np.float32)[:, None, None]
+    canvas = np.broadcast_to(gradient, (height, width, 3)).copy()
+    canvas += rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+
+    center = width // 2
+    body_width = width // 4
+    parts = (
+        # (topo, base, meia-largura, cor)
+        (0.06, 0.18, body_width // 3, (224, 172, 140)),   # cabeça
+        (0.18, 0.50, body_width // 2, (180, 30, 40)),     # tronco
+        (0.50, 0.88, body_width // 2 - body_width // 10, (30, 50, 120)),  # pernas
+        (0.88, 0.96, body_width // 2, (40, 30, 25)),      # pés
+    )
+    for top, bottom, half_width, color in parts:
+        y0, y1 = int(top * height), int(bottom * height)
+        x0, x1 = max(center - half_width, 0), min(center + half_width, width)
+        texture = rng.normal(0, 8, (y1 - y0, x1 - x0, 3)).astype(np.float32)
+        canvas[y0:y1, x0:x1] = np.array(color, dtype=np.float32) + texture
+    return Image.fromarray(np.clip(canvas, 0, 255).astype(np.uint8), "RGB")
+
+
+def load_fixture_images(directory: Optional[str]) -> List[Tuple[str, Image.Image]]:
+    """
+    Imagens de uma pasta de fixtures (ordenadas por nome, para serem determinísticas)
+
+    Args:
+        directory: Pasta com as imagens (None: nenhuma)
+
+    Returns:
+        Lista de (nome, imagem RGB)
+    """
+    if not directory:
+        return []
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(_IMAGE_EXTENSIONS):
+            with Image.open(os.path.join(directory, name)) as image:
+                images.append((f"fixture:{os.path.splitext(name)[0]}", image.convert("RGB")))
+    return images
+
+
+# ---------------------------------------------------------------------------
+# Memória
+# ---------------------------------------------------------------------------
+
+def reset_peak_rss() -> bool:
+    """Zera o pico de memória do processo (VmHWM, Linux); False se não suportado"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memória residente do processo (desde o último reset_peak_rss)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss é em KiB no Linux e em bytes no macOS
+        return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    except ImportError:
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Medição
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Percentil com interpolação linear"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower, upper = math.floor(position), math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def measure(func: Callable[[], object], warmup: int = 2, iterations: int = 20,
+            min_seconds: float = 0.0, max_seconds: float = 60.0) -> Dict:
+    """
+    Mede uma função
+
+    Args:
+        func: Função sem argumentos
+        warmup: Execuções descartadas
+        iterations: Execuções medidas (mínimo)
+        min_seconds: Continua medindo até este tempo total (resultados mais estáveis em funções rápidas)
+        max_seconds: Para de medir após este tempo, mesmo sem completar as iterações
+
+    Returns:
+        {"iterations", "p50_ms", "p95_ms", "mean_ms", "min_ms", "max_ms", "throughput_per_s", "peak_rss_mb"}
+    """
+    for _ in range(warmup):
+        func()
+    reset_peak_rss()
+    samples = []
+    started = time.perf_counter()
+    while True:
+        call_started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - call_started)
+        elapsed = time.perf_counter() - started
+        if elapsed >= max_seconds:
+            break
+        if len(samples) >= iterations and elapsed >= min_seconds:
+            break
+    total = sum(samples)
+    return {
+        "iterations": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "mean_ms": round(total / len(samples) * 1000, 3),
+        "min_ms": round(min(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "throughput_per_s": round(len(samples) / total, 3) if total else 0.0,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+# ---------------------------------------------------------------------------
+# Relatório e comparação
+# ---------------------------------------------------------------------------
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def environment_info() -> Dict:
+    """Ambiente da medição (gravado no relatório para comparar execuções equivalentes)"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "revision": os.getenv("BUILD_ID") or _git_revision()
+    }
+    try:
+        import torch
+        info["torch"] = torch.__version__
+        info["torch_threads"] = torch.get_num_threads()
+    except ImportError:
+        pass
+    return info
+
+
+def write_report(path: str, report: Dict):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+
+def compare_reports(current: Dict, baseline: Dict, threshold: float = 0.10,
+                    rss_threshold: Optional[float] = None, min_delta_ms: float = 0.05) -> List[Dict]:
+    """
+    Compara dois relatórios e retorna as regressões
+
+    Args:
+        current: Relatório atual
+        baseline: Relatório de referência
+        threshold: Piora relativa tolerada (0.10 = 10%) em latência e throughput
+        rss_threshold: Piora relativa tolerada no pico de memória (padrão: threshold)
+        min_delta_ms: Diferenças absolutas de latência abaixo disto são ruído
+
+    Returns:
+        Lista de {"benchmark", "metric", "baseline", "current", "change"} acima do limite
+    """
+    rss_threshold = threshold if rss_threshold is None else rss_threshold
+    previous = baseline.get("results", {})
+    regressions = []
+    for name, result in current.get("results", {}).items():
+        old = previous.get(name)
+        if old is None:
+            continue
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            old_value, value = old.get(metric), result.get(metric)
+            if not old_value or value is None:
+                continue
+            if metric in HIGHER_IS_WORSE:
+                change = (value - old_value) / old_value
+                if metric.endswith("_ms") and value - old_value < min_delta_ms:
+                    continue
+            else:
+                change = (old_value - value) / old_value
+            limit = rss_threshold if metric == "peak_rss_mb" else threshold
+            if change > limit:
+                regressions.append({
+                    "benchmark": name,
+                    "metric": metric,
+                    "baseline": old_value,
+                    "current": value,
+                    "change": round(change, 4)
+                })
+    return regressions
+
+
+def print_results(results: Dict[str, Dict], baseline: Optional[Dict] = None):
+    """Tabela dos resultados (com a variação do p50 em relação à linha de base)"""
+    previous = (baseline or {}).get("results", {})
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'p50 ms':>10}  {'p95 ms':>10}  {'ops/s':>9}  {'RSS MB':>8}  {'Δp50':>7}")
+    for name, result in results.items():
+        delta = ""
+        old = previous.get(name)
+        if old and old.get("p50_ms"):
+            delta = f"{(result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100:+.1f}%"
+        rss = result.get("peak_rss_mb")
+        print(f"{name:<{width}}  {result['p50_ms']:>10.2f}  {result['p95_ms']:>10.2f}  "
+              f"{result['throughput_per_s']:>9.1f}  {rss if rss is not None else '-':>8}  {delta:>7}")
+
+
+def finish(report: Dict, output: Optional[str], baseline_path: Optional[str], save_baseline: Optional[str],
+           threshold: float, rss_threshold: Optional[float], min_delta_ms: float) -> int:
+    """
+    Grava o relatório, compara com a linha de base e define o código de saída
+
+    Returns:
+        0 sem regressões, 1 com regressões acima do limite
+    """
+    baseline = None
+    if baseline_path:
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(report["results"], baseline)
+    exit_code = 0
+    if baseline is not None:
+        regressions = compare_reports(report, baseline, threshold, rss_threshold, min_delta_ms)
+        report["comparison"] = {
+            "baseline": baseline_path,
+            "baseline_revision": baseline.get("environment", {}).get("revision"),
+            "threshold": threshold,
+            "rss_threshold": rss_threshold if rss_threshold is not None else threshold,
+            "regressions": regressions
+        }
+        if baseline.get("environment", {}).get("machine") != report["environment"]["machine"]:
+            print("⚠️ Linha de base medida em outra arquitetura; a comparação pode não ser significativa")
+        if regressions:
+            print(f"\n❌ {len(regressions)} regressão(ões) acima do limite:")
+            for item in regressions:
+                print(f"  {item['benchmark']} {item['metric']}: {item['baseline']} -> {item['current']} "
+                      f"({item['change'] * 100:+.1f}%)")
+            exit_code = 1
+        else:
+            print(f"\n✅ Sem regressões acima de {threshold * 100:.0f}% em relação a {baseline_path}")
+    if output:
+        write_report(output, report)
+        print(f"✅ Relatório gravado em {output}")
+    if save_baseline:
+        write_report(save_baseline, report)
+        print(f"✅ Linha de base gravada em {save_baseline}")
+    return exit_code
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Backends falsos (determinísticos) do CLIP, do YOLO e da pose, com latência configurável.
+
+Servem para medir a camada de serviço (roteamento, middlewares, decode,
+base64, serialização JSON, gravação dos recortes) separada do custo dos
+modelos, sem GPU, sem download de pesos e sem rede. Todo o código da API
+roda de verdade; só a inferência é trocada:
+
+- StubCLIPModel: mesma interface do modelo do pacote clip (encode_image,
+  encode_text, forward); features derivadas do conteúdo da imagem por uma
+  projeção fixa, então a mesma imagem sempre gera o mesmo resultado
+- StubYOLO: uma pessoa por imagem, na região central
+- StubPose: landmarks de uma pessoa em pé, sempre os mesmos
+
+A latência simulada é um sleep (a inferência real libera o GIL). Uso em
+processo (antes de importar api):
+
+    from benchmarks.stubs import StubLatency, install_stubs
+    install_stubs(StubLatency(clip_image_ms=15, yolo_ms=25, pose_ms=20))
+    import api
+
+ou como servidor, para testes de carga com um uvicorn local:
+
+    python -m benchmarks.stubs --port 8001 --clip-image-ms 15 --yolo-ms 25 --pose-ms 20
+"""
+import argparse
+import os
+import time
+import types
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+
+@dataclass
+class StubLatency:
+    """Latências simuladas em milissegundos"""
+
+    clip_image_ms: float = 0.0   # por imagem de cada lote
+    clip_call_ms: float = 0.0    # fixo por chamada ao modelo (encode_image/encode_text)
+    yolo_ms: float = 0.0         # por imagem
+    pose_ms: float = 0.0         # por chamada
+
+    @classmethod
+    def from_env(cls) -> "StubLatency":
+        return cls(
+            clip_image_ms=float(os.getenv("STUB_CLIP_IMAGE_MS", "0")),
+            clip_call_ms=float(os.getenv("STUB_CLIP_CALL_MS", "0")),
+            yolo_ms=float(os.getenv("STUB_YOLO_MS", "0")),
+            pose_ms=float(os.getenv("STUB_POSE_MS", "0"))
+        )
+
+    def to_env(self):
+        os.environ["STUB_CLIP_IMAGE_MS"] = str(self.clip_image_ms)
+        os.environ["STUB_CLIP_CALL_MS"] = str(self.clip_call_ms)
+        os.environ["STUB_YOLO_MS"] = str(self.yolo_ms)
+        os.environ["STUB_POSE_MS"] = str(self.pose_ms)
+
+
+def _sleep_ms(milliseconds: float):
+    if milliseconds > 0:
+        time.sleep(milliseconds / 1000)
+
+
+# ---------------------------------------------------------------------------
+# CLIP
+# ---------------------------------------------------------------------------
+
+STUB_EMBEDDING_DIM = 512
+_TOKEN_BUCKETS = 4096
+
+
+def stub_preprocess(image):
+    """Equivalente ao preprocess do CLIP (224x224, normalizado) sem torchvision"""
+    import torch
+    from PIL import Image
+    array = np.asarray(image.convert("RGB").resize((224, 224), Image.BICUBIC), dtype=np.float32) / 255.0
+    array = (array - 0.45) / 0.27
+    return torch.from_numpy(array).permute(2, 0, 1).contiguous()
+
+
+def _build_stub_clip_model(latency: StubLatency):
+    import torch
+
+    class StubCLIPModel(torch.nn.Module):
+        """Modelo com a interface do CLIP e pesos fixos (semente 0)"""
+
+        def __init__(self):
+            super().__init__()
+            generator = torch.Generator().manual_seed(0)
+            self.image_projection = torch.nn.Parameter(
+                torch.randn(3 * 8 * 8, STUB_EMBEDDING_DIM, generator=generator), requires_grad=False
+            )
+            self.token_embedding = torch.nn.Parameter(
+                torch.randn(_TOKEN_BUCKETS, STUB_EMBEDDING_DIM, generator=generator), requires_grad=False
+            )
+            self.logit_scale = torch.nn.Parameter(torch.tensor(np.log(100.0), dtype=torch.float32), requires_grad=False)
+
+        def encode_image(self, images):
+            _sleep_ms(latency.clip_call_ms + latency.clip_image_ms * images.shape[0])
+            pooled = torch.nn.functional.adaptive_avg_pool2d(images.float(), 8).flatten(1)
+            return pooled @ self.image_projection
+
+        def encode_text(self, tokens):
+            _sleep_ms(latency.clip_call_ms)
+            return self.token_embedding[tokens.long() % _TOKEN_BUCKETS].mean(dim=1)
+
+        def forward(self, images, tokens):
+            image_features = self.encode_image(images)
+            text_features = self.encode_text(tokens)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            logits = self.logit_scale.exp() * image_features @ text_features.t()
+            return logits, logits.t()
+
+    return StubCLIPModel().eval()
+
+
+def load_stub_clip(classifier, latency: StubLatency):
+    """
+    Carrega o modelo falso em um CLIPClassifier (no lugar de clip.load)
+
+    Depois disso, classifier.load_model() não faz nada (o modelo já está carregado).
+
+    Args:
+        classifier: Instância de CLIPClassifier
+        latency: Latências simuladas
+    """
+    classifier.device = "cpu"
+    classifier.model = _build_stub_clip_model(latency)
+    classifier.preprocess = stub_preprocess
+    classifier._prompt_features_cache = {}
+    classifier._compute_text_embeddings()
+    classifier._compute_color_embeddings()
+
+
+def stub_clip_classifier(latency: StubLatency):
+    """CLIPClassifier independente da instância global, com o modelo falso"""
+    from utils.clip_classifier import CLIPClassifier
+    classifier = CLIPClassifier()
+    load_stub_clip(classifier, latency)
+    return classifier
+
+
+# ---------------------------------------------------------------------------
+# YOLO e pose
+# ---------------------------------------------------------------------------
+
+class _StubBox:
+    __slots__ = ("xyxy", "cls", "conf")
+
+    def __init__(self, xyxy: List[float]):
+        self.xyxy = np.array([xyxy], dtype=np.float32)
+        self.cls = np.array([0])
+        self.conf = np.array([0.9], dtype=np.float32)
+
+
+class StubYOLO:
+    """Substituto de ultralytics.YOLO: uma pessoa na região central de cada imagem"""
+
+    latency = StubLatency()
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _result(self, image):
+        height, width = image.shape[:2]
+        box = [width * 0.25, height * 0.04, width * 0.75, height * 0.98]
+        return types.SimpleNamespace(boxes=[_StubBox(box)], orig_shape=(height, width))
+
+    def __call__(self, images, **kwargs):
+        batch = images if isinstance(images, list) else [images]
+        _sleep_ms(self.latency.yolo_ms * len(batch))
+        return [self._result(image) for image in batch]
+
+
+# Landmarks normalizados (x, y) de uma pessoa em pé, na ordem do MediaPipe Pose (33 pontos)
+_STANDING_POSE = (
+    [(0.50, 0.10)] + [(0.48 + 0.01 * (i % 4), 0.08 + 0.005 * i) for i in range(10)] +
+    [(0.60, 0.22), (0.40, 0.22), (0.64, 0.36), (0.36, 0.36), (0.66, 0.48), (0.34, 0.48),
+     (0.67, 0.50), (0.33, 0.50), (0.67, 0.51), (0.33, 0.51), (0.66, 0.50), (0.34, 0.50),
+     (0.56, 0.52), (0.44, 0.52), (0.56, 0.70), (0.44, 0.70), (0.56, 0.88), (0.44, 0.88),
+     (0.56, 0.91), (0.44, 0.91), (0.58, 0.93), (0.42, 0.93)]
+)
+
+
+class StubPose:
+    """Substituto do MediaPipe Pose: sempre a mesma pessoa em pé"""
+
+    def __init__(self, latency: StubLatency):
+        self.latency = latency
+        landmarks = [types.SimpleNamespace(x=x, y=y, z=0.0, visibility=0.99) for x, y in _STANDING_POSE]
+        self._result = types.SimpleNamespace(pose_landmarks=types.SimpleNamespace(landmark=landmarks))
+
+    def process(self, image):
+        _sleep_ms(self.latency.pose_ms)
+        return self._result
+
+    def close(self):
+        pass
+
+
+# ---------------------------------------------------------------------------
+# Instalação
+# ---------------------------------------------------------------------------
+
+def install_stubs(latency: StubLatency):
+    """
+    Troca os modelos das instâncias globais da API pelos falsos
+
+    Deve ser chamada antes de importar api (a detecção roda no processo da
+    API: o pool de processos carregaria os modelos reais).
+
+    Args:
+        latency: Latências simuladas
+    """
+    os.environ["DETECTION_BACKEND"] = "local"
+    latency.to_env()
+    StubYOLO.latency = latency
+
+    # O detector global é preguiçoso: com os modelos já definidos, mediapipe e ultralytics
+    # não são importados e a inicialização da API só roda o aquecimento nos falsos
+    from utils.body_parts_detector import detector
+    from utils.clip_classifier import classifier
+    detector.yolo_model = StubYOLO()
+    detector.pose = StubPose(latency)
+    load_stub_clip(classifier, latency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API com modelos falsos (testes de carga da camada de serviço)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--clip-image-ms", type=float, default=0.0)
+    parser.add_argument("--clip-call-ms", type=float, default=0.0)
+    parser.add_argument("--yolo-ms", type=float, default=0.0)
+    parser.add_argument("--pose-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    install_stubs(StubLatency(args.clip_image_ms, args.clip_call_ms, args.yolo_ms, args.pose_ms))
+
+    import uvicorn
+    import api
+    print(f"✅ API com modelos falsos em http://{args.host}:{args.port}")
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor chave-valor local compatível com o NetworkBackend (utils/cache.py).
+
+Implementação de referência do protocolo binário do cache compartilhado, para
+testes e ambientes sem um serviço dedicado. Guarda as entradas em um LRU em
+memória. Uso:
+
+    python cache_server.py --port 6380 --max-mb 512
+
+e nas réplicas da API:
+
+    CACHE_BACKEND=network CACHE_SERVER_ADDRESS=host:6380
+"""
+import argparse
+import asyncio
+import json
+import struct
+
+from utils.cache import (
+    MemoryLRUBackend,
+    encode_response,
+    OP_GET, OP_MGET, OP_SET, OP_CLEAR, OP_STATS,
+    STATUS_OK, STATUS_MISSING, STATUS_ERROR
+)
+
+_HEADER = struct.Struct("!cI")
+_SET_HEADER = struct.Struct("!dI")
+_SIZE = struct.Struct("!I")
+
+
+async def handle_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, store: MemoryLRUBackend):
+    """Atende as requisições de uma conexão até ela ser encerrada"""
+    try:
+        while True:
+            try:
+                op, key_size = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+            except asyncio.IncompleteReadError:
+                break
+            if op == OP_MGET:
+                # key_size é o número de chaves; uma resposta por chave no conteúdo
+                parts = []
+                for _ in range(key_size):
+                    size, = _SIZE.unpack(await reader.readexactly(_SIZE.size))
+                    value = store.get((await reader.readexactly(size)).decode("utf-8"))
+                    parts.append(encode_response(STATUS_OK, value) if value is not None else encode_response(STATUS_MISSING))
+                writer.write(encode_response(STATUS_OK, b"".join(parts)))
+                await writer.drain()
+                continue
+            key = (await reader.readexactly(key_size)).decode("utf-8")
+            if op == OP_GET:
+                value = store.get(key)
+                response = encode_response(STATUS_OK, value) if value is not None else encode_response(STATUS_MISSING)
+            elif op == OP_SET:
+                ttl, value_size = _SET_HEADER.unpack(await reader.readexactly(_SET_HEADER.size))
+                store.set(key, await reader.readexactly(value_size), ttl)
+                response = encode_response(STATUS_OK)
+            elif op == OP_CLEAR:
+                store.clear()
+                response = encode_response(STATUS_OK)
+            elif op == OP_STATS:
+                response = encode_response(STATUS_OK, json.dumps(store.stats()).encode("utf-8"))
+            else:
+                writer.write(encode_response(STATUS_ERROR, f"Operação desconhecida: {op!r}".encode("utf-8")))
+                break
+            writer.write(response)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(host: str, port: int, max_mb: float, max_entries: int):
+    """Inicia o servidor"""
+    store = MemoryLRUBackend(max_entries=max_entries, max_bytes=int(max_mb * 1024 * 1024))
+    server = await asyncio.start_server(lambda r, w: handle_client(r, w, store), host, port)
+    print(f"✅ Servidor de cache em {host}:{port} (limite de {max_mb} MB, {max_entries} entradas)")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de cache compartilhado (stand-in local)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--max-mb", type=float, default=512)
+    parser.add_argument("--max-entries", type=int, default=1_000_000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_mb, args.max_entries))
+    except KeyboardInterrupt:
+        print("🛑 Servidor de cache encerrado")
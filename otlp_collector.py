@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Coletor OTLP/HTTP local (stand-in do OpenTelemetry Collector, Jaeger ou Tempo).
+
+Recebe os spans exportados com TRACE_EXPORTER=otlp (POST /v1/traces, corpo
+OTLP/JSON), valida a estrutura e grava um span por linha em --output, no
+mesmo formato do exportador jsonl. Os spans recebidos também podem ser
+consultados em GET /v1/traces (?trace_id=...). Uso:
+
+    python otlp_collector.py --port 4318 --output data/collector_spans.jsonl
+
+e na API:
+
+    TRACE_EXPORTER=otlp OTEL_EXPORTER_OTLP_ENDPOINT=http://localhost:4318
+"""
+import argparse
+import json
+import os
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+MAX_SPANS_IN_MEMORY = 10000
+
+_KINDS = {0: "unspecified", 1: "internal", 2: "server", 3: "client", 4: "producer", 5: "consumer"}
+_STATUS = {0: "unset", 1: "ok", 2: "error"}
+
+
+def _any_value(value: Dict):
+    """Converte um AnyValue do OTLP/JSON em valor Python"""
+    if "stringValue" in value:
+        return value["stringValue"]
+    if "boolValue" in value:
+        return value["boolValue"]
+    if "intValue" in value:
+        return int(value["intValue"])
+    if "doubleValue" in value:
+        return float(value["doubleValue"])
+    if "arrayValue" in value:
+        return [_any_value(item) for item in value["arrayValue"].get("values", [])]
+    return None
+
+
+def _attributes(items: List[Dict]) -> Dict:
+    return {item["key"]: _any_value(item.get("value", {})) for item in items}
+
+
+def flatten_request(payload: Dict) -> List[Dict]:
+    """
+    Spans de um ExportTraceServiceRequest (OTLP/JSON) em dicionários planos
+
+    Args:
+        payload: Corpo JSON recebido
+
+    Returns:
+        Lista de spans (formato do exportador jsonl)
+
+    Raises:
+        ValueError: Estrutura inválida
+    """
+    spans = []
+    for resource_spans in payload.get("resourceSpans", []):
+        resource = _attributes(resource_spans.get("resource", {}).get("attributes", []))
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for span in scope_spans.get("spans", []):
+                trace_id, span_id = span.get("traceId", ""), span.get("spanId", "")
+                if len(trace_id) != 32 or len(span_id) != 16:
+                    raise ValueError(f"traceId/spanId inválido: {trace_id!r}/{span_id!r}")
+                start, end = int(span["startTimeUnixNano"]), int(span["endTimeUnixNano"])
+                status = span.get("status", {})
+                spans.append({
+                    "trace_id": trace_id,
+                    "span_id": span_id,
+                    "parent_span_id": span.get("parentSpanId") or None,
+                    "name": span["name"],
+                    "kind": _KINDS.get(span.get("kind", 0), "unspecified"),
+                    "start_time_unix_nano": start,
+                    "end_time_unix_nano": end,
+                    "duration_ms": round((end - start) / 1e6, 3),
+                    "status": _STATUS.get(status.get("code", 0), "unset"),
+                    "status_message": status.get("message"),
+                    "attributes": _attributes(span.get("attributes", [])),
+                    "service": resource.get("service.name")
+                })
+    return spans
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    """Atende POST /v1/traces (OTLP/JSON) e GET /v1/traces"""
+
+    output = os.path.join("data", "collector_spans.jsonl")
+    spans: "deque[Dict]" = deque(maxlen=MAX_SPANS_IN_MEMORY)
+    lock = threading.Lock()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data: Dict):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", "0"))
+        body = self.rfile.read(length)
+        if parsed.path != "/v1/traces":
+            self._send_json(404, {"message": "Use POST /v1/traces"})
+            return
+        if not self.headers.get("Content-Type", "").startswith("application/json"):
+            # O stand-in só entende OTLP/JSON (sem protobuf)
+            self._send_json(415, {"message": "Apenas application/json (OTLP/JSON)"})
+            return
+        try:
+            spans = flatten_request(json.loads(body))
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {"message": f"Corpo OTLP inválido: {e}"})
+            return
+        with self.lock:
+            self.spans.extend(spans)
+            if self.output:
+                with open(self.output, "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(span) + "\n" for span in spans))
+        self._send_json(200, {"partialSuccess": {}})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path != "/v1/traces":
+            self._send_json(200, {"status": "ok", "spans_received": len(self.spans)})
+            return
+        trace_id = parse_qs(parsed.query).get("trace_id", [None])[0]
+        with self.lock:
+            spans = [span for span in self.spans if trace_id is None or span["trace_id"] == trace_id]
+        self._send_json(200, {"spans": spans})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coletor OTLP/HTTP local (stand-in para testes do tracing)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=4318)
+    parser.add_argument("--output", default=os.path.join("data", "collector_spans.jsonl"),
+                        help="Arquivo JSONL dos spans recebidos (vazio para manter só em memória)")
+    args = parser.parse_args()
+    CollectorHandler.output = args.output
+    if args.output and os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    server = ThreadingHTTPServer((args.host, args.port), CollectorHandler)
+    print(f"✅ Coletor OTLP local em {args.host}:{args.port} (spans em {args.output or 'memória'})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Coletor OTLP local encerrado")
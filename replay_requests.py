@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reproduz requisições capturadas (utils/slow_requests.py) e compara os tempos entre builds.
+
+As capturas (data/slow_requests/captures.jsonl, formato
+"fashion-extractor-replay/1") são reenviadas ao pipeline em processo (a API
+é carregada com TestClient, com os caches de resultado e de embeddings
+desligados) ou a um servidor em execução (--target http://host:8000). Cada
+captura roda --repeat vezes; o resultado registra a mediana, o mínimo e os
+estágios do header Server-Timing, e pode ser comparado a um resultado
+anterior (--baseline). Uso:
+
+    # build atual, em processo
+    python replay_requests.py --output data/replay_v1.json
+    # outro build (ou servidor), comparando com o anterior
+    python replay_requests.py --target http://localhost:8000 --baseline data/replay_v1.json
+
+Com --target, desligue o cache de resultados no servidor
+(RESULT_CACHE_ENABLED=false) para medir o pipeline; respostas X-Cache: HIT
+são sinalizadas no relatório.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+REPLAY_FORMAT = "fashion-extractor-replay/1"
+REPLAY_HEADER = "x-replay-id"
+DEFAULT_CAPTURES = os.path.join("data", "slow_requests", "captures.jsonl")
+
+
+def load_captures(path: str, ids: Optional[List[str]] = None, limit: Optional[int] = None) -> List[Dict]:
+    """
+    Lê um arquivo de replay
+
+    Args:
+        path: Arquivo JSONL (uma captura por linha)
+        ids: Mantém apenas estas capturas
+        limit: Mantém as N capturas mais recentes
+
+    Returns:
+        Capturas com o corpo carregado em "_body"
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    captures = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("format") != REPLAY_FORMAT:
+                print(f"⚠️ Linha {number}: formato {record.get('format')!r} ignorado (esperado {REPLAY_FORMAT})")
+                continue
+            if ids and record["id"] not in ids:
+                continue
+            body = record["request"].get("body")
+            if body and body.get("truncated"):
+                print(f"⚠️ {record['id']}: corpo não gravado (acima do limite), ignorada")
+                continue
+            record["_body"] = b""
+            if body and body.get("path"):
+                with open(os.path.join(base_dir, body["path"]), "rb") as body_file:
+                    record["_body"] = body_file.read()
+            captures.append(record)
+    return captures[-limit:] if limit else captures
+
+
+def parse_server_timing(value: str) -> Dict[str, float]:
+    """Durações (ms) do header Server-Timing"""
+    stages = {}
+    for metric in filter(None, (item.strip() for item in value.split(","))):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            if param.startswith("dur="):
+                stages[name] = float(param[4:])
+    return stages
+
+
+class InProcessTarget:
+    """Envia as requisições à API carregada neste processo"""
+
+    name = "in-process"
+
+    def __init__(self, keep_cache: bool = False):
+        if not keep_cache:
+            # Antes de importar a API: os caches leem as variáveis na importação
+            os.environ["RESULT_CACHE_ENABLED"] = "false"
+            os.environ["EMBEDDING_CACHE_ENABLED"] = "false"
+        os.environ["SLOW_REQUEST_CAPTURE"] = "false"
+        from fastapi.testclient import TestClient
+        import api
+        self._client = TestClient(api.app)
+        # Executa o startup (carregamento dos modelos) antes das medições
+        self._client.__enter__()
+        from utils.slow_requests import model_info
+        self.models = model_info()
+
+    def send(self, record: Dict):
+        request = record["request"]
+        url = request["path"] + (f"?{request['query']}" if request.get("query") else "")
+        response = self._client.request(
+            request["method"], url, content=record["_body"] or None,
+            headers={**request.get("headers", {}), REPLAY_HEADER: record["id"]}
+        )
+        return response.status_code, response.headers, len(response.content)
+
+    def close(self):
+        self._client.__exit__(None, None, None)
+
+
+class HttpTarget:
+    """Envia as requisições a um servidor em execução"""
+
+    def __init__(self, base_url: str, timeout: float = 300):
+        self.name = base_url.rstrip("/")
+        self.timeout = timeout
+        self.models = None
+
+    def send(self, record: Dict):
+        request = record["request"]
+        url = self.name + request["path"] + (f"?{request['query']}" if request.get("query") else "")
+        http_request = urllib.request.Request(
+            url, data=record["_body"] or None, method=request["method"],
+            headers={**request.get("headers", {}), REPLAY_HEADER: record["id"]}
+        )
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                return response.status, response.headers, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, len(e.read())
+
+    def close(self):
+        pass
+
+
+def replay(target, captures: List[Dict], repeat: int, warmup: int) -> List[Dict]:
+    """
+    Reproduz as capturas
+
+    Args:
+        target: InProcessTarget ou HttpTarget
+        captures: Capturas de load_captures
+        repeat: Execuções medidas por captura
+        warmup: Execuções descartadas antes das medições
+
+    Returns:
+        Resultado por captura
+    """
+    results = []
+    for record in captures:
+        runs, stage_runs, statuses, cache = [], [], set(), None
+        for attempt in range(warmup + repeat):
+            started = time.perf_counter()
+            status, headers, _ = target.send(record)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            if attempt < warmup:
+                continue
+            runs.append(elapsed_ms)
+            statuses.add(status)
+            cache = headers.get("x-cache") or cache
+            stage_runs.append(parse_server_timing(headers.get("server-timing", "")))
+        stages = {
+            stage: round(statistics.median(run.get(stage, 0.0) for run in stage_runs), 2)
+            for stage in sorted({stage for run in stage_runs for stage in run})
+        }
+        result = {
+            "id": record["id"],
+            "method": record["request"]["method"],
+            "path": record["request"]["path"],
+            "query": record["request"].get("query", ""),
+            "captured_ms": record["response"]["duration_ms"],
+            "expected_status": record["response"]["status"],
+            "statuses": sorted(statuses),
+            "cache": cache,
+            "runs_ms": [round(run, 2) for run in runs],
+            "median_ms": round(statistics.median(runs), 2),
+            "min_ms": round(min(runs), 2),
+            "stages_ms": stages
+        }
+        results.append(result)
+        flags = []
+        if statuses != {result["expected_status"]}:
+            flags.append(f"status {result['statuses']} (capturado {result['expected_status']})")
+        if cache == "HIT":
+            flags.append("X-Cache: HIT")
+        print(f"  {record['id']} {result['method']} {result['path']}: mediana {result['median_ms']:.1f} ms "
+              f"(capturado {result['captured_ms']:.1f} ms){' ⚠️ ' + ', '.join(flags) if flags else ''}")
+    return results
+
+
+def compare(results: List[Dict], baseline: Dict) -> Dict:
+    """
+    Compara com um resultado anterior
+
+    Args:
+        results: Resultado atual (replay)
+        baseline: Conteúdo de um --output anterior
+
+    Returns:
+        Razões atual/anterior por captura e por estágio e a média geométrica
+    """
+    previous = {result["id"]: result for result in baseline.get("results", [])}
+    rows, ratios = [], []
+    for result in results:
+        old = previous.get(result["id"])
+        if old is None or not old["median_ms"]:
+            continue
+        ratio = result["median_ms"] / old["median_ms"]
+        ratios.append(ratio)
+        stage_ratios = {
+            stage: round(value / old["stages_ms"][stage], 3)
+            for stage, value in result["stages_ms"].items()
+            if old["stages_ms"].get(stage)
+        }
+        rows.append({"id": result["id"], "path": result["path"], "baseline_ms": old["median_ms"],
+                     "current_ms": result["median_ms"], "ratio": round(ratio, 3), "stages": stage_ratios})
+    geomean = statistics.geometric_mean(ratios) if ratios else None
+    return {"baseline_label": baseline.get("label"), "compared": len(rows),
+            "geomean_ratio": round(geomean, 3) if geomean else None, "rows": rows}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reproduz requisições capturadas e compara os tempos entre builds")
+    parser.add_argument("--captures", default=DEFAULT_CAPTURES, help="Arquivo de replay (JSONL)")
+    parser.add_argument("--target", default="in-process", help="in-process ou URL de um servidor (http://localhost:8000)")
+    parser.add_argument("--ids", default="", help="IDs separados por vírgula")
+    parser.add_argument("--limit", type=int, default=None, help="Apenas as N capturas mais recentes")
+    parser.add_argument("--repeat", type=int, default=3, help="Execuções medidas por captura")
+    parser.add_argument("--warmup", type=int, default=1, help="Execuções descartadas por captura")
+    parser.add_argument("--keep-cache", action="store_true", help="Em processo, mantém os caches ligados")
+    parser.add_argument("--label", default=os.getenv("BUILD_ID") or _git_revision(), help="Nome do build no resultado")
+    parser.add_argument("--output", default=None, help="Grava o resultado em JSON")
+    parser.add_argument("--baseline", default=None, help="Resultado anterior para comparação")
+    parser.add_argument("--max-ratio", type=float, default=None,
+                        help="Sai com código 1 se a média geométrica atual/anterior passar deste valor")
+    args = parser.parse_args()
+
+    captures = load_captures(args.captures, [item for item in args.ids.split(",") if item], args.limit)
+    if not captures:
+        print(f"❌ Nenhuma captura em {args.captures}")
+        sys.exit(1)
+
+    target = InProcessTarget(args.keep_cache) if args.target == "in-process" else HttpTarget(args.target)
+    if target.models is not None:
+        versions = {record["models"]["model_version"] for record in captures if record.get("models")}
+        if versions - {target.models["model_version"]}:
+            print(f"⚠️ Capturas feitas com outra versão dos modelos ({', '.join(sorted(versions))}); "
+                  f"atual: {target.models['model_version']}")
+    print(f"🔄 Reproduzindo {len(captures)} captura(s) em {target.name} ({args.warmup} aquecimento + {args.repeat} medições)")
+    try:
+        results = replay(target, captures, max(args.repeat, 1), max(args.warmup, 0))
+    finally:
+        target.close()
+
+    report = {
+        "format": REPLAY_FORMAT,
+        "label": args.label,
+        "target": target.name,
+        "created": round(time.time(), 3),
+        "models": target.models,
+        "repeat": args.repeat,
+        "results": results
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            comparison = compare(results, json.load(f))
+        report["comparison"] = comparison
+        print(f"\n📊 Comparação com {comparison['baseline_label'] or args.baseline} ({comparison['compared']} capturas)")
+        for row in comparison["rows"]:
+            slowest = sorted(row["stages"].items(), key=lambda item: item[1], reverse=True)[:3]
+            stages = ", ".join(f"{stage} x{ratio:.2f}" for stage, ratio in slowest)
+            print(f"  {row['id']} {row['path']}: {row['baseline_ms']:.1f} -> {row['current_ms']:.1f} ms "
+                  f"(x{row['ratio']:.2f}){'; ' + stages if stages else ''}")
+        if comparison["geomean_ratio"] is not None:
+            print(f"  Média geométrica: x{comparison['geomean_ratio']:.3f}")
+            if args.max_ratio is not None and comparison["geomean_ratio"] > args.max_ratio:
+                print(f"❌ Regressão acima de x{args.max_ratio}")
+                exit_code = 1
+    if args.output:
+        if os.path.dirname(args.output):
+            os.makedirs(os.path.dirname(args.output), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Resultado gravado em {args.output}")
+    sys.exit(exit_code)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional
+
+from utils.admin_auth import require_admin
+from utils.request_timing import list_profiles, profile_path, profile_text
+from utils.sampling_profiler import sampling_profiler, PROFILER_HZ, PROFILER_MAX_RUN_SECONDS
+from utils.tracing import get_tracing_stats
+from utils.slow_requests import slow_request_store, get_slow_request_stats
+
+router = APIRouter(prefix="/api/v1/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+_SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls", "time", "name", "filename")
+
+@router.get("/profiles")
+async def get_profiles():
+    """
+    Lista os perfis gravados por requisições com ?profile=1
+
+    Returns:
+        JSON com os perfis (mais recentes primeiro)
+    """
+    return {"profiles": await run_in_threadpool(list_profiles)}
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    format: str = Query("prof", pattern="^(prof|text)$", description="prof (pstats/snakeviz) ou text"),
+    sort: str = Query("cumulative", description="Ordenação do relatório em texto"),
+    limit: int = Query(50, ge=1, le=1000, description="Funções listadas no relatório em texto")
+):
+    """
+    Baixa um perfil
+
+    Args:
+        profile_id: ID retornado no header X-Profile-Id
+        format: "prof" para o arquivo pstats (python -m pstats, snakeviz) ou "text"
+        sort: Ordenação do relatório em texto
+        limit: Número de funções do relatório em texto
+
+    Returns:
+        Arquivo .prof ou relatório em texto
+    """
+    if format == "text":
+        if sort not in _SORT_KEYS:
+            raise HTTPException(status_code=400, detail=f"Ordenação inválida. Use: {', '.join(_SORT_KEYS)}")
+        text = await run_in_threadpool(profile_text, profile_id, sort, limit)
+        if text is None:
+            raise HTTPException(status_code=404, detail="Perfil não encontrado")
+        return PlainTextResponse(text)
+
+    path = profile_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+@router.get("/profiler")
+async def get_profiler_status():
+    """
+    Estado do profiler de amostragem contínuo
+
+    Returns:
+        JSON com taxa, amostras, janela retida e overhead medido
+    """
+    return sampling_profiler.status()
+
+@router.post("/profiler/start")
+async def start_profiler(
+    hz: float = Query(PROFILER_HZ, gt=0, le=1000, description="Amostras por segundo"),
+    duration: float = Query(PROFILER_MAX_RUN_SECONDS, gt=0, description="Parada automática (segundos)")
+):
+    """
+    Inicia (ou reinicia) o profiler de amostragem
+
+    Args:
+        hz: Amostras por segundo
+        duration: Parada automática em segundos (limitada a PROFILER_MAX_RUN_SECONDS)
+
+    Returns:
+        JSON com o estado do profiler
+    """
+    await run_in_threadpool(sampling_profiler.start, hz, duration)
+    return sampling_profiler.status()
+
+@router.post("/profiler/stop")
+async def stop_profiler(clear: bool = Query(False, description="Descarta as pilhas coletadas")):
+    """
+    Para o profiler de amostragem (as pilhas continuam disponíveis)
+
+    Returns:
+        JSON com o estado do profiler
+    """
+    await run_in_threadpool(sampling_profiler.stop)
+    if clear:
+        sampling_profiler.clear()
+    return sampling_profiler.status()
+
+@router.get("/profiler/flamegraph")
+async def get_profiler_flamegraph(
+    seconds: Optional[float] = Query(None, gt=0, description="Últimos N segundos (padrão: toda a janela retida)"),
+    route: Optional[str] = Query(None, description="Apenas as amostras desta rota (ex: /api/v1/analysis/complete)"),
+    by_route: bool = Query(True, description="Usa a rota como frame raiz")
+):
+    """
+    Pilhas amostradas no formato folded
+
+    Compatível com flamegraph.pl (`flamegraph.pl stacks.txt > flame.svg`) e
+    com o speedscope (importação de arquivo).
+
+    Returns:
+        Texto com uma pilha por linha seguida do número de amostras
+    """
+    text = await run_in_threadpool(sampling_profiler.folded, seconds, route, by_route)
+    return PlainTextResponse(text, headers={"Content-Disposition": 'inline; filename="stacks.folded"'})
+
+@router.get("/profiler/routes")
+async def get_profiler_routes(
+    seconds: Optional[float] = Query(None, gt=0, description="Últimos N segundos"),
+    top: int = Query(10, ge=1, le=100, description="Funções listadas por rota")
+):
+    """
+    Amostras por rota com as funções mais frequentes
+
+    Returns:
+        JSON com as amostras ocupadas e ociosas e, por rota, a fração das
+        amostras e as funções no topo da pilha (self) e em qualquer posição (total)
+    """
+    return await run_in_threadpool(sampling_profiler.routes, seconds, top)
+
+@router.get("/tracing")
+async def get_tracing_status():
+    """
+    Estado do tracing
+
+    Returns:
+        JSON com os exportadores, a taxa de amostragem e os spans exportados,
+        descartados (fila cheia) e as falhas de exportação
+    """
+    return get_tracing_stats()
+
+@router.get("/slow-requests")
+async def get_slow_requests(limit: int = Query(50, ge=1, le=1000, description="Capturas listadas")):
+    """
+    Requisições lentas capturadas (SLOW_REQUEST_CAPTURE=true)
+
+    Returns:
+        JSON com o estado da captura e as capturas mais recentes primeiro
+    """
+    captures = await run_in_threadpool(slow_request_store.list, limit)
+    return {**get_slow_request_stats(), "captures": captures}
+
+@router.get("/slow-requests/{capture_id}")
+async def get_slow_request(capture_id: str):
+    """
+    Metadados de uma captura (formato de replay_requests.py)
+
+    Args:
+        capture_id: ID da captura
+    """
+    record = await run_in_threadpool(slow_request_store.get, capture_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Captura não encontrada")
+    return record
+
+@router.get("/slow-requests/{capture_id}/body")
+async def get_slow_request_body(capture_id: str):
+    """
+    Corpo original de uma captura
+
+    Args:
+        capture_id: ID da captura
+
+    Returns:
+        Bytes enviados pelo cliente, com o Content-Type original
+    """
+    record = await run_in_threadpool(slow_request_store.get, capture_id)
+    path = slow_request_store.body_path(record) if record is not None else None
+    if path is None:
+        raise HTTPException(status_code=404, detail="Captura sem corpo gravado")
+    content_type = record["request"]["headers"].get("content-type", "application/octet-stream")
+    return FileResponse(path, media_type=content_type)
@@ -1,118 +1,255 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Request, Header, Depends
+from fastapi.responses import StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 from PIL import Image
 import io
 import base64
-import os
-import uuid
 import logging
 from datetime import datetime
-from typing import Dict
+from typing import AsyncIterator, Dict, Optional
 
-from utils.clip_classifier import classify_clothing_image, get_device_info, analyze_outfit_compatibility, analyze_complete_outfit_image, detect_clothing_color
-from utils.body_parts_detector import detect_body_parts_from_image, get_body_part_image
-from utils.image_utils import ensure_rgb_image
+from utils.clip_classifier import classify_clothing_image, get_device_info, analyze_outfit_compatibility, analyze_complete_outfit_image, detect_clothing_color, classify_parts_batch
+from utils.body_parts_detector import detect_body_parts_from_image_async, detect_people_from_image_async, extract_body_part_image, get_margin_percentage, get_cascade_mode
+from utils.image_utils import ensure_rgb_image, decode_image, read_raw_image_body, ImageTooLargeError
+from utils.single_flight import analysis_flight
+from utils.cache import result_cache, make_cache_key, etag_for, etag_matches
+from utils.streaming import encode_event, resolve_stream_format, STREAM_MEDIA_TYPES, STREAM_HEADERS
+from utils.batch_processing import read_batch_request, analyze_batch, batch_summary, BatchTooLargeError, MAX_BATCH_SIZE, BATCH_MEMORY_MB
+from utils.serialization import FastJSONResponse, ResponseShape, response_shape
+from utils.artifacts import ArtifactSession
+from utils.tracing import span
 
 # Configurar logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/v1/analysis", tags=["Analysis"])
 
-# Configuração de pastas estáticas
-STATIC_DIR = "static"
-BODY_PARTS_DIR = os.path.join(STATIC_DIR, "body_parts")
-os.makedirs(BODY_PARTS_DIR, exist_ok=True)
+async def _analyze_multi_person(image: Image.Image, frame: Optional[bytes] = None) -> Dict:
+    """
+    Analisa o outfit de todas as pessoas da imagem em uma única passada
+    
+    O YOLO detecta as pessoas uma vez, a pose roda no recorte de cada pessoa e
+    todas as peças de todas as pessoas são classificadas em um único lote do CLIP.
+    
+    Args:
+        image: Imagem PIL (RGB)
+        frame: Bytes originais da imagem (guardados para renderizar os recortes sob demanda)
+    
+    Returns:
+        Dicionário com os resultados por pessoa
+    """
+    with span("detection", {"detection.multi_person": True}) as detection_span:
+        detection = await detect_people_from_image_async(image)
+        detection_span.set_attribute("people.count", detection.get("people_detected", 0))
+    if not detection["success"]:
+        return {
+            "success": False,
+            "error": detection["error"],
+            "people_detected": detection.get("people_detected", 0)
+        }
+    
+    session = ArtifactSession(image, frame)
+    session_id = session.session_id
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    
+    # Recorta as peças de todas as pessoas
+    crops = []
+    for person in detection["people"]:
+        person_detection = {"success": True, "body_parts": person["body_parts"]}
+        for part_name, part_data in person["body_parts"].items():
+            part_image = extract_body_part_image(image, person_detection, part_name)
+            if part_image is not None:
+                crops.append((person["person_index"], part_name, part_image, part_data))
+    
+    # Classifica todas as peças (e cores) em um único lote
+    with span("classify_parts", {"parts.count": len(crops), "people.count": len(detection["people"])}):
+        batch_results = await run_in_threadpool(
+            classify_parts_batch,
+            [crop[2] for crop in crops],
+            [crop[1] for crop in crops]
+        )
+    
+    persons = {
+        person["person_index"]: {
+            "person_index": person["person_index"],
+            "person_bbox": person["person_bbox"],
+            "body_parts": {},
+            "saved_parts": {},
+            "classifications": {}
+        }
+        for person in detection["people"]
+    }
+    total_parts_saved = 0
+    for (person_index, part_name, part_image, part_data), part_result in zip(crops, batch_results):
+        try:
+            filename, url = session.add_crop(f"{part_name}_p{person_index}", part_name, part_data["bbox"])
+            person_result = persons[person_index]
+            person_result["body_parts"][part_name] = url
+            person_result["saved_parts"][part_name] = {
+                "filename": filename,
+                "url": url,
+                "dimensions": {
+                    "width": part_image.width,
+                    "height": part_image.height
+                },
+                "area": part_data["area"]
+            }
+            person_result["classifications"][part_name] = {**part_result, "url": url}
+            total_parts_saved += 1
+        except Exception as e:
+            logger.error(f"Erro ao salvar parte {part_name} da pessoa {person_index}: {e}")
+    
+    with span("compatibility", {"people.count": len(persons)}):
+        for person_result in persons.values():
+            person_result["outfit_compatibility"] = analyze_outfit_compatibility(person_result["classifications"])
+    
+    # A análise da imagem inteira é feita uma vez, tendo a maior pessoa como referência
+    main_person = max(
+        persons.values(),
+        key=lambda p: (p["person_bbox"][2] - p["person_bbox"][0]) * (p["person_bbox"][3] - p["person_bbox"][1])
+    )
+    with span("full_image_analysis", {"parts.count": len(main_person["classifications"])}):
+        complete_outfit_analysis = await run_in_threadpool(analyze_complete_outfit_image, image, main_person["classifications"])
+    
+    all_parts = {
+        f"{part_name}_p{person['person_index']}": part_data
+        for person in detection["people"]
+        for part_name, part_data in person["body_parts"].items()
+    }
+    _, vis_url = session.add_visualization("bodyparts", all_parts)
+    with span("storage.commit", {"artifacts.count": total_parts_saved + 1}):
+        session.commit()
+    
+    return {
+        "success": True,
+        "multi_person": True,
+        "session_id": session_id,
+        "timestamp": timestamp,
+        "device_used": get_device_info(),
+        "total_parts_saved": total_parts_saved,
+        "persons": list(persons.values()),
+        "main_person_index": main_person["person_index"],
+        "complete_outfit_analysis": complete_outfit_analysis,
+        "body_parts_visualization_url": vis_url,
+        "summary": {
+            "people_detected": detection["people_detected"],
+            "people_analyzed": len(persons),
+            "total_parts_classified": len(batch_results),
+            "overall_coordination_score": complete_outfit_analysis.get("full_image_analysis", {}).get("coordination_analysis", {}).get("coordination_score", 0)
+        }
+    }
 
-@router.post("/complete")
-async def analyze_complete(file: UploadFile = File(...)):
+def _classify_and_save_part(image: Image.Image, body_detection: Dict, part_name: str,
+                            session: ArtifactSession) -> Optional[Dict]:
+    """Recorta, classifica e analisa a cor de uma parte e registra o recorte na sessão (bloqueante)"""
+    with span("classify_part", {"part.name": part_name}) as part_span:
+        part_image = extract_body_part_image(image, body_detection, part_name)
+        if part_image is None:
+            return None
+        part_span.set_attributes({"part.width": part_image.width, "part.height": part_image.height})
+        filename, url = session.add_crop(part_name, part_name, body_detection["body_parts"][part_name]["bbox"])
+        classifications, top_prediction = classify_clothing_image(part_image, part_name)
+        color_analysis = detect_clothing_color(part_image)
+    return {
+        "part_name": part_name,
+        "filename": filename,
+        "url": url,
+        "dimensions": {
+            "width": part_image.width,
+            "height": part_image.height
+        },
+        "area": body_detection["body_parts"][part_name]["area"],
+        "predictions": classifications,
+        "top_prediction": top_prediction,
+        "color_analysis": color_analysis
+    }
+
+async def _complete_analysis_events(image: Image.Image, stream_format: str, file_info: Dict,
+                                    frame: Optional[bytes] = None) -> AsyncIterator[bytes]:
     """
-    Realiza análise completa: extrai todas as partes do corpo e classifica cada uma
+    Executa a análise completa emitindo um evento ao fim de cada etapa
+    
+    Eventos, em ordem: detection, part (um por parte), compatibility,
+    full_image, visualization e done. Falhas geram um evento error.
+    
+    Args:
+        image: Imagem PIL (RGB)
+        stream_format: "ndjson" ou "sse"
+        file_info: Metadados do arquivo enviado
+        frame: Bytes originais da imagem (para os recortes sob demanda)
+    
+    Yields:
+        Eventos codificados
     """
-    logger.info("Iniciando análise completa")
+    event_id = 0
+    
+    def emit(event: str, data: Dict) -> bytes:
+        nonlocal event_id
+        event_id += 1
+        return encode_event(event, data, stream_format, event_id)
+    
     try:
-        if not file.content_type.startswith('image/'):
-            logger.error(f"Tipo de arquivo inválido: {file.content_type}")
-            raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
-        image_data = await file.read()
-        if len(image_data) == 0:
-            logger.error("Arquivo vazio!")
-            raise HTTPException(status_code=400, detail="Arquivo está vazio")
-        image = Image.open(io.BytesIO(image_data))
-        image = ensure_rgb_image(image)
-        body_detection = detect_body_parts_from_image(image)
+        with span("detection") as detection_span:
+            body_detection = await detect_body_parts_from_image_async(image)
+            detection_span.set_attribute("parts.count", len(body_detection.get("body_parts", {})))
         if not body_detection["success"]:
-            logger.error(f"Falha na detecção: {body_detection['error']}")
-            return JSONResponse(content={
-                "success": False,
-                "error": body_detection["error"],
-                "filename": file.filename,
-                "file_size": len(image_data),
-                "content_type": file.content_type
-            })
-        session_id = str(uuid.uuid4())[:8]
+            yield emit("error", {"success": False, "error": body_detection["error"], **file_info})
+            return
+        
+        session = ArtifactSession(image, frame)
+        session_id = session.session_id
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        saved_parts = {}
+        yield emit("detection", {
+            "session_id": session_id,
+            "timestamp": timestamp,
+            "device_used": get_device_info(),
+            "image_dimensions": body_detection.get("image_dimensions"),
+            "body_parts": {
+                part_name: {"bbox": part_data["bbox"], "area": part_data["area"]}
+                for part_name, part_data in body_detection["body_parts"].items()
+            },
+            "people_detected": len(body_detection.get("people", [])),
+            **file_info
+        })
+        
         classified_parts = {}
-        total_parts_saved = 0
-        for part_name, part_data in body_detection["body_parts"].items():
+        for part_name in body_detection["body_parts"]:
             try:
-                part_image = get_body_part_image(image, part_name)
-                if part_image is not None:
-                    filename = f"{part_name}_{session_id}_{timestamp}.jpg"
-                    filepath = os.path.join(BODY_PARTS_DIR, filename)
-                    part_image.save(filepath, "JPEG", quality=95)
-                    classifications, top_prediction = classify_clothing_image(part_image, part_name)
-                    color_analysis = detect_clothing_color(part_image)
-                    saved_parts[part_name] = {
-                        "filename": filename,
-                        "url": f"/api/v1/static/body-parts/{filename}",
-                        "dimensions": {
-                            "width": part_image.width,
-                            "height": part_image.height
-                        },
-                        "area": part_data["area"]
-                    }
-                    classified_parts[part_name] = {
-                        "predictions": classifications,
-                        "top_prediction": top_prediction,
-                        "color_analysis": color_analysis,
-                        "url": f"/api/v1/static/body-parts/{filename}"
-                    }
-                    total_parts_saved += 1
+                part_result = await run_in_threadpool(
+                    _classify_and_save_part, image, body_detection, part_name, session
+                )
             except Exception as e:
                 logger.error(f"Erro ao processar parte {part_name}: {e}")
+                yield emit("part_error", {"part_name": part_name, "error": str(e)})
                 continue
-        logger.info(f"Análise completa finalizada. {total_parts_saved} partes salvas.")
-        compatibility_analysis = analyze_outfit_compatibility(classified_parts)
-        complete_outfit_analysis = analyze_complete_outfit_image(image, classified_parts)
-        vis_filename = f"bodyparts_{session_id}_{timestamp}.jpg"
-        vis_filepath = os.path.join(BODY_PARTS_DIR, vis_filename)
-        try:
-            from utils.body_parts_detector import detector
-            detector.save_body_parts_visualization(image, body_detection, vis_filepath)
-            vis_url = f"/api/v1/static/body-parts/{vis_filename}"
-        except Exception as e:
-            logger.error(f"Erro ao salvar visualização das partes do corpo: {e}")
-            vis_url = None
-        result = {
+            if part_result is None:
+                continue
+            classified_parts[part_name] = {
+                "predictions": part_result["predictions"],
+                "top_prediction": part_result["top_prediction"],
+                "color_analysis": part_result["color_analysis"],
+                "url": part_result["url"]
+            }
+            yield emit("part", part_result)
+        
+        # Os spans não envolvem os yield: o contextvar do span atual vazaria para o consumidor do gerador
+        with span("compatibility", {"parts.count": len(classified_parts)}):
+            compatibility_analysis = analyze_outfit_compatibility(classified_parts)
+        yield emit("compatibility", {"outfit_compatibility": compatibility_analysis})
+        
+        with span("full_image_analysis", {"parts.count": len(classified_parts)}):
+            complete_outfit_analysis = await run_in_threadpool(analyze_complete_outfit_image, image, classified_parts)
+        yield emit("full_image", {"complete_outfit_analysis": complete_outfit_analysis})
+        
+        _, vis_url = session.add_visualization("bodyparts", body_detection["body_parts"])
+        with span("storage.commit", {"artifacts.count": len(classified_parts) + 1}):
+            session.commit()
+        yield emit("visualization", {"body_parts_visualization_url": vis_url})
+        
+        yield emit("done", {
             "success": True,
             "session_id": session_id,
-            "timestamp": timestamp,
-            "filename": file.filename,
-            "file_size": len(image_data),
-            "content_type": file.content_type,
-            "device_used": get_device_info(),
-            "total_parts_saved": total_parts_saved,
-            "body_parts": {
-                part_name: part_info["url"] 
-                for part_name, part_info in saved_parts.items()
-            },
-            "saved_parts": saved_parts,
-            "classifications": classified_parts,
-            "outfit_compatibility": compatibility_analysis,
-            "complete_outfit_analysis": complete_outfit_analysis,
-            "body_parts_visualization_url": vis_url,
             "summary": {
                 "total_parts_detected": len(body_detection["body_parts"]),
                 "total_parts_classified": len(classified_parts),
@@ -120,20 +257,222 @@ async def analyze_complete(file: UploadFile = File(...)):
                 "compatibility_score": compatibility_analysis.get("compatibility_score", 0),
                 "overall_coordination_score": complete_outfit_analysis.get("full_image_analysis", {}).get("coordination_analysis", {}).get("coordination_score", 0)
             }
+        })
+    except Exception as e:
+        logger.error(f"Erro na análise em streaming: {e}")
+        yield emit("error", {"success": False, "error": f"Erro ao processar imagem: {str(e)}"})
+
+async def _analyze_single_person(image: Image.Image, frame: Optional[bytes] = None) -> Dict:
+    """
+    Análise completa da pessoa principal da imagem
+    
+    As etapas bloqueantes (recorte, classificação, cor, análise da imagem
+    inteira) rodam no threadpool.
+    
+    Args:
+        image: Imagem PIL (RGB)
+        frame: Bytes originais da imagem (guardados para renderizar os recortes sob demanda)
+    
+    Returns:
+        Dicionário com partes salvas, classificações e análises do outfit
+    """
+    with span("detection") as detection_span:
+        body_detection = await detect_body_parts_from_image_async(image)
+        detection_span.set_attribute("parts.count", len(body_detection.get("body_parts", {})))
+    if not body_detection["success"]:
+        logger.error(f"Falha na detecção: {body_detection['error']}")
+        return {
+            "success": False,
+            "error": body_detection["error"]
+        }
+    session = ArtifactSession(image, frame)
+    session_id = session.session_id
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    saved_parts = {}
+    classified_parts = {}
+    for part_name in body_detection["body_parts"]:
+        try:
+            part_result = await run_in_threadpool(
+                _classify_and_save_part, image, body_detection, part_name, session
+            )
+        except Exception as e:
+            logger.error(f"Erro ao processar parte {part_name}: {e}")
+            continue
+        if part_result is None:
+            continue
+        saved_parts[part_name] = {
+            "filename": part_result["filename"],
+            "url": part_result["url"],
+            "dimensions": part_result["dimensions"],
+            "area": part_result["area"]
+        }
+        classified_parts[part_name] = {
+            "predictions": part_result["predictions"],
+            "top_prediction": part_result["top_prediction"],
+            "color_analysis": part_result["color_analysis"],
+            "url": part_result["url"]
+        }
+    logger.info(f"Análise completa finalizada. {len(saved_parts)} partes salvas.")
+    with span("compatibility", {"parts.count": len(classified_parts)}):
+        compatibility_analysis = analyze_outfit_compatibility(classified_parts)
+    with span("full_image_analysis", {"parts.count": len(classified_parts)}):
+        complete_outfit_analysis = await run_in_threadpool(analyze_complete_outfit_image, image, classified_parts)
+    _, vis_url = session.add_visualization("bodyparts", body_detection["body_parts"])
+    with span("storage.commit", {"artifacts.count": len(saved_parts) + 1}):
+        session.commit()
+    return {
+        "success": True,
+        "session_id": session_id,
+        "timestamp": timestamp,
+        "device_used": get_device_info(),
+        "total_parts_saved": len(saved_parts),
+        "body_parts": {
+            part_name: part_info["url"] 
+            for part_name, part_info in saved_parts.items()
+        },
+        "saved_parts": saved_parts,
+        "classifications": classified_parts,
+        "outfit_compatibility": compatibility_analysis,
+        "complete_outfit_analysis": complete_outfit_analysis,
+        "body_parts_visualization_url": vis_url,
+        "summary": {
+            "total_parts_detected": len(body_detection["body_parts"]),
+            "total_parts_classified": len(classified_parts),
+            "people_detected": len(body_detection.get("people", [])),
+            "compatibility_score": compatibility_analysis.get("compatibility_score", 0),
+            "overall_coordination_score": complete_outfit_analysis.get("full_image_analysis", {}).get("coordination_analysis", {}).get("coordination_score", 0)
         }
-        logger.info("Análise completa concluída com sucesso")
-        return JSONResponse(content=result)
+    }
+
+def _analysis_cache_key(image_data: bytes, multi_person: bool) -> str:
+    """Chave de cache/coalescência da análise completa"""
+    return make_cache_key(
+        "analysis", image_data,
+        multi_person=multi_person,
+        margin_percentage=get_margin_percentage(),
+        cascade_mode=get_cascade_mode()
+    )
+
+async def _run_analysis(image_data: bytes, multi_person: bool, image: Optional[Image.Image] = None):
+    """
+    Executa a análise usando o cache de resultados e agrupando requisições idênticas em andamento
+    
+    A imagem só é decodificada se o resultado não estiver em cache.
+    
+    Args:
+        image_data: Bytes originais da imagem (para a chave do cache)
+        multi_person: Analisa todas as pessoas da imagem
+        image: Imagem PIL já decodificada (opcional)
+    
+    Returns:
+        Tupla (resultado, metadados {"etag", "cache", "coalesced"})
+    """
+    async def compute():
+        rgb_image = image if image is not None else decode_image(image_data)
+        analyze = _analyze_multi_person if multi_person else _analyze_single_person
+        return await analyze(rgb_image, image_data)
+    with span("analysis", {"analysis.multi_person": multi_person}):
+        return await result_cache.get_or_compute(_analysis_cache_key(image_data, multi_person), compute, analysis_flight)
+
+@router.post("/complete")
+async def analyze_complete(
+    file: UploadFile = File(...),
+    multi_person: bool = Query(False, description="Analisa todas as pessoas detectadas na imagem"),
+    if_none_match: Optional[str] = Header(None),
+    shape: ResponseShape = Depends(response_shape)
+):
+    """
+    Realiza análise completa: extrai todas as partes do corpo e classifica cada uma
+    
+    Com multi_person=true, retorna os resultados de cada pessoa detectada.
+    Resultados são cacheados por conteúdo da imagem, parâmetros e versão dos
+    modelos (headers ETag e X-Cache; If-None-Match retorna 304). Requisições
+    idênticas em andamento compartilham a mesma computação (header X-Coalesced).
+    Os parâmetros fields, top_k e compact reduzem a resposta ao que o cliente usa.
+    """
+    logger.info("Iniciando análise completa")
+    try:
+        if not file.content_type.startswith('image/'):
+            logger.error(f"Tipo de arquivo inválido: {file.content_type}")
+            raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
+        image_data = await file.read()
+        if len(image_data) == 0:
+            logger.error("Arquivo vazio!")
+            raise HTTPException(status_code=400, detail="Arquivo está vazio")
+        result_key = _analysis_cache_key(image_data, multi_person)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
+        result, meta = await _run_analysis(image_data, multi_person)
+        if meta["cache"] == "hit":
+            logger.info("Resultado servido do cache")
+        elif meta["coalesced"]:
+            logger.info("Requisição agrupada com uma análise idêntica em andamento")
+        elif result.get("success"):
+            logger.info("Análise completa concluída com sucesso")
+        return FastJSONResponse(
+            content=shape.apply({
+                **result,
+                "filename": file.filename,
+                "file_size": len(image_data),
+                "content_type": file.content_type
+            }),
+            headers=shape.headers(meta)
+        )
     except Exception as e:
         logger.error(f"Erro geral na análise: {e}")
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
+@router.post("/complete/stream")
+async def analyze_complete_stream(
+    request: Request,
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, description="Formato do stream: 'ndjson' ou 'sse' (padrão pelo header Accept)")
+):
+    """
+    Análise completa com resultados progressivos
+    
+    Emite um evento assim que cada etapa termina: as caixas da detecção, a
+    classificação e a cor de cada parte, a compatibilidade, a análise da imagem
+    inteira e a visualização. O cliente recebe as caixas com a latência da
+    detecção, sem esperar o restante da análise.
+    
+    Returns:
+        Stream NDJSON (application/x-ndjson) ou SSE (text/event-stream)
+    """
+    try:
+        stream_format = resolve_stream_format(format, request.headers.get("accept", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
+    image_data = await file.read()
+    if len(image_data) == 0:
+        raise HTTPException(status_code=400, detail="Arquivo está vazio")
+    try:
+        image = decode_image(image_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Imagem inválida: {str(e)}")
+    
+    file_info = {
+        "filename": file.filename,
+        "file_size": len(image_data),
+        "content_type": file.content_type
+    }
+    return StreamingResponse(
+        _complete_analysis_events(image, stream_format, file_info, image_data),
+        media_type=STREAM_MEDIA_TYPES[stream_format],
+        headers=STREAM_HEADERS
+    )
+
 @router.post("/complete/base64")
-async def analyze_complete_base64(request_data: Dict):
+async def analyze_complete_base64(request_data: Dict, if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
     """
     Realiza análise completa usando imagem em base64
     
     Args:
-        request_data: {"image_base64": "data:image/jpeg;base64,/9j/4AAQ..."}
+        request_data: {"image_base64": "data:image/jpeg;base64,/9j/4AAQ...", "multi_person": false}
     
     Returns:
         JSON com resultados de classificação para cada parte extraída
@@ -159,6 +498,14 @@ async def analyze_complete_base64(request_data: Dict):
         image_data = base64.b64decode(image_base64)
         logger.info(f"Tamanho decodificado: {len(image_data)} bytes")
         
+        multi_person = bool(request_data.get("multi_person", False))
+        result_key = _analysis_cache_key(image_data, multi_person)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            logger.info("ETag confere, retornando 304")
+            return Response(status_code=304, headers={"ETag": etag})
+        
         # Abrir imagem
         logger.info("Abrindo imagem...")
         image = Image.open(io.BytesIO(image_data))
@@ -169,135 +516,21 @@ async def analyze_complete_base64(request_data: Dict):
         logger.info("Convertendo para RGB...")
         image = ensure_rgb_image(image)
         
-        # Detectar partes do corpo
-        logger.info("Detectando partes do corpo...")
-        body_detection = detect_body_parts_from_image(image)
-        
-        if not body_detection["success"]:
-            logger.error(f"Falha na detecção: {body_detection['error']}")
-            return JSONResponse(content={
-                "success": False,
-                "error": body_detection["error"],
-                "image_size": len(image_data)
-            })
-        
-        logger.info(f"Partes detectadas: {list(body_detection['body_parts'].keys())}")
-        
-        # Gerar session ID único
-        session_id = str(uuid.uuid4())[:8]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        
-        # Extrair, salvar e classificar cada parte do corpo
-        saved_parts = {}
-        classified_parts = {}
-        total_parts_saved = 0
-        
-        for part_name, part_data in body_detection["body_parts"].items():
-            try:
-                logger.info(f"Processando parte: {part_name}")
-                
-                # Extrair parte do corpo
-                part_image = get_body_part_image(image, part_name)
-                
-                if part_image is not None:
-                    logger.info(f"Dimensões da parte: {part_image.size}")
-                    
-                    # Gerar nome do arquivo
-                    filename = f"{part_name}_{session_id}_{timestamp}.jpg"
-                    filepath = os.path.join(BODY_PARTS_DIR, filename)
-                    
-                    # Salvar imagem
-                    logger.info(f"Salvando em: {filepath}")
-                    part_image.save(filepath, "JPEG", quality=95)
-                    
-                    # Classificar a parte extraída
-                    logger.info(f"Classificando...")
-                    classifications, top_prediction = classify_clothing_image(part_image, part_name)
-                    
-                    # Detectar cor da peça
-                    logger.info(f"Detectando cor...")
-                    color_analysis = detect_clothing_color(part_image)
-                    
-                    # Informações do arquivo salvo
-                    saved_parts[part_name] = {
-                        "filename": filename,
-                        "url": f"/api/v1/static/body-parts/{filename}",
-                        "dimensions": {
-                            "width": part_image.width,
-                            "height": part_image.height
-                        },
-                        "area": part_data["area"]
-                    }
-                    
-                    # Resultados da classificação
-                    classified_parts[part_name] = {
-                        "predictions": classifications,
-                        "top_prediction": top_prediction,
-                        "color_analysis": color_analysis,
-                        "url": f"/api/v1/static/body-parts/{filename}"
-                    }
-                    
-                    total_parts_saved += 1
-                    logger.info(f"{part_name} processado com sucesso")
-                    
-            except Exception as e:
-                logger.error(f"Erro ao processar parte {part_name}: {e}")
-                continue
-        
-        logger.info(f"Análise completa finalizada. {total_parts_saved} partes salvas.")
-        
-        # Analisar compatibilidade entre as peças detectadas
-        logger.info("Analisando compatibilidade do outfit...")
-        compatibility_analysis = analyze_outfit_compatibility(classified_parts)
-        logger.info(f"Score de compatibilidade: {compatibility_analysis.get('compatibility_score', 0)}")
-        
-        # Analisar a imagem completa com CLIP
-        logger.info("Analisando outfit completo com CLIP...")
-        complete_outfit_analysis = analyze_complete_outfit_image(image, classified_parts)
-        logger.info(f"Análise completa realizada com sucesso")
-        
-        # Salvar visualização das partes do corpo na imagem original
-        vis_filename = f"bodyparts_{session_id}_{timestamp}.jpg"
-        vis_filepath = os.path.join(BODY_PARTS_DIR, vis_filename)
-        try:
-            from utils.body_parts_detector import detector
-            detector.save_body_parts_visualization(image, body_detection, vis_filepath)
-            vis_url = f"/api/v1/static/body-parts/{vis_filename}"
-        except Exception as e:
-            logger.error(f"Erro ao salvar visualização das partes do corpo: {e}")
-            vis_url = None
-        
-        # Resultado final
-        result = {
-            "success": True,
-            "session_id": session_id,
-            "timestamp": timestamp,
-            "image_size": len(image_data),
-            "device_used": get_device_info(),
-            "total_parts_saved": total_parts_saved,
-            "body_parts": {
-                part_name: part_info["url"] 
-                for part_name, part_info in saved_parts.items()
-            },
-            "saved_parts": saved_parts,
-            "classifications": classified_parts,
-            "outfit_compatibility": compatibility_analysis,
-            "complete_outfit_analysis": complete_outfit_analysis,
-            "body_parts_visualization_url": vis_url,
-            "summary": {
-                "total_parts_detected": len(body_detection["body_parts"]),
-                "total_parts_classified": len(classified_parts),
-                "people_detected": len(body_detection.get("people", [])),
-                "compatibility_score": compatibility_analysis.get("compatibility_score", 0),
-                "overall_coordination_score": complete_outfit_analysis.get("full_image_analysis", {}).get("coordination_analysis", {}).get("coordination_score", 0)
-            }
-        }
+        logger.info("Análise multi-pessoa..." if multi_person else "Analisando imagem...")
+        result, meta = await _run_analysis(image_data, multi_person, image)
+        if meta["cache"] == "hit":
+            logger.info("Resultado servido do cache")
+        elif meta["coalesced"]:
+            logger.info("Requisição agrupada com uma análise idêntica em andamento")
         
         logger.info("=" * 50)
-        logger.info("FIM - Análise Completa (SUCESSO)")
+        logger.info("FIM - Análise Completa" + (" (SUCESSO)" if result.get("success") else " (FALHA)"))
         logger.info("=" * 50)
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(
+            content=shape.apply({**result, "image_size": len(image_data)}),
+            headers=shape.headers(meta)
+        )
         
     except Exception as e:
         logger.error("=" * 50)
@@ -312,4 +545,91 @@ async def analyze_complete_base64(request_data: Dict):
         logger.error(f"Traceback completo:")
         logger.error(traceback.format_exc())
         
-        raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}") 
+
+@router.post("/complete/raw")
+async def analyze_complete_raw(
+    request: Request,
+    multi_person: bool = Query(False, description="Analisa todas as pessoas detectadas na imagem"),
+    if_none_match: Optional[str] = Header(None),
+    shape: ResponseShape = Depends(response_shape)
+):
+    """
+    Realiza análise completa de uma imagem enviada como corpo binário
+    
+    Alternativa a /complete/base64 para clientes móveis: o corpo da requisição
+    é a própria imagem (Content-Type image/* ou application/octet-stream),
+    sem o overhead de base64 nem o parse de um JSON de vários MB.
+    
+    Returns:
+        JSON com resultados de classificação para cada parte extraída
+    """
+    try:
+        image_data, content_type = await read_raw_image_body(request)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result_key = _analysis_cache_key(image_data, multi_person)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
+        result, meta = await _run_analysis(image_data, multi_person)
+        return FastJSONResponse(
+            content=shape.apply({
+                **result,
+                "file_size": len(image_data),
+                "content_type": content_type
+            }),
+            headers=shape.headers(meta)
+        )
+    except Exception as e:
+        logger.error(f"Erro geral na análise: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
+
+@router.post("/batch")
+async def analyze_batch_images(
+    request: Request,
+    save_parts: bool = Query(False, description="Salva os recortes das partes (URLs em /api/v1/static/body-parts)")
+):
+    """
+    Análise completa de várias imagens em uma única requisição
+    
+    Aceita multipart/form-data com vários campos "files" (ou um zip), um corpo
+    application/zip ou um corpo application/x-ndjson com {"image": "<base64>", "name": "..."}
+    por linha. A detecção e as codificações CLIP rodam em lote, em blocos
+    limitados por BATCH_MEMORY_MB.
+    
+    Returns:
+        JSON com um resultado por imagem, na ordem de entrada (erros por item)
+    """
+    try:
+        items = await read_batch_request(request)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    logger.info(f"Iniciando análise em lote de {len(items)} imagens")
+    try:
+        results = await run_in_threadpool(
+            analyze_batch,
+            items,
+            BATCH_MEMORY_MB,
+            save_parts
+        )
+        summary = batch_summary(results)
+        logger.info(f"Análise em lote concluída: {summary['succeeded']}/{summary['total']} imagens")
+        return FastJSONResponse(content={
+            "success": True,
+            "device_used": get_device_info(),
+            "max_batch_size": MAX_BATCH_SIZE,
+            "summary": summary,
+            "results": results
+        })
+    except Exception as e:
+        logger.error(f"Erro na análise em lote: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao processar lote: {str(e)}")
@@ -1,29 +1,50 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from PIL import Image
-import io
+from fastapi import APIRouter, File, UploadFile, HTTPException, Header, Query, Request, Depends
+from fastapi.responses import Response
 import base64
-import os
-import uuid
+import json
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Optional
 
-from utils.body_parts_detector import detect_body_parts_from_image, get_body_part_image
-from utils.image_utils import ensure_rgb_image
+from utils.body_parts_detector import detect_body_parts_from_image_async, extract_body_part_image, get_body_part_image, get_margin_percentage, get_cascade_mode
+from utils.cache import result_cache, make_cache_key, etag_for, etag_matches
+from utils.artifacts import ArtifactSession
+from utils.image_utils import decode_image, read_raw_image_body, encode_image_bytes, encode_multipart_mixed, ImageTooLargeError
+from utils.serialization import FastJSONResponse, ResponseShape, response_shape
 
 router = APIRouter(prefix="/api/v1/body-parts", tags=["Body Parts Detection"])
 
-# Configuração de pastas estáticas
-STATIC_DIR = "static"
-BODY_PARTS_DIR = os.path.join(STATIC_DIR, "body_parts")
-os.makedirs(BODY_PARTS_DIR, exist_ok=True)
+def _detection_cache_key(image_bytes: bytes) -> str:
+    """Chave de cache da detecção (conteúdo + margem + modo cascata + versão dos modelos)"""
+    return make_cache_key(
+        "detection", image_bytes,
+        margin_percentage=get_margin_percentage(),
+        cascade_mode=get_cascade_mode()
+    )
+
+async def _detect_cached(image_bytes: bytes):
+    """
+    Detecta as partes do corpo usando o cache de resultados
+    
+    Args:
+        image_bytes: Bytes da imagem
+    
+    Returns:
+        Tupla (detecção, metadados {"etag", "cache", "coalesced"})
+    """
+    async def compute():
+        image = decode_image(image_bytes)
+        return await detect_body_parts_from_image_async(image)
+    return await result_cache.get_or_compute(_detection_cache_key(image_bytes), compute)
 
 @router.post("/detect")
-async def detect_body_parts(file: UploadFile = File(...)):
+async def detect_body_parts(file: UploadFile = File(...), if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
     """
     Detecta partes do corpo na imagem
     
+    Resultados são cacheados por conteúdo da imagem, parâmetros e versão dos
+    modelos (headers ETag e X-Cache; If-None-Match retorna 304).
+    
     Args:
         file: Arquivo de imagem (JPG, PNG, etc.)
     
@@ -35,28 +56,32 @@ async def detect_body_parts(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
     
     try:
-        # Ler e processar a imagem
+        # Ler a imagem
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Garantir que a imagem seja RGB
-        image = ensure_rgb_image(image)
+        result_key = _detection_cache_key(image_data)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
         
         # Detectar partes do corpo
-        detection_result = detect_body_parts_from_image(image)
+        detection_result, meta = await _detect_cached(image_data)
         
         # Adicionar informações do arquivo
-        detection_result["filename"] = file.filename
-        detection_result["file_size"] = len(image_data)
-        detection_result["content_type"] = file.content_type
+        detection_result = {
+            **detection_result,
+            "filename": file.filename,
+            "file_size": len(image_data),
+            "content_type": file.content_type
+        }
         
-        return JSONResponse(content=detection_result)
+        return FastJSONResponse(content=shape.apply(detection_result), headers=shape.headers(meta))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
 @router.post("/detect/base64")
-async def detect_body_parts_base64(image_data: Dict[str, str]):
+async def detect_body_parts_base64(image_data: Dict[str, str], if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
     """
     Detecta partes do corpo em uma imagem enviada em formato base64
     
@@ -72,15 +97,55 @@ async def detect_body_parts_base64(image_data: Dict[str, str]):
     try:
         # Decodificar base64
         image_bytes = base64.b64decode(image_data["image"])
-        image = Image.open(io.BytesIO(image_bytes))
+        result_key = _detection_cache_key(image_bytes)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        # Detectar partes do corpo
+        detection_result, meta = await _detect_cached(image_bytes)
         
-        # Garantir que a imagem seja RGB
-        image = ensure_rgb_image(image)
+        return FastJSONResponse(content=shape.apply(detection_result), headers=shape.headers(meta))
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
+
+@router.post("/detect/raw")
+async def detect_body_parts_raw(request: Request, if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
+    """
+    Detecta partes do corpo em uma imagem enviada como corpo binário
+    
+    O corpo da requisição é a própria imagem (Content-Type image/* ou
+    application/octet-stream), sem base64 nem JSON.
+    
+    Returns:
+        JSON com as partes do corpo detectadas
+    """
+    try:
+        image_bytes, content_type = await read_raw_image_body(request)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result_key = _detection_cache_key(image_bytes)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
         
         # Detectar partes do corpo
-        detection_result = detect_body_parts_from_image(image)
+        detection_result, meta = await _detect_cached(image_bytes)
+        
+        detection_result = {
+            **detection_result,
+            "file_size": len(image_bytes),
+            "content_type": content_type
+        }
         
-        return JSONResponse(content=detection_result)
+        return FastJSONResponse(content=shape.apply(detection_result), headers=shape.headers(meta))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
@@ -103,19 +168,17 @@ async def extract_body_parts(file: UploadFile = File(...)):
     try:
         # Ler e processar a imagem
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Garantir que a imagem seja RGB
-        image = ensure_rgb_image(image)
+        image = decode_image(image_data)
         
         # Detectar partes do corpo
-        detection_result = detect_body_parts_from_image(image)
+        detection_result = await detect_body_parts_from_image_async(image)
         
         if not detection_result["success"]:
-            return JSONResponse(content=detection_result)
+            return FastJSONResponse(content=detection_result)
         
-        # Gerar session ID único
-        session_id = str(uuid.uuid4())[:8]
+        # Sessão dos recortes (renderizados no primeiro acesso à URL)
+        session = ArtifactSession(image, image_data)
+        session_id = session.session_id
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # Salvar partes do corpo
@@ -125,20 +188,16 @@ async def extract_body_parts(file: UploadFile = File(...)):
         for part_name, part_data in detection_result["body_parts"].items():
             try:
                 # Extrair parte do corpo
-                part_image = get_body_part_image(image, part_name)
+                part_image = extract_body_part_image(image, detection_result, part_name)
                 
                 if part_image is not None:
-                    # Gerar nome do arquivo
-                    filename = f"{part_name}_{session_id}_{timestamp}.jpg"
-                    filepath = os.path.join(BODY_PARTS_DIR, filename)
-                    
-                    # Salvar imagem
-                    part_image.save(filepath, "JPEG", quality=95)
+                    # Registrar o recorte (nome derivado do conteúdo)
+                    filename, url = session.add_crop(part_name, part_name, part_data["bbox"])
                     
                     # Informações do arquivo salvo
                     saved_parts[part_name] = {
                         "filename": filename,
-                        "url": f"/api/v1/static/body-parts/{filename}",
+                        "url": url,
                         "dimensions": {
                             "width": part_image.width,
                             "height": part_image.height
@@ -152,6 +211,8 @@ async def extract_body_parts(file: UploadFile = File(...)):
                 print(f"Erro ao salvar parte {part_name}: {e}")
                 continue
         
+        session.commit()
+        
         # Resultado final
         result = {
             "success": True,
@@ -168,7 +229,7 @@ async def extract_body_parts(file: UploadFile = File(...)):
             "saved_parts": saved_parts
         }
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
@@ -176,7 +237,8 @@ async def extract_body_parts(file: UploadFile = File(...)):
 @router.get("/{part_name}")
 async def extract_specific_body_part(
     file: UploadFile = File(...),
-    part_name: str = "torso"
+    part_name: str = "torso",
+    response_format: str = Query("json", pattern="^(json|binary|multipart)$", description="json (base64), binary (image/jpeg) ou multipart (metadados + imagem)")
 ):
     """
     Extrai uma parte específica do corpo da imagem
@@ -184,9 +246,13 @@ async def extract_specific_body_part(
     Args:
         file: Arquivo de imagem (JPG, PNG, etc.)
         part_name: Nome da parte (torso, legs, feet)
+        response_format: Formato da resposta
+            - json: JSON com a imagem da parte em base64
+            - binary: a própria imagem JPEG; dimensões nos headers X-Part-Width/X-Part-Height
+            - multipart: multipart/mixed com os metadados em JSON e a imagem JPEG
     
     Returns:
-        JSON com a imagem da parte em base64
+        Imagem da parte no formato escolhido
     """
     # Validar parte do corpo
     valid_parts = ["torso", "legs", "feet"]
@@ -203,10 +269,7 @@ async def extract_specific_body_part(
     try:
         # Ler e processar a imagem
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Garantir que a imagem seja RGB
-        image = ensure_rgb_image(image)
+        image = decode_image(image_data)
         
         # Extrair parte do corpo
         part_image = get_body_part_image(image, part_name)
@@ -217,25 +280,38 @@ async def extract_specific_body_part(
                 detail=f"Parte '{part_name}' não foi detectada na imagem"
             )
         
-        # Converter para base64
-        buffer = io.BytesIO()
-        part_image.save(buffer, format="JPEG", quality=95)
-        img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+        part_bytes = encode_image_bytes(part_image, "JPEG", quality=95)
         
-        # Resultado final
+        if response_format == "binary":
+            return Response(content=part_bytes, media_type="image/jpeg", headers={
+                "X-Part-Name": part_name,
+                "X-Part-Width": str(part_image.width),
+                "X-Part-Height": str(part_image.height)
+            })
+        
+        # Metadados da parte
         result = {
             "part_name": part_name,
             "part_dimensions": {
                 "width": part_image.width,
                 "height": part_image.height
             },
-            "part_image_base64": img_base64,
             "filename": file.filename,
             "file_size": len(image_data),
             "content_type": file.content_type
         }
         
-        return JSONResponse(content=result)
+        if response_format == "multipart":
+            body, content_type = encode_multipart_mixed([
+                ({"Content-Type": "application/json"}, json.dumps(result).encode("utf-8")),
+                ({"Content-Type": "image/jpeg", "Content-Disposition": f'inline; filename="{part_name}.jpg"'}, part_bytes)
+            ])
+            return Response(content=body, media_type=content_type)
+        
+        # Converter para base64
+        result["part_image_base64"] = base64.b64encode(part_bytes).decode('utf-8')
+        
+        return FastJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}") 
\ No newline at end of file
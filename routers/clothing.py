@@ -1,10 +1,9 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from PIL import Image
-import io
+from fastapi import APIRouter, File, UploadFile, HTTPException, Request, Header, Depends
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
 import base64
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from utils.clip_classifier import (
     classify_clothing_image, 
@@ -13,15 +12,40 @@ from utils.clip_classifier import (
     get_outfit_suggestions,
     get_color_compatibility
 )
-from utils.image_utils import ensure_rgb_image
+from utils.image_utils import decode_image, read_raw_image_body, ImageTooLargeError
+from utils.single_flight import classification_flight
+from utils.cache import result_cache, make_cache_key, etag_for, etag_matches
+from utils.batch_processing import read_batch_request, classify_batch, batch_summary, BatchTooLargeError, MAX_BATCH_SIZE
+from utils.serialization import FastJSONResponse, ResponseShape, response_shape
 
 router = APIRouter(prefix="/api/v1/clothing", tags=["Clothing Classification"])
 
+async def _classify_cached(image_bytes: bytes):
+    """
+    Classifica a imagem usando o cache de resultados e agrupando requisições idênticas em andamento
+    
+    Args:
+        image_bytes: Bytes da imagem
+    
+    Returns:
+        Tupla ({"predictions", "top_prediction"}, metadados {"etag", "cache", "coalesced"})
+    """
+    async def compute():
+        image = decode_image(image_bytes)
+        classifications, top_prediction = await run_in_threadpool(classify_clothing_image, image)
+        return {"predictions": classifications, "top_prediction": top_prediction}
+    return await result_cache.get_or_compute(
+        make_cache_key("classification", image_bytes), compute, classification_flight
+    )
+
 @router.post("/classify")
-async def classify_clothing(file: UploadFile = File(...)):
+async def classify_clothing(file: UploadFile = File(...), if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
     """
     Classifica uma imagem de roupa e retorna as probabilidades
     
+    Resultados são cacheados por conteúdo da imagem e versão dos modelos
+    (headers ETag e X-Cache; If-None-Match retorna 304).
+    
     Args:
         file: Arquivo de imagem (JPG, PNG, etc.)
     
@@ -33,15 +57,16 @@ async def classify_clothing(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
     
     try:
-        # Ler e processar a imagem
+        # Ler a imagem
         image_data = await file.read()
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Garantir que a imagem seja RGB
-        image = ensure_rgb_image(image)
+        result_key = make_cache_key("classification", image_data)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
         
         # Classificar a imagem
-        classifications, top_prediction = classify_clothing_image(image)
+        classification, meta = await _classify_cached(image_data)
         
         # Resultado final
         result = {
@@ -49,17 +74,17 @@ async def classify_clothing(file: UploadFile = File(...)):
             "file_size": len(image_data),
             "content_type": file.content_type,
             "device_used": get_device_info(),
-            "predictions": classifications,
-            "top_prediction": top_prediction
+            "predictions": classification["predictions"],
+            "top_prediction": classification["top_prediction"]
         }
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=shape.apply(result), headers=shape.headers(meta))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
 @router.post("/classify/base64")
-async def classify_clothing_base64(image_data: Dict[str, str]):
+async def classify_clothing_base64(image_data: Dict[str, str], if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
     """
     Classifica uma imagem enviada em formato base64
     
@@ -75,26 +100,100 @@ async def classify_clothing_base64(image_data: Dict[str, str]):
     try:
         # Decodificar base64
         image_bytes = base64.b64decode(image_data["image"])
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Garantir que a imagem seja RGB
-        image = ensure_rgb_image(image)
+        result_key = make_cache_key("classification", image_bytes)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
         
         # Classificar a imagem
-        classifications, top_prediction = classify_clothing_image(image)
+        classification, meta = await _classify_cached(image_bytes)
         
         # Resultado final
         result = {
-            "predictions": classifications,
-            "top_prediction": top_prediction,
+            "predictions": classification["predictions"],
+            "top_prediction": classification["top_prediction"],
             "device_used": get_device_info()
         }
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=shape.apply(result), headers=shape.headers(meta))
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
+
+@router.post("/classify/raw")
+async def classify_clothing_raw(request: Request, if_none_match: Optional[str] = Header(None), shape: ResponseShape = Depends(response_shape)):
+    """
+    Classifica uma imagem enviada como corpo binário
+    
+    Alternativa a /classify/base64 sem o overhead de base64 e do parse JSON:
+    o corpo da requisição é a própria imagem (Content-Type image/* ou
+    application/octet-stream).
+    
+    Returns:
+        JSON com as classificações e probabilidades
+    """
+    try:
+        image_bytes, content_type = await read_raw_image_body(request)
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        result_key = make_cache_key("classification", image_bytes)
+        etag = shape.etag(etag_for(result_key))
+        # 304 só com o resultado ainda em cache (o servidor ainda tem a versão do cliente)
+        if etag_matches(if_none_match, etag) and await result_cache.contains(result_key):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        # Classificar a imagem
+        classification, meta = await _classify_cached(image_bytes)
+        
+        # Resultado final
+        result = {
+            "file_size": len(image_bytes),
+            "content_type": content_type,
+            "device_used": get_device_info(),
+            "predictions": classification["predictions"],
+            "top_prediction": classification["top_prediction"]
+        }
+        
+        return FastJSONResponse(content=shape.apply(result), headers=shape.headers(meta))
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar imagem: {str(e)}")
 
+@router.post("/classify/batch")
+async def classify_clothing_batch(request: Request):
+    """
+    Classifica várias imagens de roupa em uma única requisição
+    
+    Aceita multipart/form-data com vários campos "files" (ou um zip), um corpo
+    application/zip ou um corpo application/x-ndjson com {"image": "<base64>", "name": "..."}
+    por linha. As imagens são codificadas pelo CLIP em lote.
+    
+    Returns:
+        JSON com um resultado por imagem, na ordem de entrada (erros por item)
+    """
+    try:
+        items = await read_batch_request(request)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    try:
+        results = await run_in_threadpool(classify_batch, items)
+        return FastJSONResponse(content={
+            "device_used": get_device_info(),
+            "max_batch_size": MAX_BATCH_SIZE,
+            "summary": batch_summary(results),
+            "results": results
+        })
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao processar lote: {str(e)}")
+
 @router.post("/compatible-items")
 async def find_compatible_items(request_data: Dict):
     """
@@ -137,7 +236,7 @@ async def find_compatible_items(request_data: Dict):
             "device_used": get_device_info()
         }
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar itens compatíveis: {str(e)}")
@@ -176,7 +275,7 @@ async def find_color_compatibility(request_data: Dict):
             "device_used": get_device_info()
         }
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao buscar compatibilidade de cor: {str(e)}")
@@ -227,7 +326,7 @@ async def get_outfit_suggestions_endpoint(request_data: Dict):
             "device_used": get_device_info()
         }
         
-        return JSONResponse(content=result)
+        return FastJSONResponse(content=result)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao gerar sugestões de outfit: {str(e)}")
@@ -253,7 +352,7 @@ async def get_body_regions():
         "full_body": ["swimsuit"]
     }
     
-    return JSONResponse(content={
+    return FastJSONResponse(content={
         "body_regions": body_regions,
         "main_outfit_regions": ["torso", "legs", "feet"]
     })
@@ -271,7 +370,7 @@ async def get_available_colors():
         "pink", "purple", "orange", "navy", "beige", "cream", "maroon", "olive"
     ]
     
-    return JSONResponse(content={
+    return FastJSONResponse(content={
         "colors": colors,
         "total_colors": len(colors)
     }) 
\ No newline at end of file
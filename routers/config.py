@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
 from fastapi import APIRouter, HTTPException
+from starlette.concurrency import run_in_threadpool
 from typing import Dict
 
-from utils.body_parts_detector import set_margin_percentage, get_margin_percentage
+from utils.body_parts_detector import set_margin_percentage, get_margin_percentage, set_cascade_mode, get_cascade_mode
+from utils.detection_pool import get_detection_backend, start_detection_pool, stop_detection_pool, DETECTION_WORKERS
+from utils.single_flight import get_coalescing_stats, set_coalescing_enabled
+from utils.cache import get_cache_stats, set_caches_enabled, clear_caches
+from utils.crop_storage import crop_storage
+from utils.artifacts import get_artifact_stats
 
 router = APIRouter(prefix="/api/v1/config", tags=["Configuration"])
 
@@ -53,4 +59,202 @@ async def update_margin_config(margin_config: Dict[str, float]):
         "success": True,
         "margin_percentage": margin,
         "message": f"Margem configurada para {margin * 100}%"
-    } 
\ No newline at end of file
+    }
+
+@router.get("/cascade")
+async def get_cascade_config():
+    """
+    Retorna o estado do modo cascata de detecção
+    
+    Returns:
+        JSON com o estado do modo cascata
+    """
+    return {
+        "cascade_mode": get_cascade_mode(),
+        "description": "Detecta a pessoa com YOLO em baixa resolução e roda a pose apenas no recorte da pessoa"
+    }
+
+@router.put("/cascade")
+async def update_cascade_config(cascade_config: Dict[str, bool]):
+    """
+    Ativa ou desativa o modo cascata de detecção
+    
+    Args:
+        cascade_config: {"cascade_mode": true}
+    
+    Returns:
+        JSON com confirmação da configuração
+    """
+    if "cascade_mode" not in cascade_config:
+        raise HTTPException(
+            status_code=400, 
+            detail="Campo 'cascade_mode' é obrigatório"
+        )
+    
+    set_cascade_mode(cascade_config["cascade_mode"])
+    
+    return {
+        "success": True,
+        "cascade_mode": get_cascade_mode(),
+        "message": f"Modo cascata {'ativado' if get_cascade_mode() else 'desativado'}"
+    }
+
+@router.get("/detection-backend")
+async def get_detection_backend_config():
+    """
+    Retorna o backend de detecção ativo
+    
+    Returns:
+        JSON com o backend ("local" ou "process") e o número de workers
+    """
+    return get_detection_backend()
+
+@router.put("/detection-backend")
+async def update_detection_backend_config(backend_config: Dict):
+    """
+    Alterna o backend de detecção entre o processo da API e o pool de processos
+    
+    Args:
+        backend_config: {"backend": "process", "workers": 4} (workers é opcional)
+    
+    Returns:
+        JSON com o backend ativo
+    """
+    backend = backend_config.get("backend")
+    if backend not in ("local", "process"):
+        raise HTTPException(
+            status_code=400, 
+            detail="Campo 'backend' deve ser 'local' ou 'process'"
+        )
+    
+    if backend == "process":
+        workers = backend_config.get("workers", DETECTION_WORKERS)
+        if not isinstance(workers, int) or workers < 1:
+            raise HTTPException(status_code=400, detail="Campo 'workers' deve ser um inteiro positivo")
+        # A criação do pool carrega os modelos em cada worker; não bloqueia o event loop
+        await run_in_threadpool(start_detection_pool, workers)
+    else:
+        await run_in_threadpool(stop_detection_pool)
+    
+    return {
+        "success": True,
+        **get_detection_backend()
+    }
+
+@router.get("/coalescing")
+async def get_coalescing_config():
+    """
+    Retorna as métricas de coalescência de requisições idênticas
+    
+    Returns:
+        JSON com requisições, execuções e requisições agrupadas por operação
+    """
+    return {
+        "coalescing": get_coalescing_stats(),
+        "description": "Requisições idênticas (mesma imagem e parâmetros) em andamento compartilham uma única computação"
+    }
+
+@router.put("/coalescing")
+async def update_coalescing_config(coalescing_config: Dict[str, bool]):
+    """
+    Ativa ou desativa a coalescência de requisições
+    
+    Args:
+        coalescing_config: {"enabled": true}
+    
+    Returns:
+        JSON com confirmação da configuração
+    """
+    if "enabled" not in coalescing_config:
+        raise HTTPException(
+            status_code=400,
+            detail="Campo 'enabled' é obrigatório"
+        )
+    
+    set_coalescing_enabled(coalescing_config["enabled"])
+    
+    return {
+        "success": True,
+        "enabled": coalescing_config["enabled"],
+        "message": f"Coalescência {'ativada' if coalescing_config['enabled'] else 'desativada'}"
+    }
+
+@router.get("/cache")
+async def get_cache_config():
+    """
+    Retorna as métricas dos caches de resultados e de embeddings
+    
+    Returns:
+        JSON com acertos, falhas e ocupação de cada cache e do backend compartilhado
+    """
+    return {
+        "cache": get_cache_stats(),
+        "description": "Caches de resultados e de embeddings por conteúdo da imagem, parâmetros e versão dos modelos"
+    }
+
+@router.put("/cache")
+async def update_cache_config(cache_config: Dict[str, bool]):
+    """
+    Ativa ou desativa os caches de resultados e de embeddings
+    
+    Args:
+        cache_config: {"enabled": true}
+    
+    Returns:
+        JSON com confirmação da configuração
+    """
+    if "enabled" not in cache_config:
+        raise HTTPException(
+            status_code=400,
+            detail="Campo 'enabled' é obrigatório"
+        )
+    
+    set_caches_enabled(cache_config["enabled"])
+    
+    return {
+        "success": True,
+        "enabled": cache_config["enabled"],
+        "message": f"Cache {'ativado' if cache_config['enabled'] else 'desativado'}"
+    }
+
+@router.delete("/cache")
+async def clear_cache():
+    """
+    Remove todas as entradas dos caches (incluindo o backend compartilhado)
+    
+    Returns:
+        JSON com confirmação
+    """
+    await run_in_threadpool(clear_caches)
+    return {
+        "success": True,
+        "message": "Caches limpos"
+    }
+
+@router.get("/storage")
+async def get_storage_config():
+    """
+    Retorna as métricas do armazenamento de recortes
+    
+    Returns:
+        JSON com gravações pendentes, gravadas, removidas, renderizações sob demanda e a última limpeza
+    """
+    return {
+        "storage": crop_storage.stats(),
+        "artifacts": get_artifact_stats(),
+        "description": "Recortes renderizados no primeiro acesso, gravados em segundo plano e removidos por TTL e limite de tamanho"
+    }
+
+@router.post("/storage/sweep")
+async def sweep_storage():
+    """
+    Executa a limpeza dos recortes expirados imediatamente
+    
+    Returns:
+        JSON com o resumo da limpeza
+    """
+    summary = await run_in_threadpool(crop_storage.sweep)
+    return {
+        "success": True,
+        "sweep": summary
+    }
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query, Request
+import os
+import tempfile
+import logging
+from typing import Dict
+
+from utils.batch_processing import read_batch_request, analyze_batch, classify_batch, batch_summary, BatchTooLargeError
+from utils.job_queue import get_job_queue, register_job_handler, JOB_PRIORITIES, FINISHED_STATUSES
+from utils.video_analyzer import analyze_video, VIDEO_MOTION_THRESHOLD, VIDEO_EMBEDDING_THRESHOLD, VIDEO_MAX_FRAMES
+from utils.serialization import FastJSONResponse
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1/jobs", tags=["Jobs"])
+
+PRIORITY_PATTERN = "^(" + "|".join(JOB_PRIORITIES) + ")$"
+
+def _run_analysis_job(payload: Dict) -> Dict:
+    """Análise completa de uma imagem"""
+    item = {"name": payload["name"], "data": payload["image"], "error": None}
+    result = analyze_batch([item], save_parts=payload["save_parts"])[0]
+    result.pop("index", None)
+    return result
+
+def _run_batch_analysis_job(payload: Dict) -> Dict:
+    """Análise completa de um lote de imagens"""
+    results = analyze_batch(payload["items"], save_parts=payload["save_parts"])
+    return {"summary": batch_summary(results), "results": results}
+
+def _run_batch_classify_job(payload: Dict) -> Dict:
+    """Classificação de um lote de imagens"""
+    results = classify_batch(payload["items"])
+    return {"summary": batch_summary(results), "results": results}
+
+def _run_video_job(payload: Dict) -> Dict:
+    """Análise de outfit em vídeo"""
+    # O OpenCV precisa de um caminho em disco para decodificar o vídeo
+    with tempfile.NamedTemporaryFile(suffix=payload["suffix"], delete=False) as tmp:
+        tmp.write(payload["video"])
+        tmp_path = tmp.name
+    try:
+        return analyze_video(tmp_path, **payload["options"])
+    finally:
+        os.remove(tmp_path)
+
+register_job_handler("analysis", _run_analysis_job)
+register_job_handler("batch_analysis", _run_batch_analysis_job)
+register_job_handler("batch_classify", _run_batch_classify_job)
+register_job_handler("video", _run_video_job)
+
+def _submit(kind: str, payload: Dict, priority: str) -> FastJSONResponse:
+    """Enfileira o job e retorna 202 com o ID para consulta"""
+    queue = get_job_queue()
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Fila de jobs não está ativa")
+    try:
+        job_id = queue.submit(kind, payload, priority)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    logger.info(f"Job {job_id} ({kind}) enfileirado com prioridade {priority}")
+    return FastJSONResponse(status_code=202, content={
+        "job_id": job_id,
+        "kind": kind,
+        "status": "queued",
+        "priority": priority,
+        "status_url": f"/api/v1/jobs/{job_id}"
+    })
+
+@router.post("/analysis")
+async def submit_analysis_job(
+    file: UploadFile = File(...),
+    priority: str = Query("normal", pattern=PRIORITY_PATTERN),
+    save_parts: bool = Query(True, description="Salva os recortes das partes (URLs em /api/v1/static/body-parts)")
+):
+    """
+    Enfileira uma análise completa
+
+    Returns:
+        202 com o job_id; o resultado é consultado em GET /api/v1/jobs/{job_id}
+    """
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser uma imagem")
+    image_data = await file.read()
+    if len(image_data) == 0:
+        raise HTTPException(status_code=400, detail="Arquivo está vazio")
+    return _submit("analysis", {"name": file.filename, "image": image_data, "save_parts": save_parts}, priority)
+
+@router.post("/batch/analysis")
+async def submit_batch_analysis_job(
+    request: Request,
+    priority: str = Query("normal", pattern=PRIORITY_PATTERN),
+    save_parts: bool = Query(False, description="Salva os recortes das partes (URLs em /api/v1/static/body-parts)")
+):
+    """
+    Enfileira a análise completa de um lote (mesmos formatos de /api/v1/analysis/batch)
+
+    Returns:
+        202 com o job_id
+    """
+    try:
+        items = await read_batch_request(request)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _submit("batch_analysis", {"items": items, "save_parts": save_parts}, priority)
+
+@router.post("/batch/classify")
+async def submit_batch_classify_job(
+    request: Request,
+    priority: str = Query("normal", pattern=PRIORITY_PATTERN)
+):
+    """
+    Enfileira a classificação de um lote (mesmos formatos de /api/v1/clothing/classify/batch)
+
+    Returns:
+        202 com o job_id
+    """
+    try:
+        items = await read_batch_request(request)
+    except BatchTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _submit("batch_classify", {"items": items}, priority)
+
+@router.post("/video")
+async def submit_video_job(
+    file: UploadFile = File(...),
+    priority: str = Query("normal", pattern=PRIORITY_PATTERN),
+    frame_stride: int = Query(1, ge=1),
+    motion_threshold: float = Query(VIDEO_MOTION_THRESHOLD, ge=0.0),
+    embedding_threshold: float = Query(VIDEO_EMBEDDING_THRESHOLD, ge=0.0, le=1.0),
+    max_frames: int = Query(VIDEO_MAX_FRAMES, ge=1)
+):
+    """
+    Enfileira a análise de um vídeo (mesmos parâmetros de /api/v1/video/analyze)
+
+    Returns:
+        202 com o job_id
+    """
+    if file.content_type and not (file.content_type.startswith('video/') or file.content_type == 'application/octet-stream'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser um vídeo")
+    video_data = await file.read()
+    if len(video_data) == 0:
+        raise HTTPException(status_code=400, detail="Arquivo está vazio")
+    return _submit("video", {
+        "video": video_data,
+        "suffix": os.path.splitext(file.filename or "")[1] or ".mp4",
+        "options": {
+            "frame_stride": frame_stride,
+            "motion_threshold": motion_threshold,
+            "embedding_threshold": embedding_threshold,
+            "max_frames": max_frames
+        }
+    }, priority)
+
+@router.get("")
+async def get_jobs_stats():
+    """
+    Estado da fila de jobs
+
+    Returns:
+        Número de workers e contagem de jobs por estado
+    """
+    queue = get_job_queue()
+    if queue is None:
+        return FastJSONResponse(content={"enabled": False})
+    return FastJSONResponse(content={"enabled": True, **queue.stats()})
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    """
+    Consulta o estado de um job (e o resultado, quando concluído)
+
+    Args:
+        job_id: ID retornado na submissão
+    """
+    queue = get_job_queue()
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Fila de jobs não está ativa")
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado")
+    return FastJSONResponse(content=job)
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    """
+    Cancela um job
+
+    Jobs na fila são cancelados imediatamente; jobs em execução têm o
+    resultado descartado ao terminar.
+    """
+    queue = get_job_queue()
+    if queue is None:
+        raise HTTPException(status_code=503, detail="Fila de jobs não está ativa")
+    status = queue.cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if status in FINISHED_STATUSES and status != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job já finalizado ({status})")
+    return FastJSONResponse(content={
+        "job_id": job_id,
+        "status": status,
+        "cancel_requested": status == "running"
+    })
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+
+from utils.metrics import render_metrics, CONTENT_TYPE_LATEST
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics")
+async def get_metrics():
+    """
+    Métricas no formato de exposição do Prometheus
+
+    Contagem e latência das requisições por rota, duração de cada estágio
+    (decode, pose, yolo, crop, clip_encode, color, jpeg_encode, jpeg_write,
+    serialize), tamanho dos lotes, profundidade das filas, taxa de acerto dos
+    caches, tempo de carregamento dos modelos e memória do processo.
+
+    Returns:
+        Texto no formato 0.0.4
+    """
+    # Os coletores consultam a fila de jobs (SQLite): fora do event loop
+    body = await run_in_threadpool(render_metrics)
+    return Response(content=body, media_type=CONTENT_TYPE_LATEST)
@@ -1,29 +1,125 @@
 # -*- coding: utf-8 -*-
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
 import os
+import re
+from typing import Optional
+
+from utils.crop_storage import crop_storage, is_valid_key
+from utils.artifacts import render_artifact, is_internal_key, artifact_etag
+from utils.cache import etag_matches
+from utils.single_flight import artifact_flight
 
 router = APIRouter(prefix="/api/v1/static", tags=["Static Files"])
 
-# Configuração de pastas estáticas
-STATIC_DIR = "static"
-BODY_PARTS_DIR = os.path.join(STATIC_DIR, "body_parts")
+# Artefatos com nome derivado do conteúdo nunca mudam: cache de 1 ano
+IMMUTABLE_CACHE_CONTROL = os.getenv("STATIC_IMMUTABLE_CACHE_CONTROL", "public, max-age=31536000, immutable")
+# Arquivos antigos (nome sem hash) podem ser sobrescritos
+DEFAULT_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=3600")
+# Com nginx na frente, entrega o arquivo por X-Accel-Redirect (sendfile no proxy)
+STATIC_ACCEL_REDIRECT_PREFIX = os.getenv("STATIC_ACCEL_REDIRECT_PREFIX", "")
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def _bytes_response(data: bytes, headers: dict, range_header: Optional[str]) -> Response:
+    """
+    Resposta para um artefato em memória, com suporte a um intervalo (Range)
+
+    Args:
+        data: Bytes JPEG
+        headers: Headers de cache
+        range_header: Header Range da requisição
+
+    Returns:
+        200 com o conteúdo, 206 com o intervalo ou 416 se o intervalo for inválido
+    """
+    headers = {**headers, "Accept-Ranges": "bytes"}
+    match = _RANGE_PATTERN.match(range_header.strip()) if range_header else None
+    if match is None or match.groups() == ("", ""):
+        # Sem Range, ou múltiplos intervalos: envia o arquivo inteiro
+        return Response(content=data, media_type="image/jpeg", headers=headers)
+
+    size = len(data)
+    first, last = match.groups()
+    if first == "":
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return Response(
+        content=data[start:end + 1],
+        status_code=206,
+        media_type="image/jpeg",
+        headers={**headers, "Content-Range": f"bytes {start}-{end}/{size}"}
+    )
 
-@router.get("/body-parts/{filename}")
-async def get_body_part_image_static(filename: str):
+@router.get("/body-parts/{key:path}")
+async def get_body_part_image_static(
+    key: str,
+    if_none_match: Optional[str] = Header(None),
+    range_header: Optional[str] = Header(None, alias="range")
+):
     """
-    Retorna uma imagem salva de parte do corpo
-    
+    Retorna uma imagem de parte do corpo ou a visualização de uma análise
+
+    Na primeira vez que a URL é pedida, o JPEG é renderizado a partir do frame
+    e das bounding boxes da sessão e guardado no armazenamento; os acessos
+    seguintes servem o arquivo gravado.
+
+    Os nomes são derivados do conteúdo, então as respostas têm ETag forte e
+    Cache-Control imutável; If-None-Match retorna 304 (sem enviar o arquivo)
+    quando o artefato existe e Range retorna 206 com o intervalo pedido.
+
     Args:
-        filename: Nome do arquivo da imagem
-    
+        key: Chave da imagem (ex: 20261019/a3/ab12cd34/torso_<hash>.jpg)
+
     Returns:
-        Imagem salva
+        Imagem JPEG
     """
-    filepath = os.path.join(BODY_PARTS_DIR, filename)
-    
-    if not os.path.exists(filepath):
+    if not is_valid_key(key) or is_internal_key(key):
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+    etag = artifact_etag(key)
+    # 304 só depois de confirmar que o artefato existe (o nome sozinho não garante)
+    not_modified = etag is not None and etag_matches(if_none_match, etag)
+    cache_headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL if etag is not None else DEFAULT_CACHE_CONTROL}
+    if etag is not None:
+        cache_headers["ETag"] = etag
+
+    # Backend local: entrega o arquivo do disco (Range tratado pelo FileResponse, starlette>=0.39)
+    filepath = crop_storage.local_path(key)
+    stat_result = None
+    if filepath is not None:
+        try:
+            stat_result = os.stat(filepath)
+        except FileNotFoundError:
+            # Removido pelo janitor depois da verificação: segue para leitura, renderização ou 404
+            stat_result = None
+    if stat_result is not None:
+        if not_modified:
+            return Response(status_code=304, headers=cache_headers)
+        if STATIC_ACCEL_REDIRECT_PREFIX:
+            return Response(media_type="image/jpeg", headers={
+                **cache_headers, "X-Accel-Redirect": f"{STATIC_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{key}"
+            })
+        if etag is None:
+            # Arquivos antigos: ETag pelo mtime e tamanho (o mesmo do FileResponse)
+            response = FileResponse(filepath, media_type="image/jpeg", stat_result=stat_result)
+            if etag_matches(if_none_match, response.headers["etag"]):
+                return Response(status_code=304, headers={"ETag": response.headers["etag"], **cache_headers})
+            response.headers.update(cache_headers)
+            return response
+        return FileResponse(filepath, media_type="image/jpeg", headers=cache_headers, stat_result=stat_result)
+
+    # Gravação pendente ou backend remoto
+    data = await run_in_threadpool(crop_storage.read, key)
+    if data is None:
+        # Primeiro acesso: renderiza (acessos simultâneos compartilham a renderização)
+        data, _ = await artifact_flight.do(key, lambda: run_in_threadpool(render_artifact, key))
+    if data is None:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
-    
-    # Retorna o arquivo estático
-    return FileResponse(filepath, media_type="image/jpeg") 
\ No newline at end of file
+    if not_modified:
+        return Response(status_code=304, headers=cache_headers)
+    return _bytes_response(data, cache_headers, range_header)
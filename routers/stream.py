@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import time
+import logging
+from typing import Optional, Tuple
+
+from utils.stream_session import StreamSession
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1/stream", tags=["Live Stream"])
+
+class LatestFrameSlot:
+    """
+    Guarda apenas o frame mais recente
+
+    Quando o pipeline está ocupado, um novo frame substitui o anterior em vez de
+    entrar numa fila, então nunca se processa um frame velho.
+    """
+
+    def __init__(self):
+        self._frame: Optional[Tuple[int, bytes, float]] = None
+        self._event = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame_bytes: bytes):
+        """Substitui o frame pendente (contando o descarte, se houver)"""
+        if self._frame is not None:
+            self.dropped += 1
+        self.received += 1
+        self._frame = (self.received, frame_bytes, time.perf_counter())
+        self._event.set()
+
+    async def take(self) -> Tuple[int, bytes, float]:
+        """Aguarda e retira o frame mais recente"""
+        await self._event.wait()
+        self._event.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+@router.websocket("/ws")
+async def live_stream_analysis(websocket: WebSocket):
+    """
+    Análise em tempo real de um feed de câmera
+
+    O cliente envia frames JPEG como mensagens binárias. Enquanto o pipeline
+    está ocupado, só o frame mais recente é mantido. Cada resultado é enviado
+    como JSON com o id do frame, a latência e o nível de degradação.
+    """
+    await websocket.accept()
+    slot = LatestFrameSlot()
+    session = None
+    receiver = None
+
+    async def receive_frames():
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes"):
+                slot.put(message["bytes"])
+
+    try:
+        # A criação do grafo do MediaPipe é bloqueante
+        session = await run_in_threadpool(StreamSession)
+        await websocket.send_json({"type": "ready"})
+        receiver = asyncio.create_task(receive_frames())
+
+        while True:
+            take = asyncio.create_task(slot.take())
+            done, _ = await asyncio.wait({take, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if receiver in done:
+                take.cancel()
+                receiver.result()  # Propaga a desconexão
+            frame_id, frame_bytes, received_at = take.result()
+
+            queue_ms = (time.perf_counter() - received_at) * 1000
+            try:
+                result = await run_in_threadpool(session.process_frame, frame_bytes)
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "frame_id": frame_id, "detail": str(e)})
+                continue
+
+            await websocket.send_json({
+                "type": "result",
+                "frame_id": frame_id,
+                "latency_ms": {
+                    "queue": round(queue_ms, 2),
+                    "processing": result.pop("processing_ms"),
+                    "total": round((time.perf_counter() - received_at) * 1000, 2)
+                },
+                "frames_received": slot.received,
+                "frames_dropped": slot.dropped,
+                "degraded": result["degradation_level"] > 0,
+                **result
+            })
+
+    except WebSocketDisconnect:
+        logger.info(f"Stream encerrado: {slot.received} frames recebidos, {slot.dropped} descartados")
+    except Exception as e:
+        logger.error(f"Erro no stream: {e}")
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        if receiver is not None:
+            receiver.cancel()
+        if session is not None:
+            await run_in_threadpool(session.close)
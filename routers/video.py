@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+from fastapi import APIRouter, File, UploadFile, HTTPException, Query
+from starlette.concurrency import run_in_threadpool
+import os
+import shutil
+import tempfile
+import logging
+
+from utils.clip_classifier import get_device_info
+from utils.video_analyzer import (
+    analyze_video,
+    VIDEO_MOTION_THRESHOLD,
+    VIDEO_EMBEDDING_THRESHOLD,
+    VIDEO_MAX_FRAMES
+)
+from utils.serialization import FastJSONResponse
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/api/v1/video", tags=["Video Analysis"])
+
+@router.post("/analyze")
+async def analyze_video_outfit(
+    file: UploadFile = File(...),
+    frame_stride: int = Query(1, ge=1, description="Processa um a cada N frames"),
+    motion_threshold: float = Query(VIDEO_MOTION_THRESHOLD, ge=0.0, description="Movimento mínimo (0-255) para candidato a keyframe"),
+    embedding_threshold: float = Query(VIDEO_EMBEDDING_THRESHOLD, ge=0.0, le=1.0, description="Similaridade CLIP acima da qual o keyframe é descartado"),
+    max_frames: int = Query(VIDEO_MAX_FRAMES, ge=1, description="Número máximo de frames lidos")
+):
+    """
+    Analisa o outfit em um vídeo curto (ex: vídeo de prova de roupa)
+
+    A pose roda em modo de rastreamento em todos os frames amostrados; YOLO e
+    CLIP rodam apenas nos keyframes escolhidos por movimento/mudança de embedding.
+
+    Args:
+        file: Arquivo de vídeo (MP4, MOV, AVI, etc.)
+
+    Returns:
+        JSON com a classificação e cor agregadas por parte e a linha do tempo dos keyframes
+    """
+    if file.content_type and not (file.content_type.startswith('video/') or file.content_type == 'application/octet-stream'):
+        raise HTTPException(status_code=400, detail="Arquivo deve ser um vídeo")
+
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    tmp_path = None
+    try:
+        # O OpenCV precisa de um caminho em disco para decodificar o vídeo
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            tmp_path = tmp.name
+            await run_in_threadpool(shutil.copyfileobj, file.file, tmp)
+        file_size = os.path.getsize(tmp_path)
+        if file_size == 0:
+            raise HTTPException(status_code=400, detail="Arquivo está vazio")
+
+        logger.info(f"Analisando vídeo {file.filename} ({file_size} bytes)")
+        result = await run_in_threadpool(
+            analyze_video,
+            tmp_path,
+            frame_stride=frame_stride,
+            motion_threshold=motion_threshold,
+            embedding_threshold=embedding_threshold,
+            max_frames=max_frames
+        )
+        result.update({
+            "filename": file.filename,
+            "file_size": file_size,
+            "content_type": file.content_type,
+            "device_used": get_device_info()
+        })
+        return FastJSONResponse(content=result)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro ao analisar vídeo: {e}")
+        raise HTTPException(status_code=500, detail=f"Erro ao processar vídeo: {str(e)}")
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
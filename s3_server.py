@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servidor local compatível com o subconjunto da API S3 usado pelo S3Backend
+(utils/crop_storage.py).
+
+Stand-in para testes e ambientes sem um bucket: PUT/GET/HEAD/DELETE de objetos
+e ListObjectsV2, endereçamento por caminho (/bucket/chave), sem autenticação.
+Os objetos ficam em disco, em --data-dir. Uso:
+
+    python s3_server.py --port 9000 --data-dir data/s3
+
+e nas réplicas da API:
+
+    CROP_STORAGE_BACKEND=s3 CROP_S3_ENDPOINT_URL=http://localhost:9000 \\
+    AWS_ACCESS_KEY_ID=local AWS_SECRET_ACCESS_KEY=local AWS_DEFAULT_REGION=us-east-1
+"""
+import argparse
+import hashlib
+import os
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.sax.saxutils import escape
+
+MAX_KEYS = 1000
+
+
+def decode_aws_chunked(body: bytes) -> bytes:
+    """Remove o enquadramento aws-chunked (tamanho;assinatura CRLF dados CRLF ...)"""
+    data = bytearray()
+    position = 0
+    while position < len(body):
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            break
+        start = line_end + 2
+        data += body[start:start + size]
+        position = start + size + 2
+    return bytes(data)
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    """Atende as operações de objeto e a listagem de um bucket"""
+
+    data_dir = "data/s3"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _split_path(self):
+        parsed = urlparse(self.path)
+        parts = unquote(parsed.path).lstrip("/").split("/", 1)
+        bucket = parts[0]
+        key = parts[1] if len(parts) > 1 else ""
+        return bucket, key, parse_qs(parsed.query)
+
+    def _object_path(self, bucket: str, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.data_dir, bucket, *key.split("/")))
+        if not path.startswith(os.path.abspath(os.path.join(self.data_dir, bucket)) + os.sep):
+            raise ValueError("Chave inválida")
+        return path
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/xml", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status: int, code: str, message: str):
+        body = f"<?xml version=\"1.0\" encoding=\"UTF-8\"?><Error><Code>{code}</Code><Message>{escape(message)}</Message></Error>"
+        self._send(status, body.encode("utf-8"))
+
+    def do_PUT(self):
+        bucket, key, _ = self._split_path()
+        length = int(self.headers.get("Content-Length", "0"))
+        body = self.rfile.read(length)
+        if "aws-chunked" in self.headers.get("Content-Encoding", "") or self.headers.get("x-amz-decoded-content-length"):
+            body = decode_aws_chunked(body)
+        if not key:
+            # Criação de bucket
+            os.makedirs(os.path.join(self.data_dir, bucket), exist_ok=True)
+            self._send(200)
+            return
+        try:
+            path = self._object_path(bucket, key)
+        except ValueError as e:
+            self._error(400, "InvalidArgument", str(e))
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        self._send(200, headers={"ETag": '"' + hashlib.md5(body).hexdigest() + '"'})
+
+    def do_GET(self):
+        bucket, key, query = self._split_path()
+        if not key:
+            self._list(bucket, query)
+            return
+        try:
+            path = self._object_path(bucket, key)
+            with open(path, "rb") as f:
+                body = f.read()
+        except (ValueError, FileNotFoundError, IsADirectoryError):
+            self._error(404, "NoSuchKey", "The specified key does not exist.")
+            return
+        modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+        self._send(200, body, "application/octet-stream", {
+            "Last-Modified": modified.strftime("%a, %d %b %Y %H:%M:%S GMT"),
+            "ETag": '"' + hashlib.md5(body).hexdigest() + '"'
+        })
+
+    do_HEAD = do_GET
+
+    def do_DELETE(self):
+        bucket, key, _ = self._split_path()
+        try:
+            path = self._object_path(bucket, key)
+            os.remove(path)
+        except (ValueError, FileNotFoundError):
+            pass
+        self._send(204)
+
+    def _list(self, bucket: str, query):
+        """ListObjectsV2 com prefixo e paginação por continuation-token"""
+        prefix = query.get("prefix", [""])[0]
+        start_after = query.get("continuation-token", query.get("start-after", [""]))[0]
+        max_keys = min(int(query.get("max-keys", [MAX_KEYS])[0]), MAX_KEYS)
+        root = os.path.join(self.data_dir, bucket)
+        keys = []
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, root).replace(os.sep, "/")
+                if key.startswith(prefix) and key > start_after:
+                    keys.append((key, path))
+        keys.sort()
+        page, truncated = keys[:max_keys], len(keys) > max_keys
+
+        contents = []
+        for key, path in page:
+            stat = os.stat(path)
+            modified = datetime.fromtimestamp(stat.st_mtime, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            contents.append(
+                f"<Contents><Key>{escape(key)}</Key><LastModified>{modified}</LastModified>"
+                f"<Size>{stat.st_size}</Size><StorageClass>STANDARD</StorageClass></Contents>"
+            )
+        next_token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ""
+        body = (
+            "<?xml version=\"1.0\" encoding=\"UTF-8\"?>"
+            "<ListBucketResult xmlns=\"http://s3.amazonaws.com/doc/2006-03-01/\">"
+            f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+            f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+            f"{next_token}{''.join(contents)}</ListBucketResult>"
+        )
+        self._send(200, body.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor S3 local (stand-in do armazenamento de recortes)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--data-dir", default=os.path.join("data", "s3"))
+    args = parser.parse_args()
+    S3Handler.data_dir = args.data_dir
+    os.makedirs(args.data_dir, exist_ok=True)
+    server = ThreadingHTTPServer((args.host, args.port), S3Handler)
+    print(f"✅ Servidor S3 local em {args.host}:{args.port} (dados em {args.data_dir})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("🛑 Servidor S3 local encerrado")
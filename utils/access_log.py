@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Log de acesso estruturado e de baixo custo.
+
+Middleware ASGI puro: não bufferiza nem decodifica corpos. Cada requisição gera
+uma linha JSON com método, caminho, status, latência e bytes trafegados. Uma
+fração configurável das requisições inclui uma prévia do corpo, capturada
+enquanto ele passa pelo receive (sem cópia do corpo inteiro). A emissão dos
+logs sai do caminho da requisição por um QueueHandler.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Optional
+
+# Configuração via variáveis de ambiente
+ACCESS_LOG_ENABLED = os.getenv("ACCESS_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+ACCESS_LOG_BODY_SAMPLE_RATE = float(os.getenv("ACCESS_LOG_BODY_SAMPLE_RATE", "0.0"))
+ACCESS_LOG_BODY_PREVIEW_BYTES = int(os.getenv("ACCESS_LOG_BODY_PREVIEW_BYTES", "256"))
+ACCESS_LOG_SKIP_PATHS = tuple(path for path in os.getenv("ACCESS_LOG_SKIP_PATHS", "").split(",") if path)
+
+# Tipos de conteúdo cuja prévia é legível; os demais registram apenas o tamanho
+_TEXT_CONTENT_TYPES = ("application/json", "text/", "application/x-ndjson", "application/x-www-form-urlencoded")
+
+access_logger = logging.getLogger("access")
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def start_access_logging(stream=None) -> logging.Logger:
+    """
+    Configura o logger de acesso com emissão em uma thread separada
+
+    Args:
+        stream: Destino das linhas (padrão: stdout)
+
+    Returns:
+        Logger de acesso
+    """
+    global _listener
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        access_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+        access_logger.setLevel(logging.INFO)
+        access_logger.propagate = False
+    return access_logger
+
+
+def stop_access_logging():
+    """Descarrega a fila e encerra a thread de emissão"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _header(scope, name: bytes) -> str:
+    """Lê um header da requisição sem montar o dicionário inteiro"""
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+class AccessLogMiddleware:
+    """Middleware ASGI que registra uma linha JSON por requisição HTTP"""
+
+    def __init__(self, app, sample_rate: float = ACCESS_LOG_BODY_SAMPLE_RATE,
+                 preview_bytes: int = ACCESS_LOG_BODY_PREVIEW_BYTES,
+                 skip_paths: tuple = ACCESS_LOG_SKIP_PATHS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.preview_bytes = preview_bytes
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ACCESS_LOG_ENABLED or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        content_type = _header(scope, b"content-type")
+        capture_preview = self.sample_rate > 0 and random.random() < self.sample_rate
+        state = {"status": None, "request_bytes": 0, "response_bytes": 0, "preview": bytearray()}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                state["request_bytes"] += len(body)
+                if capture_preview and len(state["preview"]) < self.preview_bytes:
+                    state["preview"] += body[:self.preview_bytes - len(state["preview"])]
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["response_bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except Exception as e:
+            error = e
+            if state["status"] is None:
+                state["status"] = 500
+                body = json.dumps({
+                    "error": "Internal server error",
+                    "detail": str(e),
+                    "request_info": {"method": scope["method"], "path": scope["path"]}
+                }).encode("utf-8")
+                await send({
+                    "type": "http.response.start",
+                    "status": 500,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                })
+                await send({"type": "http.response.body", "body": body})
+                state["response_bytes"] = len(body)
+            else:
+                raise
+        finally:
+            record = {
+                "ts": round(time.time(), 3),
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": state["status"],
+                "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                "request_bytes": state["request_bytes"],
+                "response_bytes": state["response_bytes"],
+                "client": scope["client"][0] if scope.get("client") else None
+            }
+            if scope.get("query_string"):
+                record["query"] = scope["query_string"].decode("latin-1")
+            if error is not None:
+                record["error"] = f"{type(error).__name__}: {error}"
+            if capture_preview and state["request_bytes"]:
+                record["content_type"] = content_type
+                if content_type.startswith(_TEXT_CONTENT_TYPES):
+                    record["body_preview"] = state["preview"].decode("utf-8", errors="replace")
+                else:
+                    record["body_preview"] = f"<{content_type or 'binário'}: {state['request_bytes']} bytes>"
+            access_logger.info(json.dumps(record, ensure_ascii=False))
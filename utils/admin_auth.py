@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Autorização dos recursos administrativos (profiling e diagnóstico).
+
+Os endpoints e parâmetros administrativos exigem o header X-Admin-Token igual
+a ADMIN_TOKEN. Sem ADMIN_TOKEN configurado eles ficam desabilitados.
+"""
+import hmac
+import os
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+# Configuração via variáveis de ambiente
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """
+    Verifica o token administrativo (comparação em tempo constante)
+
+    Args:
+        token: Valor do header X-Admin-Token
+
+    Returns:
+        True se ADMIN_TOKEN estiver configurado e o token conferir
+    """
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8"))
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Dependência FastAPI dos endpoints administrativos"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Recursos administrativos desabilitados (defina ADMIN_TOKEN)")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=401, detail="Token administrativo inválido")
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Recortes e visualizações renderizados sob demanda.
+
+A análise não codifica nem grava os JPEGs das partes: registra apenas a
+imagem original da sessão (o frame) e as bounding boxes em um manifesto. O
+JPEG é renderizado na primeira vez que a URL é pedida
+(routers/static_files.py) e então guardado no armazenamento de recortes, de
+onde é servido nas próximas vezes.
+
+Layout no armazenamento (utils/crop_storage.py), uma pasta por sessão:
+
+    AAAAMMDD/hh/<session_id>/manifest.json
+    AAAAMMDD/hh/<session_id>/frame          (bytes originais da imagem)
+    AAAAMMDD/hh/<session_id>/<rótulo>_<hash>.jpg (criado no primeiro acesso)
+
+O nome de cada artefato é derivado do conteúdo (hash do frame, da bounding
+box e da qualidade do JPEG): a mesma URL sempre tem os mesmos bytes, o que
+permite ETag forte e cache imutável nos navegadores e na CDN.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from utils.crop_storage import crop_storage, crop_url, encode_jpeg, CROP_JPEG_QUALITY
+from utils.image_utils import decode_image
+
+# Configuração via variáveis de ambiente
+LAZY_ARTIFACTS = os.getenv("LAZY_ARTIFACTS", "true").lower() in ("1", "true", "yes")
+ARTIFACT_SESSION_CACHE = int(os.getenv("ARTIFACT_SESSION_CACHE", "8"))
+
+MANIFEST_NAME = "manifest.json"
+FRAME_NAME = "frame"
+
+# Sufixo dos nomes derivados do conteúdo: <rótulo>_<20 hex>.jpg
+_DIGEST_SIZE = 20
+
+
+def session_prefix(session_id: str, when: Optional[datetime] = None) -> str:
+    """
+    Pasta da sessão, particionada por data e hash
+
+    Args:
+        session_id: ID da sessão
+        when: Data da partição (padrão: agora)
+
+    Returns:
+        Prefixo "AAAAMMDD/hh/session_id"
+    """
+    day = (when or datetime.now()).strftime("%Y%m%d")
+    shard = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:2]
+    return f"{day}/{shard}/{session_id}"
+
+
+def is_internal_key(key: str) -> bool:
+    """Manifesto e frame não são servidos pela rota de arquivos estáticos"""
+    return key.rsplit("/", 1)[-1] in (MANIFEST_NAME, FRAME_NAME)
+
+
+def artifact_etag(key: str) -> Optional[str]:
+    """
+    ETag forte de um artefato, obtido do próprio nome (sem ler o arquivo)
+
+    Args:
+        key: Chave do artefato
+
+    Returns:
+        ETag ou None se o nome não for derivado do conteúdo
+    """
+    name = key.rsplit("/", 1)[-1]
+    stem, _, extension = name.rpartition(".")
+    digest = stem.rpartition("_")[2]
+    if extension != "jpg" or len(digest) != _DIGEST_SIZE or any(c not in "0123456789abcdef" for c in digest):
+        return None
+    return f'"{digest}"'
+
+
+def render_spec(image: Image.Image, spec: Dict) -> Image.Image:
+    """
+    Renderiza um artefato a partir do frame
+
+    Args:
+        image: Frame da sessão (RGB)
+        spec: Entrada do manifesto ({"kind": "crop", "part_name", "bbox"} ou
+            {"kind": "visualization", "body_parts": {nome: bbox}})
+
+    Returns:
+        Imagem PIL do artefato
+    """
+    from utils.body_parts_detector import detector
+    if spec["kind"] == "crop":
+        detection = {"success": True, "body_parts": {spec["part_name"]: {"bbox": spec["bbox"]}}}
+        return detector.crop_body_part(image, detection, spec["part_name"])
+    if spec["kind"] == "visualization":
+        body_parts = {name: {"bbox": bbox} for name, bbox in spec["body_parts"].items()}
+        return detector.render_body_parts_visualization(image, {"body_parts": body_parts})
+    raise ValueError(f"Tipo de artefato desconhecido: {spec['kind']}")
+
+
+class ArtifactSession:
+    """Frame e manifesto dos artefatos de uma análise"""
+
+    def __init__(self, image: Image.Image, frame: Optional[bytes] = None, session_id: Optional[str] = None):
+        """
+        Inicia a sessão
+
+        Args:
+            image: Imagem analisada (RGB)
+            frame: Bytes originais da imagem (evita recodificar o frame)
+            session_id: ID da sessão (padrão: gerado)
+        """
+        self.session_id = session_id or str(uuid.uuid4())[:8]
+        self.prefix = session_prefix(self.session_id)
+        self.image = image
+        self.frame = frame
+        self.manifest = {"session_id": self.session_id, "created": time.time(), "artifacts": {}}
+        self._committed = False
+        source = frame if frame is not None else image.tobytes()
+        self.frame_digest = hashlib.sha256(source).hexdigest()
+        session_registry.remember(self)
+
+    def _add(self, label: str, spec: Dict) -> Tuple[str, str]:
+        content = f"{self.frame_digest}|{json.dumps(spec, sort_keys=True)}|q{CROP_JPEG_QUALITY}"
+        filename = f"{label}_{hashlib.sha256(content.encode('utf-8')).hexdigest()[:_DIGEST_SIZE]}.jpg"
+        key = f"{self.prefix}/{filename}"
+        self.manifest["artifacts"][filename] = spec
+        if not LAZY_ARTIFACTS:
+            # Modo antigo: renderiza tudo na escrita em segundo plano
+            crop_storage.submit(key, lambda: render_spec(self.image, spec))
+        return filename, crop_url(key)
+
+    def add_crop(self, label: str, part_name: str, bbox: List[int]) -> Tuple[str, str]:
+        """
+        Registra o recorte de uma parte
+
+        Args:
+            label: Prefixo do nome do arquivo (ex: "torso", "torso_p1")
+            part_name: Nome da parte
+            bbox: Bounding box usada no recorte
+
+        Returns:
+            Tupla (nome do arquivo, URL do recorte)
+        """
+        return self._add(label, {"kind": "crop", "part_name": part_name, "bbox": [int(v) for v in bbox]})
+
+    def add_visualization(self, label: str, body_parts: Dict) -> Tuple[str, str]:
+        """
+        Registra a visualização das bounding boxes
+
+        Args:
+            label: Prefixo do nome do arquivo (ex: "bodyparts")
+            body_parts: Partes detectadas ({nome: {"bbox": [...]}})
+
+        Returns:
+            Tupla (nome do arquivo, URL da visualização)
+        """
+        boxes = {name: [int(v) for v in part["bbox"]] for name, part in body_parts.items()}
+        return self._add(label, {"kind": "visualization", "body_parts": boxes})
+
+    def spec(self, filename: str) -> Optional[Dict]:
+        """Entrada do manifesto de um artefato"""
+        return self.manifest["artifacts"].get(filename)
+
+    def commit(self):
+        """Agenda a gravação do frame e do manifesto (em segundo plano)"""
+        if self._committed or not self.manifest["artifacts"]:
+            return
+        self._committed = True
+        crop_storage.submit(f"{self.prefix}/{FRAME_NAME}", self.frame if self.frame is not None else self.image)
+        crop_storage.submit(f"{self.prefix}/{MANIFEST_NAME}", json.dumps(self.manifest).encode("utf-8"))
+
+    @classmethod
+    def load(cls, prefix: str) -> Optional["ArtifactSession"]:
+        """
+        Carrega uma sessão gravada (ex: criada por outra réplica)
+
+        Args:
+            prefix: Pasta da sessão
+
+        Returns:
+            Sessão ou None se o manifesto não existir
+        """
+        manifest_bytes = crop_storage.read(f"{prefix}/{MANIFEST_NAME}")
+        frame = crop_storage.read(f"{prefix}/{FRAME_NAME}")
+        if manifest_bytes is None or frame is None:
+            return None
+        session = cls.__new__(cls)
+        session.manifest = json.loads(manifest_bytes)
+        session.session_id = session.manifest["session_id"]
+        session.prefix = prefix
+        session.frame = frame
+        session.frame_digest = hashlib.sha256(frame).hexdigest()
+        session.image = decode_image(frame)
+        session._committed = True
+        session_registry.remember(session)
+        return session
+
+
+class SessionRegistry:
+    """LRU das sessões recentes, com o frame já decodificado"""
+
+    def __init__(self, max_sessions: int = ARTIFACT_SESSION_CACHE):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, ArtifactSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def remember(self, session: ArtifactSession):
+        with self._lock:
+            self._sessions[session.prefix] = session
+            self._sessions.move_to_end(session.prefix)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def get(self, prefix: str) -> Optional[ArtifactSession]:
+        with self._lock:
+            session = self._sessions.get(prefix)
+            if session is not None:
+                self._sessions.move_to_end(prefix)
+            return session
+
+
+session_registry = SessionRegistry()
+
+# Métricas
+_stats = {"rendered": 0, "not_found": 0}
+
+
+def render_artifact(key: str) -> Optional[bytes]:
+    """
+    Renderiza um artefato no primeiro acesso e guarda o JPEG no armazenamento
+
+    Args:
+        key: Chave "AAAAMMDD/hh/session_id/arquivo.jpg"
+
+    Returns:
+        Bytes JPEG ou None se a sessão ou o artefato não existirem
+    """
+    if "/" not in key or is_internal_key(key):
+        return None
+    prefix, filename = key.rsplit("/", 1)
+    session = session_registry.get(prefix) or ArtifactSession.load(prefix)
+    spec = session.spec(filename) if session is not None else None
+    if spec is None:
+        _stats["not_found"] += 1
+        return None
+    image = render_spec(session.image, spec)
+    if image is None:
+        _stats["not_found"] += 1
+        return None
+    data = encode_jpeg(image)
+    crop_storage.submit(key, data)
+    _stats["rendered"] += 1
+    return data
+
+
+def get_artifact_stats() -> Dict:
+    """Métricas da renderização sob demanda"""
+    return {
+        "lazy": LAZY_ARTIFACTS,
+        "rendered": _stats["rendered"],
+        "not_found": _stats["not_found"],
+        "sessions_in_memory": len(session_registry._sessions)
+    }
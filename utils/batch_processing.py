@@ -0,0 +1,357 @@
+# -*- coding: utf-8 -*-
+"""
+Processamento em lote de imagens (ingestão de catálogo).
+
+Aceita listas multipart, arquivos zip ou NDJSON com imagens em base64. As
+imagens são decodificadas em blocos limitados por memória e cada bloco passa
+por uma detecção em lote e por codificações CLIP em lote, amortizando o custo
+fixo dos modelos entre as imagens. Erros são reportados por item, na ordem de
+entrada.
+"""
+import base64
+import io
+import json
+import os
+import zipfile
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+from utils.image_utils import ensure_rgb_image
+
+# Configuração via variáveis de ambiente
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "256"))
+BATCH_MEMORY_MB = float(os.getenv("BATCH_MEMORY_MB", "512"))
+CLIP_BATCH_SIZE = int(os.getenv("CLIP_BATCH_SIZE", "64"))
+# Limites do conteúdo descompactado dos zips (checados antes de ler qualquer membro)
+BATCH_ZIP_MAX_ITEM_MB = float(os.getenv("BATCH_ZIP_MAX_ITEM_MB", "25"))
+BATCH_ZIP_MAX_TOTAL_MB = float(os.getenv("BATCH_ZIP_MAX_TOTAL_MB", "1024"))
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonlines")
+
+
+class BatchTooLargeError(ValueError):
+    """O lote excede o número máximo de itens"""
+
+
+def _new_item(name: str, data: Optional[bytes] = None, error: Optional[str] = None) -> Dict:
+    """Cria um item do lote"""
+    return {"name": name, "data": data, "error": error}
+
+
+def items_from_zip(data: bytes, max_items: int = MAX_BATCH_SIZE,
+                   max_item_mb: float = BATCH_ZIP_MAX_ITEM_MB,
+                   max_total_mb: float = BATCH_ZIP_MAX_TOTAL_MB) -> List[Dict]:
+    """
+    Extrai os itens de um arquivo zip (na ordem do arquivo)
+
+    O número de membros e os tamanhos descompactados declarados são checados
+    antes de qualquer leitura, e a leitura de cada membro é limitada ao
+    tamanho máximo (o cabeçalho pode mentir): um zip bomb não chega a ser
+    descompactado.
+
+    Args:
+        data: Conteúdo do zip
+        max_items: Número máximo de imagens
+        max_item_mb: Tamanho máximo descompactado de cada imagem
+        max_total_mb: Tamanho máximo descompactado somado
+
+    Returns:
+        Lista de itens {"name", "data", "error"}
+    """
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+    except zipfile.BadZipFile:
+        raise ValueError("Arquivo zip inválido")
+    max_item_bytes = int(max_item_mb * 1024 * 1024)
+    items = []
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not (info.is_dir() or info.filename.startswith("__MACOSX/") or os.path.basename(info.filename).startswith("."))
+        ]
+        if len(members) > max_items:
+            raise BatchTooLargeError(f"Zip com {len(members)} itens excede o máximo de {max_items}")
+        total_mb = sum(min(info.file_size, max_item_bytes) for info in members) / (1024 * 1024)
+        if total_mb > max_total_mb:
+            raise BatchTooLargeError(f"Zip com {total_mb:.0f} MB descompactados excede o máximo de {max_total_mb:.0f} MB")
+        for info in members:
+            if info.file_size > max_item_bytes:
+                items.append(_new_item(info.filename, error=f"Imagem excede {max_item_mb:g} MB descompactada"))
+                continue
+            try:
+                with archive.open(info) as member:
+                    content = member.read(max_item_bytes + 1)
+            except (zipfile.BadZipFile, RuntimeError, NotImplementedError, OSError) as e:
+                items.append(_new_item(info.filename, error=f"Membro do zip inválido: {e}"))
+                continue
+            if len(content) > max_item_bytes:
+                items.append(_new_item(info.filename, error=f"Imagem excede {max_item_mb:g} MB descompactada"))
+                continue
+            items.append(_new_item(info.filename, content))
+    return items
+
+
+def items_from_ndjson(data: bytes) -> List[Dict]:
+    """
+    Extrai os itens de um NDJSON com uma imagem base64 por linha
+
+    Cada linha: {"image": "<base64>", "name": "opcional"} (também aceita "image_base64")
+
+    Args:
+        data: Conteúdo NDJSON
+
+    Returns:
+        Lista de itens {"name", "data", "error"}
+    """
+    items = []
+    for line_number, line in enumerate(data.splitlines(), start=1):
+        if not line.strip():
+            continue
+        name = f"line_{line_number}"
+        try:
+            record = json.loads(line)
+            name = record.get("name", name)
+            image_base64 = record.get("image") or record.get("image_base64")
+            if not image_base64:
+                raise ValueError("Campo 'image' é obrigatório")
+            if image_base64.startswith('data:image/'):
+                image_base64 = image_base64.split(',', 1)[1]
+            items.append(_new_item(name, base64.b64decode(image_base64)))
+        except Exception as e:
+            items.append(_new_item(name, error=f"Linha inválida: {e}"))
+    return items
+
+
+async def read_batch_request(request, max_batch_size: int = MAX_BATCH_SIZE) -> List[Dict]:
+    """
+    Lê os itens de uma requisição de lote
+
+    Formatos aceitos:
+        - multipart/form-data com vários campos "files" (ou "file")
+        - multipart/form-data ou corpo application/zip com um arquivo zip
+        - corpo application/x-ndjson com uma imagem base64 por linha
+
+    Args:
+        request: Requisição Starlette
+        max_batch_size: Número máximo de itens
+
+    Returns:
+        Lista de itens {"name", "data", "error"}
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        items = []
+        for upload in form.getlist("files") + form.getlist("file"):
+            if not hasattr(upload, "read"):
+                continue
+            data = await upload.read()
+            filename = upload.filename or f"item_{len(items)}"
+            if upload.content_type in ZIP_CONTENT_TYPES or filename.lower().endswith(".zip"):
+                items.extend(items_from_zip(data, max_items=max(max_batch_size - len(items), 0)))
+            elif upload.content_type and not upload.content_type.startswith("image/"):
+                items.append(_new_item(filename, error="Arquivo deve ser uma imagem"))
+            else:
+                items.append(_new_item(filename, data))
+    elif content_type in ZIP_CONTENT_TYPES:
+        items = items_from_zip(await request.body(), max_items=max_batch_size)
+    elif content_type in NDJSON_CONTENT_TYPES:
+        items = items_from_ndjson(await request.body())
+    else:
+        raise ValueError("Use multipart/form-data (campo 'files'), application/zip ou application/x-ndjson")
+
+    if not items:
+        raise ValueError("Nenhuma imagem encontrada no lote")
+    if len(items) > max_batch_size:
+        raise BatchTooLargeError(f"Lote com {len(items)} itens excede o máximo de {max_batch_size}")
+    return items
+
+
+def iter_image_chunks(items: List[Dict], memory_cap_mb: float = BATCH_MEMORY_MB) -> Iterator[Tuple[List[Tuple[int, Dict, Image.Image, bytes]], List[Dict]]]:
+    """
+    Decodifica os itens em blocos cuja memória decodificada não passa do limite
+
+    O tamanho de cada imagem é lido do cabeçalho antes da decodificação, então
+    um bloco é liberado antes de a próxima imagem ser carregada.
+
+    Args:
+        items: Itens do lote
+        memory_cap_mb: Limite de memória (MB) das imagens decodificadas de um bloco
+
+    Yields:
+        Tupla (imagens do bloco [(índice, item, imagem, bytes originais)], erros do bloco)
+    """
+    memory_cap = memory_cap_mb * 1024 * 1024
+    chunk, errors, chunk_bytes = [], [], 0
+
+    for index, item in enumerate(items):
+        if item["error"]:
+            errors.append(item_error(index, item, item["error"]))
+            continue
+        try:
+            image = Image.open(io.BytesIO(item["data"]))
+            width, height = image.size
+            decoded_bytes = width * height * 3
+            if decoded_bytes > memory_cap:
+                errors.append(item_error(index, item, "Imagem excede o limite de memória do lote"))
+                continue
+            if chunk and chunk_bytes + decoded_bytes > memory_cap:
+                yield chunk, errors
+                chunk, errors, chunk_bytes = [], [], 0
+            image = ensure_rgb_image(image)
+            image.load()
+        except Exception as e:
+            errors.append(item_error(index, item, f"Imagem inválida: {e}"))
+            continue
+        # Os bytes originais ficam só no bloco (frame das sessões de artefatos)
+        data, item["data"] = item["data"], None
+        chunk.append((index, item, image, data))
+        chunk_bytes += decoded_bytes
+
+    if chunk or errors:
+        yield chunk, errors
+
+
+def item_error(index: int, item: Dict, error: str) -> Dict:
+    """Resultado de um item com erro"""
+    return {"index": index, "name": item["name"], "success": False, "error": error}
+
+
+def _classify_in_chunks(images: List[Image.Image], regions: List[Optional[str]], detect_colors: bool) -> List[Dict]:
+    """Classifica as imagens em sub-lotes de no máximo CLIP_BATCH_SIZE"""
+    from utils.clip_classifier import classify_parts_batch
+    results = []
+    for start in range(0, len(images), CLIP_BATCH_SIZE):
+        results.extend(classify_parts_batch(
+            images[start:start + CLIP_BATCH_SIZE],
+            regions[start:start + CLIP_BATCH_SIZE],
+            detect_colors
+        ))
+    return results
+
+
+def classify_batch(items: List[Dict], memory_cap_mb: float = BATCH_MEMORY_MB) -> List[Dict]:
+    """
+    Classifica um lote de imagens de roupa (equivalente em lote de /clothing/classify)
+
+    Args:
+        items: Itens do lote
+        memory_cap_mb: Limite de memória por bloco
+
+    Returns:
+        Lista de resultados na ordem de entrada
+    """
+    results = [None] * len(items)
+    for chunk, errors in iter_image_chunks(items, memory_cap_mb):
+        for error in errors:
+            results[error["index"]] = error
+        images = [image for _, _, image, _ in chunk]
+        for (index, item, image, _), part_result in zip(chunk, _classify_in_chunks(images, [None] * len(images), False)):
+            results[index] = {
+                "index": index,
+                "name": item["name"],
+                "success": True,
+                "dimensions": {"width": image.width, "height": image.height},
+                "predictions": part_result["predictions"],
+                "top_prediction": part_result["top_prediction"]
+            }
+    return results
+
+
+def analyze_batch(items: List[Dict], memory_cap_mb: float = BATCH_MEMORY_MB,
+                  save_parts: bool = False) -> List[Dict]:
+    """
+    Análise completa de um lote de imagens (equivalente em lote de /analysis/complete)
+
+    Args:
+        items: Itens do lote
+        memory_cap_mb: Limite de memória por bloco
+        save_parts: Salva os recortes das partes (ver utils/crop_storage.py)
+
+    Returns:
+        Lista de resultados na ordem de entrada
+    """
+    from utils.body_parts_detector import detect_body_parts_batch, extract_body_part_image
+    from utils.clip_classifier import analyze_outfit_compatibility, analyze_complete_outfit_images
+    from utils.artifacts import ArtifactSession
+
+    results = [None] * len(items)
+    for chunk, errors in iter_image_chunks(items, memory_cap_mb):
+        for error in errors:
+            results[error["index"]] = error
+        if not chunk:
+            continue
+
+        images = [image for _, _, image, _ in chunk]
+        detections = detect_body_parts_batch(images)
+
+        # Recorta as peças de todas as imagens do bloco
+        crops = []
+        for position, ((index, item, image, _), detection) in enumerate(zip(chunk, detections)):
+            if not detection["success"]:
+                results[index] = item_error(index, item, detection["error"])
+                continue
+            for part_name in detection["body_parts"]:
+                part_image = extract_body_part_image(image, detection, part_name)
+                if part_image is not None and part_image.width > 1 and part_image.height > 1:
+                    crops.append((position, part_name, part_image))
+
+        # Classifica (e detecta cores de) todas as peças do bloco em lote
+        part_results = _classify_in_chunks([c[2] for c in crops], [c[1] for c in crops], True)
+        classified = {}
+        sessions = {}
+        for (position, part_name, part_image), part_result in zip(crops, part_results):
+            if save_parts:
+                # Uma sessão por imagem; os recortes são renderizados no primeiro acesso
+                index, item, image, data = chunk[position]
+                if position not in sessions:
+                    sessions[position] = ArtifactSession(image, data)
+                session = sessions[position]
+                _, part_result["url"] = session.add_crop(
+                    f"{part_name}_b{index}", part_name, detections[position]["body_parts"][part_name]["bbox"]
+                )
+            classified.setdefault(position, {})[part_name] = part_result
+        for session in sessions.values():
+            session.commit()
+
+        # Análise da imagem inteira em lote para as imagens com pose
+        positions = [p for p, detection in enumerate(detections) if detection["success"]]
+        complete_analyses = analyze_complete_outfit_images(
+            [images[p] for p in positions],
+            [classified.get(p, {}) for p in positions]
+        )
+
+        for position, complete_analysis in zip(positions, complete_analyses):
+            index, item, image, _ = chunk[position]
+            detection = detections[position]
+            classified_parts = classified.get(position, {})
+            compatibility = analyze_outfit_compatibility(classified_parts)
+            results[index] = {
+                "index": index,
+                "name": item["name"],
+                "success": True,
+                "dimensions": {"width": image.width, "height": image.height},
+                "body_parts": {
+                    part_name: part_data["bbox"] for part_name, part_data in detection["body_parts"].items()
+                },
+                "classifications": classified_parts,
+                "outfit_compatibility": compatibility,
+                "complete_outfit_analysis": complete_analysis,
+                "summary": {
+                    "total_parts_detected": len(detection["body_parts"]),
+                    "total_parts_classified": len(classified_parts),
+                    "people_detected": len(detection.get("people", [])),
+                    "compatibility_score": compatibility.get("compatibility_score", 0),
+                    "overall_coordination_score": complete_analysis.get("full_image_analysis", {}).get("coordination_analysis", {}).get("coordination_score", 0)
+                }
+            }
+    return results
+
+
+def batch_summary(results: List[Dict]) -> Dict:
+    """Contagem de sucessos e falhas de um lote"""
+    succeeded = sum(1 for result in results if result and result.get("success"))
+    return {"total": len(results), "succeeded": succeeded, "failed": len(results) - succeeded}
@@ -1,67 +1,171 @@
 import cv2
-import mediapipe as mp
-from ultralytics import YOLO
 from PIL import Image
 import numpy as np
-from typing import Dict, List, Tuple, Optional
+from enum import IntEnum
+from typing import Dict, List, Tuple, Optional, NamedTuple
+import os
+import threading
+import time
+
+from utils.metrics import stage_timer, observe_batch, record_model_load
+
+# Configuração do modo cascata via variáveis de ambiente
+DETECTION_CASCADE = os.getenv("DETECTION_CASCADE", "false").lower() in ("1", "true", "yes")
+CASCADE_PERSON_SIZE = int(os.getenv("CASCADE_PERSON_SIZE", "320"))
+CASCADE_POSE_SIZE = int(os.getenv("CASCADE_POSE_SIZE", "512"))
+
+class PoseLandmark(IntEnum):
+    """Índices dos landmarks do MediaPipe Pose usados aqui (sem importar o mediapipe)"""
+    NOSE = 0
+    LEFT_EYE = 2
+    RIGHT_EYE = 5
+    LEFT_EAR = 7
+    RIGHT_EAR = 8
+    MOUTH_LEFT = 9
+    MOUTH_RIGHT = 10
+    LEFT_SHOULDER = 11
+    RIGHT_SHOULDER = 12
+    LEFT_HIP = 23
+    RIGHT_HIP = 24
+    LEFT_KNEE = 25
+    RIGHT_KNEE = 26
+    LEFT_ANKLE = 27
+    RIGHT_ANKLE = 28
+    LEFT_HEEL = 29
+    RIGHT_HEEL = 30
+    LEFT_FOOT_INDEX = 31
+    RIGHT_FOOT_INDEX = 32
+
+class _FrameLandmark(NamedTuple):
+    """Landmark normalizado para o frame completo (mapeado a partir de um recorte)"""
+    x: float
+    y: float
 
 class BodyPartsDetector:
     """Classe para detectar partes do corpo usando MediaPipe e YOLO"""
     
-    def __init__(self, margin_percentage: float = 0.05):
+    def __init__(self, margin_percentage: float = 0.05, cascade_mode: bool = DETECTION_CASCADE,
+                 static_image_mode: bool = True, yolo_model=None, lazy: bool = False,
+                 yolo_lock: Optional[threading.Lock] = None):
         """
         Inicializa os modelos de detecção
         
         Args:
             margin_percentage: Percentual de margem para expandir as bounding boxes (0.30 = 30%)
+            cascade_mode: Se True, detecta a pessoa com YOLO antes e roda a pose só no recorte
+            static_image_mode: False ativa o modo de rastreamento do MediaPipe (vídeo/stream)
+            yolo_model: Modelo YOLO já carregado para compartilhar entre detectores
+            lazy: Se True, o MediaPipe e o YOLO (e seus pacotes) só são carregados no primeiro
+                uso ou em load_pose/load_yolo (ver utils/model_lifecycle.py)
+            yolo_lock: Lock do detector dono de yolo_model (obrigatório ao compartilhar o
+                modelo: o preditor do ultralytics não é thread-safe)
         """
-        # Inicializa MediaPipe Pose
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=True, 
-            min_detection_confidence=0.5
-        )
-        self.mp_drawing = mp.solutions.drawing_utils
-        
-        # Inicializa YOLOv8
-        self.yolo_model = YOLO("yolov8n.pt")
+        self.static_image_mode = static_image_mode
+        self._pose = None
+        self._yolo_model = yolo_model
+        # Locks separados: pose e YOLO podem ser carregados em paralelo
+        self._pose_load_lock = threading.Lock()
+        self._yolo_load_lock = threading.Lock()
+        # O grafo do MediaPipe e o preditor do ultralytics não são thread-safe (requisições,
+        # lotes no threadpool e workers de jobs compartilham o detector)
+        self._pose_lock = threading.Lock()
+        self._yolo_lock = yolo_lock if yolo_lock is not None else threading.Lock()
         
         # Margem de tolerância
         self.margin_percentage = margin_percentage
         
+        # Modo cascata (pessoa -> pose no recorte)
+        self.cascade_mode = cascade_mode
+        self.cascade_person_size = CASCADE_PERSON_SIZE  # Resolução de trabalho do YOLO
+        self.cascade_pose_size = CASCADE_POSE_SIZE  # Maior lado do recorte enviado à pose
+        self.cascade_padding = 0.15  # Padding do recorte da pessoa (15% por lado)
+        
         # Define grupos de pontos para cada parte do corpo
         self.torso_points = [
-            self.mp_pose.PoseLandmark.LEFT_SHOULDER,
-            self.mp_pose.PoseLandmark.RIGHT_SHOULDER,
-            self.mp_pose.PoseLandmark.LEFT_HIP,
-            self.mp_pose.PoseLandmark.RIGHT_HIP
+            PoseLandmark.LEFT_SHOULDER,
+            PoseLandmark.RIGHT_SHOULDER,
+            PoseLandmark.LEFT_HIP,
+            PoseLandmark.RIGHT_HIP
         ]
         
         self.legs_points = [
-            self.mp_pose.PoseLandmark.LEFT_HIP,
-            self.mp_pose.PoseLandmark.RIGHT_HIP,
-            self.mp_pose.PoseLandmark.LEFT_KNEE,
-            self.mp_pose.PoseLandmark.RIGHT_KNEE,
-            self.mp_pose.PoseLandmark.LEFT_ANKLE,
-            self.mp_pose.PoseLandmark.RIGHT_ANKLE
+            PoseLandmark.LEFT_HIP,
+            PoseLandmark.RIGHT_HIP,
+            PoseLandmark.LEFT_KNEE,
+            PoseLandmark.RIGHT_KNEE,
+            PoseLandmark.LEFT_ANKLE,
+            PoseLandmark.RIGHT_ANKLE
         ]
         
         self.feet_points = [
-            self.mp_pose.PoseLandmark.LEFT_HEEL,
-            self.mp_pose.PoseLandmark.RIGHT_HEEL,
-            self.mp_pose.PoseLandmark.LEFT_FOOT_INDEX,
-            self.mp_pose.PoseLandmark.RIGHT_FOOT_INDEX
+            PoseLandmark.LEFT_HEEL,
+            PoseLandmark.RIGHT_HEEL,
+            PoseLandmark.LEFT_FOOT_INDEX,
+            PoseLandmark.RIGHT_FOOT_INDEX
         ]
         # Pontos para a cabeça
         self.head_points = [
-            self.mp_pose.PoseLandmark.NOSE,
-            self.mp_pose.PoseLandmark.LEFT_EYE,
-            self.mp_pose.PoseLandmark.RIGHT_EYE,
-            self.mp_pose.PoseLandmark.LEFT_EAR,
-            self.mp_pose.PoseLandmark.RIGHT_EAR,
-            self.mp_pose.PoseLandmark.MOUTH_LEFT,
-            self.mp_pose.PoseLandmark.MOUTH_RIGHT
+            PoseLandmark.NOSE,
+            PoseLandmark.LEFT_EYE,
+            PoseLandmark.RIGHT_EYE,
+            PoseLandmark.LEFT_EAR,
+            PoseLandmark.RIGHT_EAR,
+            PoseLandmark.MOUTH_LEFT,
+            PoseLandmark.MOUTH_RIGHT
         ]
+
+        if not lazy:
+            self.load_models()
+
+    def load_pose(self):
+        """Cria o grafo do MediaPipe Pose (idempotente; importa o mediapipe na primeira chamada)"""
+        with self._pose_load_lock:
+            if self._pose is None:
+                import mediapipe as mp
+                started = time.perf_counter()
+                self._pose = mp.solutions.pose.Pose(
+                    static_image_mode=self.static_image_mode, 
+                    min_detection_confidence=0.5
+                )
+                record_model_load("pose", time.perf_counter() - started)
+        return self._pose
+
+    def load_yolo(self):
+        """Carrega o YOLOv8 (idempotente; importa o ultralytics na primeira chamada)"""
+        with self._yolo_load_lock:
+            if self._yolo_model is None:
+                from ultralytics import YOLO
+                started = time.perf_counter()
+                self._yolo_model = YOLO("yolov8n.pt")
+                record_model_load("yolo", time.perf_counter() - started)
+        return self._yolo_model
+
+    def load_models(self):
+        """Carrega a pose e o YOLO"""
+        self.load_pose()
+        self.load_yolo()
+
+    def is_loaded(self) -> bool:
+        """True quando a pose e o YOLO já estão carregados"""
+        return self._pose is not None and self._yolo_model is not None
+
+    @property
+    def pose(self):
+        """Grafo do MediaPipe Pose (carregado no primeiro acesso)"""
+        return self._pose if self._pose is not None else self.load_pose()
+
+    @pose.setter
+    def pose(self, value):
+        self._pose = value
+
+    @property
+    def yolo_model(self):
+        """Modelo YOLO (carregado no primeiro acesso)"""
+        return self._yolo_model if self._yolo_model is not None else self.load_yolo()
+
+    @yolo_model.setter
+    def yolo_model(self, value):
+        self._yolo_model = value
     
     def _get_bounding_box_with_margin(self, landmarks, image_width: int, image_height: int, points: List) -> Tuple[int, int, int, int]:
         """
@@ -139,33 +243,104 @@ class BodyPartsDetector:
         
         return image_rgb
     
-    def detect_body_parts(self, image: np.ndarray) -> Dict:
+    def _process_pose(self, image_rgb: np.ndarray):
+        """Roda o MediaPipe Pose serializando o acesso ao grafo"""
+        with self._pose_lock, stage_timer("pose"):
+            return self.pose.process(image_rgb)
+    
+    def _run_yolo(self, images, **kwargs):
+        """Roda o YOLO serializando o acesso ao preditor"""
+        with self._yolo_lock, stage_timer("yolo"):
+            return self.yolo_model(images, **kwargs)
+    
+    def detect_people(self, image_rgb: np.ndarray, working_size: Optional[int] = None) -> List[List[float]]:
         """
-        Detecta partes do corpo na imagem
+        Detecta pessoas com YOLOv8
         
         Args:
-            image: Imagem como numpy array (BGR)
+            image_rgb: Imagem RGB como numpy array
+            working_size: Se informado, reduz a imagem para que o maior lado
+                tenha no máximo este tamanho antes da inferência
             
         Returns:
-            Dicionário com as detecções
+            Lista de boxes [x_min, y_min, x_max, y_max] em coordenadas do frame
         """
-        # Garante que a imagem seja RGB
-        image_rgb = self._ensure_rgb_image(image)
-        h, w, _ = image_rgb.shape
+        h, w = image_rgb.shape[:2]
+        scale = 1.0
+        if working_size is not None and max(h, w) > working_size:
+            scale = working_size / max(h, w)
+            image_rgb = cv2.resize(image_rgb, (max(1, round(w * scale)), max(1, round(h * scale))),
+                                   interpolation=cv2.INTER_AREA)
+        
+        if working_size is not None:
+            results_yolo = self._run_yolo(image_rgb, imgsz=working_size, verbose=False)
+        else:
+            results_yolo = self._run_yolo(image_rgb)
         
-        # 1) Detecta pose com MediaPipe
-        results = self.pose.process(image_rgb)
+        person_boxes = []
+        for box in results_yolo[0].boxes:
+            cls = int(box.cls[0])
+            if cls == 0:  # pessoa
+                xyxy = box.xyxy[0].tolist()
+                person_boxes.append([coord / scale for coord in xyxy])
+        return person_boxes
+    
+    def _detect_pose_in_roi(self, image_rgb: np.ndarray, person_box: List[float]):
+        """
+        Executa o MediaPipe Pose apenas no recorte (com padding) de uma pessoa
         
+        Args:
+            image_rgb: Imagem RGB completa
+            person_box: Box da pessoa [x_min, y_min, x_max, y_max]
+            
+        Returns:
+            Lista de landmarks normalizados para o frame completo ou None
+        """
+        h, w = image_rgb.shape[:2]
+        x_min, y_min, x_max, y_max = person_box
+        pad_x = (x_max - x_min) * self.cascade_padding
+        pad_y = (y_max - y_min) * self.cascade_padding
+        x0 = max(0, int(x_min - pad_x))
+        y0 = max(0, int(y_min - pad_y))
+        x1 = min(w, int(x_max + pad_x))
+        y1 = min(h, int(y_max + pad_y))
+        if x1 - x0 < 2 or y1 - y0 < 2:
+            return None
+        
+        crop = image_rgb[y0:y1, x0:x1]
+        crop_h, crop_w = crop.shape[:2]
+        # O MediaPipe reduz a entrada internamente; recortes grandes só custam conversão
+        if max(crop_h, crop_w) > self.cascade_pose_size:
+            scale = self.cascade_pose_size / max(crop_h, crop_w)
+            crop = cv2.resize(crop, (max(1, round(crop_w * scale)), max(1, round(crop_h * scale))),
+                              interpolation=cv2.INTER_AREA)
+        crop = np.ascontiguousarray(crop)
+        
+        results = self._process_pose(crop)
         if not results.pose_landmarks:
-            return {
-                "success": False,
-                "error": "Nenhuma pose detectada",
-                "body_parts": {},
-                "people": []
-            }
+            return None
         
-        landmarks = results.pose_landmarks.landmark
+        # Coordenadas normalizadas do recorte -> coordenadas normalizadas do frame
+        return [
+            _FrameLandmark(
+                (x0 + lm.x * crop_w) / w,
+                (y0 + lm.y * crop_h) / h
+            )
+            for lm in results.pose_landmarks.landmark
+        ]
+    
+    def _compute_body_part_boxes(self, landmarks, w: int, h: int) -> Dict:
+        """
+        Calcula as bounding boxes de cada parte do corpo a partir dos landmarks
         
+        Args:
+            landmarks: Landmarks normalizados (MediaPipe ou _FrameLandmark)
+            w: Largura da imagem
+            h: Altura da imagem
+            
+        Returns:
+            Dicionário com bbox e área de cada parte
+        """
         # Calcula bounding boxes das partes do corpo COM margem
         # Torso: expande lateralmente
         torso_box_raw = self._get_bounding_box_with_margin(landmarks, w, h, self.torso_points)
@@ -204,18 +379,7 @@ class BodyPartsDetector:
         y_min_expanded = max(0, int(y_min - head_height * expand_ratio))
         head_box = (x_min, y_min_expanded, x_max, y_max)
         
-        # 2) Detecta pessoas com YOLOv8 (usa a imagem RGB)
-        results_yolo = self.yolo_model(image_rgb)
-        person_boxes = []
-        
-        for box in results_yolo[0].boxes:
-            cls = int(box.cls[0])
-            if cls == 0:  # pessoa
-                xyxy = box.xyxy[0].tolist()
-                person_boxes.append(xyxy)
-        
-        # Prepara resultado
-        body_parts = {
+        return {
             "torso": {
                 "bbox": torso_box,
                 "area": (torso_box[2] - torso_box[0]) * (torso_box[3] - torso_box[1])
@@ -233,6 +397,54 @@ class BodyPartsDetector:
                 "area": (head_box[2] - head_box[0]) * (head_box[3] - head_box[1])
             }
         }
+    
+    def detect_body_parts(self, image: np.ndarray, detect_people: bool = True) -> Dict:
+        """
+        Detecta partes do corpo na imagem
+        
+        No modo cascata, as pessoas são detectadas primeiro (YOLO em resolução
+        reduzida) e o MediaPipe Pose roda apenas no recorte da pessoa principal.
+        
+        Args:
+            image: Imagem como numpy array (BGR)
+            detect_people: Se False, roda apenas a pose (sem YOLO)
+            
+        Returns:
+            Dicionário com as detecções
+        """
+        # Garante que a imagem seja RGB
+        image_rgb = self._ensure_rgb_image(image)
+        h, w, _ = image_rgb.shape
+        
+        landmarks = None
+        person_boxes = None
+        
+        if self.cascade_mode and detect_people:
+            # 1) Detecta pessoas em baixa resolução e usa a maior como ROI da pose
+            person_boxes = self.detect_people(image_rgb, working_size=self.cascade_person_size)
+            if person_boxes:
+                main_person = max(person_boxes, key=lambda b: (b[2] - b[0]) * (b[3] - b[1]))
+                landmarks = self._detect_pose_in_roi(image_rgb, main_person)
+        
+        if landmarks is None:
+            # 1) Detecta pose com MediaPipe no frame inteiro
+            results = self._process_pose(image_rgb)
+            if results.pose_landmarks:
+                landmarks = results.pose_landmarks.landmark
+        
+        if landmarks is None:
+            return {
+                "success": False,
+                "error": "Nenhuma pose detectada",
+                "body_parts": {},
+                "people": []
+            }
+        
+        body_parts = self._compute_body_part_boxes(landmarks, w, h)
+        
+        # 2) Detecta pessoas com YOLOv8 (usa a imagem RGB)
+        if person_boxes is None:
+            person_boxes = self.detect_people(image_rgb) if detect_people else []
         
         return {
             "success": True,
@@ -241,6 +453,99 @@ class BodyPartsDetector:
             "image_dimensions": {"width": w, "height": h}
         }
     
+    def detect_body_parts_batch(self, images: List[np.ndarray]) -> List[Dict]:
+        """
+        Detecta partes do corpo em várias imagens
+        
+        A pose roda imagem a imagem, mas o YOLO recebe todas as imagens com
+        pose detectada em uma única chamada.
+        
+        Args:
+            images: Lista de imagens como numpy array (RGB)
+            
+        Returns:
+            Lista de detecções na mesma ordem das imagens
+        """
+        if self.cascade_mode:
+            # No modo cascata o YOLO precede a pose em cada imagem
+            return [self.detect_body_parts(image) for image in images]
+        
+        results = []
+        pending = []  # (índice, imagem RGB) que precisam do YOLO
+        for image in images:
+            image_rgb = self._ensure_rgb_image(image)
+            h, w, _ = image_rgb.shape
+            pose_results = self._process_pose(image_rgb)
+            if not pose_results.pose_landmarks:
+                results.append({
+                    "success": False,
+                    "error": "Nenhuma pose detectada",
+                    "body_parts": {},
+                    "people": []
+                })
+                continue
+            results.append({
+                "success": True,
+                "body_parts": self._compute_body_part_boxes(pose_results.pose_landmarks.landmark, w, h),
+                "people": [],
+                "image_dimensions": {"width": w, "height": h}
+            })
+            pending.append((len(results) - 1, image_rgb))
+        
+        if pending:
+            observe_batch("yolo", len(pending))
+            yolo_results = self._run_yolo([image_rgb for _, image_rgb in pending], verbose=False)
+            for (index, _), yolo_result in zip(pending, yolo_results):
+                results[index]["people"] = [
+                    box.xyxy[0].tolist() for box in yolo_result.boxes if int(box.cls[0]) == 0
+                ]
+        return results
+    
+    def detect_people_body_parts(self, image: np.ndarray) -> Dict:
+        """
+        Detecta as partes do corpo de todas as pessoas da imagem
+        
+        O YOLO roda uma única vez no frame; para cada pessoa encontrada o
+        MediaPipe Pose roda apenas no recorte (ROI) dela.
+        
+        Args:
+            image: Imagem como numpy array (RGB)
+            
+        Returns:
+            Dicionário com a lista de pessoas e suas partes do corpo
+        """
+        image_rgb = self._ensure_rgb_image(image)
+        h, w, _ = image_rgb.shape
+        
+        working_size = self.cascade_person_size if self.cascade_mode else None
+        person_boxes = self.detect_people(image_rgb, working_size=working_size)
+        
+        people = []
+        for person_box in person_boxes:
+            landmarks = self._detect_pose_in_roi(image_rgb, person_box)
+            if landmarks is None:
+                continue
+            people.append({
+                "person_index": len(people),
+                "person_bbox": [float(coord) for coord in person_box],
+                "body_parts": self._compute_body_part_boxes(landmarks, w, h)
+            })
+        
+        if not people:
+            return {
+                "success": False,
+                "error": "Nenhuma pose detectada",
+                "people": [],
+                "people_detected": len(person_boxes)
+            }
+        
+        return {
+            "success": True,
+            "people": people,
+            "people_detected": len(person_boxes),
+            "image_dimensions": {"width": w, "height": h}
+        }
+    
     def detect_from_pil(self, pil_image: Image.Image) -> Dict:
         """
         Detecta partes do corpo a partir de uma imagem PIL
@@ -279,24 +584,38 @@ class BodyPartsDetector:
             Imagem PIL da parte do corpo ou None se não encontrada
         """
         detection = self.detect_from_pil(pil_image)
+        return self.crop_body_part(pil_image, detection, part_name)
+    
+    def crop_body_part(self, pil_image: Image.Image, detection: Dict, part_name: str) -> Optional[Image.Image]:
+        """
+        Recorta uma parte do corpo a partir de uma detecção já realizada
         
+        Args:
+            pil_image: Imagem PIL original
+            detection: Resultado de detect_from_pil
+            part_name: Nome da parte ('torso', 'legs', 'feet')
+            
+        Returns:
+            Imagem PIL da parte do corpo ou None se não encontrada
+        """
         if not detection["success"] or part_name not in detection["body_parts"]:
             return None
         
         bbox = detection["body_parts"][part_name]["bbox"]
         x_min, y_min, x_max, y_max = bbox
         
-        # Extrai a região da imagem
-        part_image = pil_image.crop((x_min, y_min, x_max, y_max))
-        # Se for feet, aumentar resolução para pelo menos 224x224
-        if part_name == 'feet':
-            min_size = 224
-            w, h = part_image.size
-            if w < min_size or h < min_size:
-                scale = max(min_size / w, min_size / h)
-                new_w = int(w * scale)
-                new_h = int(h * scale)
-                part_image = part_image.resize((new_w, new_h), Image.LANCZOS)
+        with stage_timer("crop"):
+            # Extrai a região da imagem
+            part_image = pil_image.crop((x_min, y_min, x_max, y_max))
+            # Se for feet, aumentar resolução para pelo menos 224x224
+            if part_name == 'feet':
+                min_size = 224
+                w, h = part_image.size
+                if w < min_size or h < min_size:
+                    scale = max(min_size / w, min_size / h)
+                    new_w = int(w * scale)
+                    new_h = int(h * scale)
+                    part_image = part_image.resize((new_w, new_h), Image.LANCZOS)
         return part_image
     
     def set_margin_percentage(self, margin_percentage: float):
@@ -308,36 +627,78 @@ class BodyPartsDetector:
         """
         self.margin_percentage = max(0.0, min(1.0, margin_percentage))  # Limita entre 0% e 100%
 
-    def save_body_parts_visualization(self, pil_image: Image.Image, detection_result: Dict, save_path: str):
+    def close(self):
+        """Libera o grafo do MediaPipe Pose deste detector"""
+        if self._pose is not None:
+            self._pose.close()
+
+    def get_settings(self) -> Dict:
         """
-        Salva uma imagem com as bounding boxes das partes do corpo desenhadas.
+        Retorna as configurações ajustáveis do detector (usadas para sincronizar workers)
+        
+        Returns:
+            Dicionário com as configurações atuais
+        """
+        return {
+            "margin_percentage": self.margin_percentage,
+            "cascade_mode": self.cascade_mode
+        }
 
+    def apply_settings(self, settings: Dict):
+        """
+        Aplica configurações recebidas de outro processo
+        
         Args:
-            pil_image: Imagem PIL original
+            settings: Dicionário retornado por get_settings
+        """
+        if "margin_percentage" in settings:
+            self.set_margin_percentage(settings["margin_percentage"])
+        if "cascade_mode" in settings:
+            self.cascade_mode = bool(settings["cascade_mode"])
+
+    def render_body_parts_visualization(self, pil_image: Image.Image, detection_result: Dict) -> Image.Image:
+        """
+        Desenha as bounding boxes das partes do corpo sobre uma cópia da imagem.
+
+        Args:
+            pil_image: Imagem PIL original (RGB)
             detection_result: Resultado de detect_from_pil (com bounding boxes)
-            save_path: Caminho para salvar a imagem (ex: 'static/body_parts/resultado.jpg')
+
+        Returns:
+            Nova imagem PIL com as caixas desenhadas
         """
         import cv2
         import numpy as np
-        # Converte PIL para numpy (BGR para OpenCV)
-        image_np = np.array(pil_image)
-        image_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+        # Desenha direto em RGB (cores em RGB), sem conversão para BGR
+        image_rgb = np.array(pil_image.convert("RGB"))
 
         colors = {
             "torso": (0, 255, 0),
-            "legs": (255, 0, 0),
-            "feet": (0, 0, 255)
+            "legs": (0, 0, 255),
+            "feet": (255, 0, 0)
         }
         for part, info in detection_result.get("body_parts", {}).items():
             x_min, y_min, x_max, y_max = info["bbox"]
-            color = colors.get(part, (255, 255, 0))
-            cv2.rectangle(image_bgr, (x_min, y_min), (x_max, y_max), color, 2)
-            cv2.putText(image_bgr, part, (x_min, max(y_min-10, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+            # Partes de múltiplas pessoas usam o sufixo "_p<índice>" (ex: torso_p1)
+            color = colors.get(part.split("_")[0], (0, 255, 255))
+            cv2.rectangle(image_rgb, (x_min, y_min), (x_max, y_max), color, 2)
+            cv2.putText(image_rgb, part, (x_min, max(y_min-10, 0)), cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
 
-        cv2.imwrite(save_path, image_bgr)
+        return Image.fromarray(image_rgb)
 
-# Instância global do detector
-detector = BodyPartsDetector()
+    def save_body_parts_visualization(self, pil_image: Image.Image, detection_result: Dict, save_path: str):
+        """
+        Salva uma imagem com as bounding boxes das partes do corpo desenhadas.
+
+        Args:
+            pil_image: Imagem PIL original
+            detection_result: Resultado de detect_from_pil (com bounding boxes)
+            save_path: Caminho para salvar a imagem (ex: 'static/body_parts/resultado.jpg')
+        """
+        self.render_body_parts_visualization(pil_image, detection_result).save(save_path, "JPEG", quality=95)
+
+# Instância global do detector (modelos carregados na inicialização da API, ver utils/model_lifecycle.py)
+detector = BodyPartsDetector(lazy=True)
 
 def detect_body_parts_from_image(image: Image.Image) -> Dict:
     """
@@ -349,8 +710,99 @@ def detect_body_parts_from_image(image: Image.Image) -> Dict:
     Returns:
         Dicionário com as detecções
     """
+    from utils.detection_pool import get_detection_pool
+    pool = get_detection_pool()
+    if pool is not None:
+        return pool.detect_from_pil(image, detector.get_settings())
     return detector.detect_from_pil(image)
 
+def _pil_to_rgb_array(image: Image.Image) -> np.ndarray:
+    """Converte uma imagem PIL em array RGB"""
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return np.array(image)
+
+def detect_people_from_image(image: Image.Image) -> Dict:
+    """
+    Função utilitária para detectar as partes do corpo de todas as pessoas
+    
+    Args:
+        image: Imagem PIL
+        
+    Returns:
+        Dicionário com a lista de pessoas e suas partes do corpo
+    """
+    from utils.detection_pool import get_detection_pool
+    pool = get_detection_pool()
+    if pool is not None:
+        return pool.detect_people_from_pil(image, detector.get_settings())
+    return detector.detect_people_body_parts(_pil_to_rgb_array(image))
+
+async def detect_people_from_image_async(image: Image.Image) -> Dict:
+    """
+    Versão assíncrona de detect_people_from_image
+    
+    Args:
+        image: Imagem PIL
+        
+    Returns:
+        Dicionário com a lista de pessoas e suas partes do corpo
+    """
+    from utils.detection_pool import get_detection_pool
+    pool = get_detection_pool()
+    if pool is not None:
+        return await pool.detect_people_from_pil_async(image, detector.get_settings())
+    return detector.detect_people_body_parts(_pil_to_rgb_array(image))
+
+def detect_body_parts_batch(images: List[Image.Image]) -> List[Dict]:
+    """
+    Função utilitária para detectar partes do corpo em várias imagens
+    
+    Args:
+        images: Lista de imagens PIL
+        
+    Returns:
+        Lista de detecções na mesma ordem das imagens
+    """
+    from utils.detection_pool import get_detection_pool
+    pool = get_detection_pool()
+    if pool is not None:
+        return pool.detect_many(images, detector.get_settings())
+    return detector.detect_body_parts_batch([_pil_to_rgb_array(image) for image in images])
+
+async def detect_body_parts_from_image_async(image: Image.Image) -> Dict:
+    """
+    Versão assíncrona de detect_body_parts_from_image
+    
+    Quando o backend de processos está ativo, aguarda o worker sem bloquear o
+    event loop, permitindo que várias requisições detectem em paralelo.
+    
+    Args:
+        image: Imagem PIL
+        
+    Returns:
+        Dicionário com as detecções
+    """
+    from utils.detection_pool import get_detection_pool
+    pool = get_detection_pool()
+    if pool is not None:
+        return await pool.detect_from_pil_async(image, detector.get_settings())
+    return detector.detect_from_pil(image)
+
+def extract_body_part_image(image: Image.Image, detection: Dict, part_name: str) -> Optional[Image.Image]:
+    """
+    Função utilitária para recortar uma parte do corpo de uma detecção existente
+    
+    Args:
+        image: Imagem PIL
+        detection: Resultado de detect_body_parts_from_image
+        part_name: Nome da parte ('torso', 'legs', 'feet')
+        
+    Returns:
+        Imagem PIL da parte ou None
+    """
+    return detector.crop_body_part(image, detection, part_name)
+
 def get_body_part_image(image: Image.Image, part_name: str) -> Optional[Image.Image]:
     """
     Função utilitária para extrair parte do corpo
@@ -362,7 +814,8 @@ def get_body_part_image(image: Image.Image, part_name: str) -> Optional[Image.Im
     Returns:
         Imagem PIL da parte ou None
     """
-    return detector.get_body_part_image(image, part_name)
+    detection = detect_body_parts_from_image(image)
+    return detector.crop_body_part(image, detection, part_name)
 
 def set_margin_percentage(margin_percentage: float):
     """
@@ -380,4 +833,22 @@ def get_margin_percentage() -> float:
     Returns:
         Percentual de margem atual (0.1 = 10%, 0.2 = 20%, etc.)
     """
-    return detector.margin_percentage 
\ No newline at end of file
+    return detector.margin_percentage
+
+def set_cascade_mode(enabled: bool):
+    """
+    Função utilitária para ativar/desativar o modo cascata (pessoa -> pose no recorte)
+    
+    Args:
+        enabled: True para ativar o modo cascata
+    """
+    detector.cascade_mode = bool(enabled)
+
+def get_cascade_mode() -> bool:
+    """
+    Função utilitária para obter o estado do modo cascata
+    
+    Returns:
+        True se o modo cascata estiver ativo
+    """
+    return detector.cascade_mode
@@ -0,0 +1,711 @@
+# -*- coding: utf-8 -*-
+"""
+Caches de resultados e de embeddings com backends plugáveis.
+
+Cada cache tem dois níveis: um LRU no processo, limitado por número de
+entradas e bytes, e um backend compartilhado opcional. O backend compartilhado
+é escolhido por CACHE_BACKEND:
+
+    - memory: sem segundo nível (apenas o LRU do processo)
+    - sqlite: arquivo SQLite em disco (compartilhado entre processos do host
+      ou réplicas com volume comum)
+    - network: servidor chave-valor pelo protocolo binário de NetworkBackend
+      (cache_server.py é uma implementação local de referência)
+
+Os valores trafegam em binário compacto: resultados em msgpack (JSON se o
+msgpack não estiver instalado) e embeddings como float16 crus.
+
+O cache de resultados guarda as respostas das análises, classificações e
+detecções, com suporte a ETag / If-None-Match.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.single_flight import SingleFlight, content_key
+from utils.tracing import set_attribute
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Configuração via variáveis de ambiente
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")  # "memory", "sqlite" ou "network"
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", os.path.join("data", "cache.db"))
+CACHE_SERVER_ADDRESS = os.getenv("CACHE_SERVER_ADDRESS", "localhost:6380")
+CACHE_NETWORK_TIMEOUT = float(os.getenv("CACHE_NETWORK_TIMEOUT", "0.5"))
+CACHE_NETWORK_COOLDOWN_SECONDS = float(os.getenv("CACHE_NETWORK_COOLDOWN_SECONDS", "5"))
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "128"))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "20000"))
+EMBEDDING_CACHE_TTL_SECONDS = float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", "604800"))
+MODEL_VERSION = os.getenv("MODEL_VERSION", "1")
+# Os resultados com recortes apontam para sessões do armazenamento (utils/artifacts.py):
+# expiram antes delas, para um HIT/304 nunca apontar para uma sessão já removida
+RESULT_CACHE_CROP_TTL_RATIO = 0.9
+
+
+# ---------------------------------------------------------------------------
+# Serialização
+# ---------------------------------------------------------------------------
+
+_FORMAT_MSGPACK = b"M"
+_FORMAT_JSON = b"J"
+
+
+def pack_result(result: Any) -> bytes:
+    """Serializa um resultado (msgpack, ou JSON sem o msgpack)"""
+    if msgpack is not None:
+        return _FORMAT_MSGPACK + msgpack.packb(result, use_bin_type=True)
+    return _FORMAT_JSON + json.dumps(result, separators=(",", ":")).encode("utf-8")
+
+
+def unpack_result(value: bytes) -> Any:
+    """Desserializa um valor gerado por pack_result"""
+    if value[:1] == _FORMAT_MSGPACK:
+        if msgpack is None:
+            raise ValueError("Valor em msgpack, mas o pacote msgpack não está instalado")
+        return msgpack.unpackb(value[1:], raw=False)
+    return json.loads(value[1:])
+
+
+def pack_embedding(embedding: np.ndarray) -> bytes:
+    """Serializa um embedding como float16 cru"""
+    return np.asarray(embedding, dtype=np.float16).tobytes()
+
+
+def unpack_embedding(value: bytes) -> np.ndarray:
+    """Desserializa um embedding gerado por pack_embedding (float32)"""
+    return np.frombuffer(value, dtype=np.float16).astype(np.float32)
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class CacheBackend:
+    """Interface de um backend de cache (chaves str, valores em bytes)"""
+
+    name = "base"
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Busca várias chaves (None para as ausentes)"""
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class MemoryLRUBackend(CacheBackend):
+    """LRU no processo limitado por número de entradas e por bytes"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, max_bytes: int = int(RESULT_CACHE_MAX_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.time() + ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions
+        }
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Backend em disco com SQLite
+
+    Compartilhado entre os processos do mesmo host (ou réplicas com volume
+    comum). Entradas expiradas são removidas na leitura e periodicamente na
+    escrita.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = CACHE_SQLITE_PATH, purge_every: int = 1000):
+        self.path = path
+        self.purge_every = purge_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return bytes(row[0])
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl)
+            )
+            self._writes += 1
+            if self._writes % self.purge_every == 0:
+                self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, total_bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()
+        return {"backend": self.name, "path": self.path, "entries": entries, "bytes": total_bytes}
+
+
+# Protocolo do backend de rede (big-endian):
+#   requisição: op (1 byte) + tamanho da chave (uint32) + chave
+#               + [SET] ttl (float64) + tamanho do valor (uint32) + valor
+#               [MGET] op + número de chaves (uint32) + (tamanho (uint32) + chave) por chave
+#   resposta:   status (1 byte) + tamanho (uint32) + conteúdo
+#               [MGET] conteúdo = uma resposta (status + tamanho + valor) por chave, na ordem
+# Operações: G (get), M (get de várias chaves), S (set), C (clear), I (stats em JSON)
+# Status: + (ok, conteúdo = valor), - (ausente), ! (erro, conteúdo = mensagem)
+OP_GET, OP_MGET, OP_SET, OP_CLEAR, OP_STATS = b"G", b"M", b"S", b"C", b"I"
+STATUS_OK, STATUS_MISSING, STATUS_ERROR = b"+", b"-", b"!"
+_HEADER = struct.Struct("!cI")
+_SET_HEADER = struct.Struct("!dI")
+_SIZE = struct.Struct("!I")
+
+
+def encode_request(op: bytes, key: str = "", value: bytes = b"", ttl: float = 0.0) -> bytes:
+    """Codifica uma requisição do protocolo do backend de rede"""
+    key_bytes = key.encode("utf-8")
+    message = _HEADER.pack(op, len(key_bytes)) + key_bytes
+    if op == OP_SET:
+        message += _SET_HEADER.pack(ttl, len(value)) + value
+    return message
+
+
+def encode_mget(keys: List[str]) -> bytes:
+    """Codifica uma requisição MGET (várias chaves em uma ida e volta)"""
+    parts = [_HEADER.pack(OP_MGET, len(keys))]
+    for key in keys:
+        key_bytes = key.encode("utf-8")
+        parts.append(_SIZE.pack(len(key_bytes)) + key_bytes)
+    return b"".join(parts)
+
+
+def encode_response(status: bytes, payload: bytes = b"") -> bytes:
+    """Codifica uma resposta do protocolo do backend de rede"""
+    return _HEADER.pack(status, len(payload)) + payload
+
+
+def decode_mget_response(payload: bytes, count: int) -> List[Optional[bytes]]:
+    """Decodifica o conteúdo de uma resposta MGET (None para as chaves ausentes)"""
+    values: List[Optional[bytes]] = []
+    offset = 0
+    for _ in range(count):
+        status, size = _HEADER.unpack_from(payload, offset)
+        offset += _HEADER.size
+        values.append(payload[offset:offset + size] if status == STATUS_OK else None)
+        offset += size
+    return values
+
+
+class NetworkBackend(CacheBackend):
+    """
+    Cliente de um servidor chave-valor compartilhado entre réplicas
+
+    Uma conexão TCP por thread. Falhas de rede nunca propagam: leituras viram
+    ausência e escritas são descartadas, contando os erros nas métricas. Depois
+    de uma falha, o servidor fica fora por cooldown segundos: as chamadas nesse
+    intervalo não tentam reconectar (sem pagar o timeout a cada requisição
+    com o servidor fora do ar).
+    """
+
+    name = "network"
+
+    def __init__(self, address: str = CACHE_SERVER_ADDRESS, timeout: float = CACHE_NETWORK_TIMEOUT,
+                 cooldown: float = CACHE_NETWORK_COOLDOWN_SECONDS):
+        host, _, port = address.rpartition(":")
+        self.address = (host or "localhost", int(port))
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self._local = threading.local()
+        self._down_until = 0.0
+        self.errors = 0
+        self.skipped = 0
+
+    def _socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+            self._local.sock = None
+
+    def _recv_exact(self, sock: socket.socket, size: int) -> bytes:
+        chunks = []
+        while size:
+            chunk = sock.recv(size)
+            if not chunk:
+                raise ConnectionError("Conexão encerrada pelo servidor de cache")
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def _call(self, message: bytes) -> Tuple[bytes, bytes]:
+        """Envia uma requisição e retorna (status, conteúdo)"""
+        if time.monotonic() < self._down_until:
+            self.skipped += 1
+            return STATUS_ERROR, b""
+        try:
+            sock = self._socket()
+            sock.sendall(message)
+            status, size = _HEADER.unpack(self._recv_exact(sock, _HEADER.size))
+            return status, self._recv_exact(sock, size)
+        except (OSError, ConnectionError, struct.error):
+            self.errors += 1
+            self._down_until = time.monotonic() + self.cooldown
+            self._close()
+            return STATUS_ERROR, b""
+
+    def get(self, key: str) -> Optional[bytes]:
+        status, payload = self._call(encode_request(OP_GET, key))
+        return payload if status == STATUS_OK else None
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Busca várias chaves em uma única ida e volta"""
+        if not keys:
+            return []
+        status, payload = self._call(encode_mget(keys))
+        if status != STATUS_OK:
+            return [None] * len(keys)
+        try:
+            return decode_mget_response(payload, len(keys))
+        except struct.error:
+            self.errors += 1
+            return [None] * len(keys)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self._call(encode_request(OP_SET, key, value, ttl))
+
+    def clear(self):
+        self._call(encode_request(OP_CLEAR))
+
+    def stats(self) -> Dict:
+        status, payload = self._call(encode_request(OP_STATS))
+        server = json.loads(payload) if status == STATUS_OK else None
+        return {
+            "backend": self.name,
+            "address": f"{self.address[0]}:{self.address[1]}",
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "cooldown_seconds": self.cooldown,
+            "available": time.monotonic() >= self._down_until,
+            "server": server
+        }
+
+
+def create_shared_backend(name: str = CACHE_BACKEND) -> Optional[CacheBackend]:
+    """
+    Cria o backend compartilhado configurado
+
+    Args:
+        name: "memory" (sem segundo nível), "sqlite" ou "network"
+
+    Returns:
+        Backend ou None
+    """
+    if name == "memory":
+        return None
+    if name == "sqlite":
+        return SQLiteBackend()
+    if name == "network":
+        return NetworkBackend()
+    raise ValueError(f"Backend de cache desconhecido: {name}. Use 'memory', 'sqlite' ou 'network'")
+
+
+# ---------------------------------------------------------------------------
+# Chaves e ETags
+# ---------------------------------------------------------------------------
+
+_model_version: Optional[str] = None
+
+
+def model_version() -> str:
+    """
+    Identificador da versão dos modelos/prompts usado nas chaves dos caches
+
+    Muda quando MODEL_VERSION, o modelo CLIP ou a lista de categorias mudam.
+    """
+    global _model_version
+    if _model_version is None:
+        from utils.clip_classifier import classifier
+        fingerprint = json.dumps([
+            MODEL_VERSION,
+            os.getenv("CLIP_WEIGHTS", ""),
+            classifier.model_name,
+            classifier.classes,
+            classifier.colors
+        ])
+        _model_version = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()[:12]
+    return _model_version
+
+
+def make_cache_key(namespace: str, data: bytes, **params) -> str:
+    """
+    Monta a chave do cache de resultados (conteúdo + parâmetros + versão dos modelos)
+
+    Args:
+        namespace: Operação (ex: "analysis", "classification", "detection")
+        data: Bytes da imagem enviada
+        **params: Parâmetros que alteram o resultado
+
+    Returns:
+        Chave do cache
+    """
+    return f"{content_key(namespace, data, **params)}:{model_version()}"
+
+
+def etag_for(key: str) -> str:
+    """
+    ETag fraco derivado da chave do cache
+
+    Fraco porque identifica o resultado (imagem + parâmetros + versão dos
+    modelos), não os bytes: session_id, URLs e o nome do arquivo mudam a cada
+    computação, então duas respostas com o mesmo ETag são equivalentes, mas
+    não idênticas.
+    """
+    return 'W/"' + hashlib.sha256(key.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Verifica se o header If-None-Match contém o ETag
+
+    Args:
+        if_none_match: Valor do header (lista separada por vírgulas, "*" ou None)
+        etag: ETag da resposta
+
+    Returns:
+        True se o cliente já possui esta versão
+    """
+    if not if_none_match:
+        return False
+    # If-None-Match usa comparação fraca (RFC 9110): ignora o prefixo W/ dos dois lados
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    opaque = etag.removeprefix("W/")
+    return "*" in candidates or any(tag.removeprefix("W/") == opaque for tag in candidates)
+
+
+# ---------------------------------------------------------------------------
+# Caches
+# ---------------------------------------------------------------------------
+
+class TieredCache:
+    """Cache em dois níveis (LRU no processo + backend compartilhado) com valores em bytes"""
+
+    def __init__(self, namespace: str, local: MemoryLRUBackend, shared: Optional[CacheBackend],
+                 ttl: float, enabled: bool):
+        self.namespace = namespace
+        self.local = local
+        self.shared = shared
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _shared_key(self, key: str) -> str:
+        return f"{self.namespace}|{key}"
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Busca um valor (LRU e depois backend compartilhado)"""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(self._shared_key(key))
+            if value is not None:
+                self.shared_hits += 1
+                self.local.set(key, value, self.ttl)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def get_many_bytes(self, keys: List[str]) -> List[Optional[bytes]]:
+        """Busca vários valores (LRU e depois, para as ausentes, uma busca no backend compartilhado)"""
+        values = [self.local.get(key) for key in keys]
+        missing = [index for index, value in enumerate(values) if value is None]
+        if missing and self.shared is not None:
+            shared_values = self.shared.get_many([self._shared_key(keys[index]) for index in missing])
+            for index, value in zip(missing, shared_values):
+                if value is not None:
+                    self.shared_hits += 1
+                    self.local.set(keys[index], value, self.ttl)
+                    values[index] = value
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    def set_bytes(self, key: str, value: bytes):
+        """Armazena um valor nos dois níveis"""
+        self.local.set(key, value, self.ttl)
+        if self.shared is not None:
+            self.shared.set(self._shared_key(key), value, self.ttl)
+
+    def clear(self):
+        """Remove todas as entradas"""
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict:
+        """Métricas do cache"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "local": self.local.stats()
+        }
+
+
+class ResultCache(TieredCache):
+    """Cache de respostas das análises"""
+
+    def __init__(self, shared: Optional[CacheBackend] = None, ttl: float = RESULT_CACHE_TTL_SECONDS,
+                 enabled: bool = RESULT_CACHE_ENABLED):
+        super().__init__("result", MemoryLRUBackend(), shared, ttl, enabled)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Busca um resultado"""
+        value = self.get_bytes(key)
+        return unpack_result(value) if value is not None else None
+
+    def set(self, key: str, result: Dict):
+        """Armazena um resultado"""
+        self.set_bytes(key, pack_result(result))
+
+    async def contains(self, key: str) -> bool:
+        """
+        Verifica se o resultado ainda está no cache, sem contar acerto ou falta
+
+        Condição para responder 304: com o cache desligado ou a entrada
+        removida, o servidor não tem mais a representação que o cliente possui.
+        """
+        if not self.enabled:
+            return False
+        if self.local.get(key) is not None:
+            return True
+        if self.shared is None:
+            return False
+        return await asyncio.to_thread(self.shared.get, self._shared_key(key)) is not None
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict]],
+                             flight: Optional[SingleFlight] = None) -> Tuple[Dict, Dict]:
+        """
+        Retorna o resultado do cache ou o computa (agrupando chamadas idênticas)
+
+        Args:
+            key: Chave do cache (ver make_cache_key)
+            compute: Função que cria a corrotina da computação
+            flight: Grupo single-flight para agrupar computações em andamento
+
+        Returns:
+            Tupla (resultado, metadados {"etag", "cache", "coalesced"})
+        """
+        meta = {"etag": etag_for(key), "cache": "bypass", "coalesced": False}
+        if self.enabled:
+            # Backends compartilhados fazem I/O; não bloqueiam o event loop
+            cached = await asyncio.to_thread(self.get, key) if self.shared is not None else self.get(key)
+            if cached is not None:
+                meta["cache"] = "hit"
+                set_attribute("cache.result", "hit")
+                return cached, meta
+            meta["cache"] = "miss"
+
+        async def compute_and_store():
+            result = await compute()
+            if self.enabled:
+                if self.shared is not None:
+                    await asyncio.to_thread(self.set, key, result)
+                else:
+                    self.set(key, result)
+            return result
+
+        if flight is not None:
+            result, meta["coalesced"] = await flight.do(key, compute_and_store)
+        else:
+            result = await compute_and_store()
+        set_attribute("cache.result", meta["cache"])
+        set_attribute("cache.coalesced", meta["coalesced"])
+        return result, meta
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "model_version": model_version()}
+
+
+class EmbeddingCache(TieredCache):
+    """Cache de embeddings CLIP de imagens (float16), chaveado pelo conteúdo da imagem"""
+
+    def __init__(self, shared: Optional[CacheBackend] = None, ttl: float = EMBEDDING_CACHE_TTL_SECONDS,
+                 enabled: bool = EMBEDDING_CACHE_ENABLED):
+        local = MemoryLRUBackend(max_entries=EMBEDDING_CACHE_MAX_ENTRIES, max_bytes=EMBEDDING_CACHE_MAX_ENTRIES * 2048)
+        super().__init__("embedding", local, shared, ttl, enabled)
+
+    @staticmethod
+    def image_key(image) -> str:
+        """Chave de uma imagem PIL: hash dos pixels + tamanho/modo + versão dos modelos"""
+        digest = hashlib.sha256(image.tobytes())
+        digest.update(f"{image.size}{image.mode}".encode("ascii"))
+        return f"{digest.hexdigest()}:{model_version()}"
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Busca vários embeddings (None para os ausentes)"""
+        values = self.get_many_bytes(keys)
+        return [unpack_embedding(value) if value is not None else None for value in values]
+
+    def set_many(self, keys: List[str], embeddings: np.ndarray):
+        """Armazena vários embeddings"""
+        for key, embedding in zip(keys, embeddings):
+            self.set_bytes(key, pack_embedding(embedding))
+
+
+def result_headers(meta: Dict) -> Dict[str, str]:
+    """Headers de resposta a partir dos metadados de get_or_compute"""
+    return {
+        "ETag": meta["etag"],
+        "X-Cache": meta["cache"].upper(),
+        "X-Coalesced": str(meta["coalesced"]).lower()
+    }
+
+
+def result_cache_ttl(ttl: float = RESULT_CACHE_TTL_SECONDS) -> float:
+    """
+    TTL do cache de resultados, limitado pelo TTL dos recortes
+
+    Args:
+        ttl: TTL configurado (RESULT_CACHE_TTL_SECONDS)
+
+    Returns:
+        TTL efetivo em segundos
+    """
+    from utils.crop_storage import CROP_TTL_SECONDS
+    if CROP_TTL_SECONDS > 0:
+        return min(ttl, CROP_TTL_SECONDS * RESULT_CACHE_CROP_TTL_RATIO)
+    return ttl
+
+
+# Backend compartilhado e caches globais
+shared_backend = create_shared_backend()
+result_cache = ResultCache(shared=shared_backend, ttl=result_cache_ttl())
+embedding_cache = EmbeddingCache(shared=shared_backend)
+
+
+def get_cache_stats() -> Dict:
+    """Métricas de todos os caches e do backend compartilhado"""
+    return {
+        "backend": CACHE_BACKEND,
+        "serialization": "msgpack" if msgpack is not None else "json",
+        "results": result_cache.stats(),
+        "embeddings": embedding_cache.stats(),
+        "shared": shared_backend.stats() if shared_backend is not None else None
+    }
+
+
+def clear_caches():
+    """Limpa todos os caches"""
+    result_cache.clear()
+    embedding_cache.clear()
+
+
+def set_caches_enabled(enabled: bool):
+    """Ativa ou desativa todos os caches"""
+    result_cache.enabled = enabled
+    embedding_cache.enabled = enabled
@@ -1,12 +1,22 @@
 import torch
-import clip
 from PIL import Image
 import numpy as np
 from typing import List, Dict, Tuple
 from sklearn.metrics.pairwise import cosine_similarity
 import re
+import threading
+import time
 from PIL import ImageColor
 
+from utils.metrics import stage_timer, observe_batch, record_model_load
+from utils.tracing import add_to_attribute
+
+
+def _tokenize(texts):
+    """clip.tokenize com importação tardia (o pacote clip só é importado quando usado)"""
+    import clip
+    return clip.tokenize(texts)
+
 class CLIPClassifier:
     """Classe para classificação de roupas usando modelo CLIP"""
     
@@ -78,20 +88,53 @@ class CLIPClassifier:
             "full_body": ["swimsuit"]
         }
         
+        # Prompts mais simples e diretos para avaliação de outfit
+        self.style_prompts = [
+            "formal clothing",
+            "casual clothing", 
+            "elegant clothing",
+            "trendy clothing",
+            "classic clothing",
+            "modern clothing"
+        ]
+        
+        self.coordination_prompts = [
+            "well coordinated",
+            "color coordinated",
+            "matching clothes",
+            "harmonious outfit",
+            "balanced outfit",
+            "stylish outfit"
+        ]
+        
         # Cache para embeddings de texto
         self.text_embeddings = None
         self.color_embeddings = None
+        # Cache de features de texto normalizadas por tupla de prompts (inferência em lote)
+        self._prompt_features_cache = {}
+        # Carregamento em paralelo com os outros modelos (utils/model_lifecycle.py)
+        self._load_lock = threading.Lock()
         
     def load_model(self):
-        """Carrega o modelo CLIP"""
-        if self.model is None:
+        """Carrega o modelo CLIP (idempotente; seguro para chamadas concorrentes)"""
+        with self._load_lock:
+            if self.model is not None:
+                return
             print(f"🔄 Carregando modelo CLIP ({self.model_name})...")
+            started = time.perf_counter()
+            import clip
             self.model, self.preprocess = clip.load(self.model_name, device=self.device)
+            record_model_load("clip", time.perf_counter() - started)
+            self._prompt_features_cache = {}
             print("✅ Modelo CLIP carregado com sucesso!")
             
             # Pré-computar embeddings de texto para compatibilidade
             self._compute_text_embeddings()
             self._compute_color_embeddings()
+
+    def is_loaded(self) -> bool:
+        """True quando o modelo e os embeddings pré-computados estão prontos"""
+        return self.model is not None and self.color_embeddings is not None
     
     def _compute_text_embeddings(self):
         """Pré-computa embeddings de texto para todas as categorias"""
@@ -99,7 +142,7 @@ class CLIPClassifier:
             return
             
         print("🔄 Computando embeddings de texto...")
-        text = clip.tokenize(self.classes).to(self.device)
+        text = _tokenize(self.classes).to(self.device)
         
         with torch.no_grad():
             self.text_embeddings = self.model.encode_text(text).cpu().numpy()
@@ -113,7 +156,7 @@ class CLIPClassifier:
             
         print("🔄 Computando embeddings de cores...")
         color_prompts = [f"{color} color" for color in self.colors]
-        text = clip.tokenize(color_prompts).to(self.device)
+        text = _tokenize(color_prompts).to(self.device)
         
         with torch.no_grad():
             self.color_embeddings = self.model.encode_text(text).cpu().numpy()
@@ -159,29 +202,51 @@ class CLIPClassifier:
         image_rgb = self._ensure_rgb_image(image)
         
         # Filtrar categorias relevantes para a região, se especificada
-        if body_region is not None:
-            filtered = [(i, cat) for i, cat in enumerate(self.categories) if cat[3] == body_region]
-            if not filtered:
-                # fallback: se não houver categorias para a região, usar todas
-                filtered = list(enumerate(self.categories))
-            filtered_indices, filtered_categories = zip(*filtered)
-            filtered_classes = [cat[2] for cat in filtered_categories]
-        else:
-            filtered_indices = list(range(len(self.categories)))
-            filtered_classes = self.classes
-            filtered_categories = self.categories
+        filtered_indices, filtered_classes = self._get_region_categories(body_region)
         
         # Pré-processamento da imagem
         processed_image = self.preprocess(image_rgb).unsqueeze(0).to(self.device)
-        text = clip.tokenize(filtered_classes).to(self.device)
+        text = _tokenize(filtered_classes).to(self.device)
         
         # Inferência
-        with torch.no_grad():
+        with torch.no_grad(), stage_timer("clip_encode"):
             image_features = self.model.encode_image(processed_image)
             text_features = self.model.encode_text(text)
             logits_per_image, _ = self.model(processed_image, text)
             probs = logits_per_image.softmax(dim=-1).cpu().numpy()[0]
         
+        return self._build_classifications(probs, filtered_indices)
+    
+    def _get_region_categories(self, body_region: str = None) -> Tuple[List[int], List[str]]:
+        """
+        Retorna os índices e prompts das categorias de uma região do corpo
+        
+        Args:
+            body_region: Região do corpo (None para todas as categorias)
+            
+        Returns:
+            Tupla (índices das categorias, prompts em inglês)
+        """
+        if body_region is not None:
+            filtered = [(i, cat) for i, cat in enumerate(self.categories) if cat[3] == body_region]
+            if not filtered:
+                # fallback: se não houver categorias para a região, usar todas
+                filtered = list(enumerate(self.categories))
+            filtered_indices, filtered_categories = zip(*filtered)
+            return list(filtered_indices), [cat[2] for cat in filtered_categories]
+        return list(range(len(self.categories))), self.classes
+    
+    def _build_classifications(self, probs, filtered_indices: List[int]) -> List[Dict[str, any]]:
+        """
+        Monta a lista de classificações ordenada a partir das probabilidades
+        
+        Args:
+            probs: Probabilidades para cada categoria filtrada
+            filtered_indices: Índices das categorias correspondentes
+            
+        Returns:
+            Lista de classificações ordenadas por probabilidade
+        """
         # Preparar resultado com categorias padronizadas
         classifications = []
         for idx, prob in enumerate(probs):
@@ -201,6 +266,128 @@ class CLIPClassifier:
         
         return classifications
     
+    def _get_prompt_features(self, prompts: Tuple[str, ...]) -> torch.Tensor:
+        """
+        Retorna (com cache) as features de texto normalizadas de uma lista de prompts
+        
+        Args:
+            prompts: Tupla de prompts
+            
+        Returns:
+            Tensor (len(prompts), dim) com as features normalizadas
+        """
+        features = self._prompt_features_cache.get(prompts)
+        if features is None:
+            text = _tokenize(list(prompts)).to(self.device)
+            with torch.no_grad():
+                features = self.model.encode_text(text)
+                features = features / features.norm(dim=-1, keepdim=True)
+            self._prompt_features_cache[prompts] = features
+        return features
+    
+    def encode_images(self, images: List[Image.Image]) -> torch.Tensor:
+        """
+        Codifica um lote de imagens em uma única chamada ao CLIP
+        
+        Args:
+            images: Lista de imagens PIL
+            
+        Returns:
+            Tensor (len(images), dim) com as features normalizadas
+        """
+        if self.model is None:
+            raise RuntimeError("Modelo não foi carregado. Chame load_model() primeiro.")
+        
+        # Embeddings já calculados (em qualquer réplica, com backend compartilhado) vêm do cache
+        from utils.cache import embedding_cache
+        images = [self._ensure_rgb_image(image) for image in images]
+        keys, cached = None, [None] * len(images)
+        if embedding_cache.enabled:
+            keys = [embedding_cache.image_key(image) for image in images]
+            cached = embedding_cache.get_many(keys)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        if keys is not None:
+            add_to_attribute("embedding_cache.hits", len(images) - len(missing))
+            add_to_attribute("embedding_cache.lookups", len(images))
+        
+        features = None
+        if missing:
+            observe_batch("clip_encode", len(missing))
+            with torch.no_grad(), stage_timer("clip_encode"):
+                batch = torch.stack([self.preprocess(images[i]) for i in missing]).to(self.device)
+                features = self.model.encode_image(batch)
+                features = features / features.norm(dim=-1, keepdim=True)
+            if keys is not None:
+                embedding_cache.set_many([keys[i] for i in missing], features.float().cpu().numpy())
+            if len(missing) == len(images):
+                return features
+        
+        dtype = features.dtype if features is not None else self.model.logit_scale.dtype
+        dim = features.shape[1] if features is not None else len(cached[0])
+        result = torch.empty((len(images), dim), dtype=dtype, device=self.device)
+        for i, embedding in enumerate(cached):
+            if embedding is not None:
+                # float16 do cache: renormaliza para compensar o arredondamento
+                vector = torch.from_numpy(embedding)
+                result[i] = (vector / vector.norm()).to(device=self.device, dtype=dtype)
+        if features is not None:
+            result[missing] = features
+        return result
+    
+    def _zero_shot_probabilities(self, image_features: torch.Tensor, text_features: torch.Tensor) -> np.ndarray:
+        """Calcula as probabilidades zero-shot (mesmo cálculo do forward do CLIP)"""
+        with torch.no_grad():
+            logits = self.model.logit_scale.exp() * image_features @ text_features.t()
+            return logits.softmax(dim=-1).float().cpu().numpy()
+    
+    def classify_parts_batch(self, images: List[Image.Image], body_regions: List[str],
+                             detect_colors: bool = True) -> List[Dict]:
+        """
+        Classifica (e detecta a cor de) várias peças com uma única codificação de imagens
+        
+        Args:
+            images: Lista de imagens das peças
+            body_regions: Região do corpo de cada imagem (None para todas as categorias)
+            detect_colors: Se True, também analisa a cor de cada peça
+            
+        Returns:
+            Lista (na mesma ordem) de dicionários com predictions, top_prediction
+            e color_analysis
+        """
+        if not images:
+            return []
+        
+        images = [self._ensure_rgb_image(image) for image in images]
+        image_features = self.encode_images(images)
+        
+        # Agrupa as imagens por região para calcular os logits de cada grupo de uma vez
+        results = [None] * len(images)
+        regions = {}
+        for i, region in enumerate(body_regions):
+            regions.setdefault(region, []).append(i)
+        for region, indices in regions.items():
+            filtered_indices, filtered_classes = self._get_region_categories(region)
+            text_features = self._get_prompt_features(tuple(filtered_classes))
+            probs = self._zero_shot_probabilities(image_features[indices], text_features)
+            for row, i in enumerate(indices):
+                classifications = self._build_classifications(probs[row], filtered_indices)
+                results[i] = {
+                    "predictions": classifications,
+                    "top_prediction": self.get_top_prediction(classifications)
+                }
+        
+        if detect_colors:
+            with stage_timer("color"):
+                color_prompts = tuple(f"{color} colored clothing" for color in self.colors)
+                color_probs = self._zero_shot_probabilities(image_features, self._get_prompt_features(color_prompts))
+                for i, image in enumerate(images):
+                    clip_color_analysis = self._color_probabilities_to_analysis(color_probs[i])
+                    results[i]["color_analysis"] = self._combine_color_analyses(
+                        self._analyze_image_colors(image), clip_color_analysis
+                    )
+        
+        return results
+    
     def get_top_prediction(self, classifications: List[Dict]) -> Dict[str, any]:
         """
         Obtém a predição com maior probabilidade
@@ -270,9 +457,8 @@ class CLIPClassifier:
 
         # Se não encontrou, gerar embedding do prompt livre
         if selected_idx is None:
-            import clip
             prompt_text = selected_item["prompt"]
-            text = clip.tokenize([prompt_text]).to(self.device)
+            text = _tokenize([prompt_text]).to(self.device)
             with torch.no_grad():
                 prompt_embedding = self.model.encode_text(text).cpu().numpy()[0]
             selected_embedding = prompt_embedding.reshape(1, -1)
@@ -762,31 +948,45 @@ class CLIPClassifier:
         # Pré-processar a imagem para o CLIP
         processed_image = self.preprocess(full_image).unsqueeze(0).to(self.device)
         
-        # Prompts mais simples e diretos para avaliação de outfit
-        style_prompts = [
-            "formal clothing",
-            "casual clothing", 
-            "elegant clothing",
-            "trendy clothing",
-            "classic clothing",
-            "modern clothing"
-        ]
-        
-        coordination_prompts = [
-            "well coordinated",
-            "color coordinated",
-            "matching clothes",
-            "harmonious outfit",
-            "balanced outfit",
-            "stylish outfit"
-        ]
-        
         # Analisar estilo
-        style_scores = self._analyze_style_with_clip(processed_image, style_prompts)
+        style_scores = self._analyze_style_with_clip(processed_image, self.style_prompts)
         
         # Analisar coordenação
-        coordination_scores = self._analyze_coordination_with_clip(processed_image, coordination_prompts)
+        coordination_scores = self._analyze_coordination_with_clip(processed_image, self.coordination_prompts)
+        
+        return self._build_complete_outfit_analysis(style_scores, coordination_scores, classified_parts)
+    
+    def analyze_complete_outfit_images(self, full_images: List[Image.Image], classified_parts_list: List[Dict]) -> List[Dict]:
+        """
+        Analisa vários outfits completos com uma única codificação das imagens
         
+        Args:
+            full_images: Imagens completas
+            classified_parts_list: Classificações das partes de cada imagem
+            
+        Returns:
+            Lista (na mesma ordem) com a análise completa de cada outfit
+        """
+        if self.model is None:
+            return [{"error": "Modelo CLIP não carregado"} for _ in full_images]
+        if not full_images:
+            return []
+        
+        image_features = self.encode_images(full_images)
+        style_probs = self._zero_shot_probabilities(image_features, self._get_prompt_features(tuple(self.style_prompts)))
+        coordination_probs = self._zero_shot_probabilities(image_features, self._get_prompt_features(tuple(self.coordination_prompts)))
+        
+        return [
+            self._build_complete_outfit_analysis(
+                self._style_scores_from_probs(self.style_prompts, style_probs[i]),
+                self._coordination_scores_from_probs(self.coordination_prompts, coordination_probs[i]),
+                classified_parts
+            )
+            for i, classified_parts in enumerate(classified_parts_list)
+        ]
+    
+    def _build_complete_outfit_analysis(self, style_scores: Dict, coordination_scores: Dict, classified_parts: Dict) -> Dict:
+        """Monta o resultado da análise completa a partir dos scores de estilo e coordenação"""
         # Determinar estilo dominante
         dominant_style = max(style_scores.items(), key=lambda x: x[1])
         
@@ -818,14 +1018,18 @@ class CLIPClassifier:
     
     def _analyze_style_with_clip(self, processed_image, style_prompts):
         """Analisa o estilo usando CLIP com prompts específicos"""
-        text = clip.tokenize(style_prompts).to(self.device)
+        text = _tokenize(style_prompts).to(self.device)
         
-        with torch.no_grad():
+        with torch.no_grad(), stage_timer("clip_encode"):
             image_features = self.model.encode_image(processed_image)
             text_features = self.model.encode_text(text)
             logits_per_image, _ = self.model(processed_image, text)
             probs = logits_per_image.softmax(dim=-1).cpu().numpy()[0]
         
+        return self._style_scores_from_probs(style_prompts, probs)
+    
+    def _style_scores_from_probs(self, style_prompts, probs) -> Dict:
+        """Converte as probabilidades dos prompts de estilo em scores"""
         # Normalizar e mapear scores
         style_scores = {}
         for i, (prompt, prob) in enumerate(zip(style_prompts, probs)):
@@ -837,14 +1041,18 @@ class CLIPClassifier:
     
     def _analyze_coordination_with_clip(self, processed_image, coordination_prompts):
         """Analisa a coordenação usando CLIP com prompts específicos"""
-        text = clip.tokenize(coordination_prompts).to(self.device)
+        text = _tokenize(coordination_prompts).to(self.device)
         
-        with torch.no_grad():
+        with torch.no_grad(), stage_timer("clip_encode"):
             image_features = self.model.encode_image(processed_image)
             text_features = self.model.encode_text(text)
             logits_per_image, _ = self.model(processed_image, text)
             probs = logits_per_image.softmax(dim=-1).cpu().numpy()[0]
         
+        return self._coordination_scores_from_probs(coordination_prompts, probs)
+    
+    def _coordination_scores_from_probs(self, coordination_prompts, probs) -> Dict:
+        """Converte as probabilidades dos prompts de coordenação em scores"""
         # Normalizar e mapear scores
         coordination_scores = {}
         for i, (prompt, prob) in enumerate(zip(coordination_prompts, probs)):
@@ -946,14 +1154,15 @@ class CLIPClassifier:
         # Garantir que a imagem seja RGB
         image = self._ensure_rgb_image(image)
         
-        # 1. Análise de cores usando processamento de imagem
-        color_analysis = self._analyze_image_colors(image)
-        
-        # 2. Análise usando CLIP com prompts de cores
-        clip_color_analysis = self._analyze_colors_with_clip(image)
-        
-        # 3. Combinar resultados
-        combined_result = self._combine_color_analyses(color_analysis, clip_color_analysis)
+        with stage_timer("color"):
+            # 1. Análise de cores usando processamento de imagem
+            color_analysis = self._analyze_image_colors(image)
+            
+            # 2. Análise usando CLIP com prompts de cores
+            clip_color_analysis = self._analyze_colors_with_clip(image)
+            
+            # 3. Combinar resultados
+            combined_result = self._combine_color_analyses(color_analysis, clip_color_analysis)
         
         return combined_result
     
@@ -1021,7 +1230,7 @@ class CLIPClassifier:
         ]
         
         # Tokenizar e inferir
-        text = clip.tokenize(color_prompts).to(self.device)
+        text = _tokenize(color_prompts).to(self.device)
         
         with torch.no_grad():
             image_features = self.model.encode_image(processed_image)
@@ -1029,9 +1238,13 @@ class CLIPClassifier:
             logits_per_image, _ = self.model(processed_image, text)
             probs = logits_per_image.softmax(dim=-1).cpu().numpy()[0]
         
+        return self._color_probabilities_to_analysis(probs)
+    
+    def _color_probabilities_to_analysis(self, probs) -> Dict:
+        """Converte as probabilidades de cada cor no resultado da análise de cores do CLIP"""
         # Encontrar a cor com maior probabilidade
         color_scores = {}
-        for i, (prompt, prob) in enumerate(zip(color_prompts, probs)):
+        for i, prob in enumerate(probs):
             color_name = self.colors[i]
             color_scores[color_name] = float(prob)
         
@@ -1101,6 +1314,21 @@ def classify_clothing_image(image: Image.Image, body_region: str = None) -> Tupl
     top_prediction = classifier.get_top_prediction(classifications)
     return classifications, top_prediction
 
+def classify_parts_batch(images: List[Image.Image], body_regions: List[str],
+                         detect_colors: bool = True) -> List[Dict]:
+    """
+    Função utilitária para classificar várias peças em uma única passada do CLIP
+    
+    Args:
+        images: Lista de imagens das peças
+        body_regions: Região do corpo de cada imagem
+        detect_colors: Se True, também analisa a cor de cada peça
+    
+    Returns:
+        Lista de dicionários com predictions, top_prediction e color_analysis
+    """
+    return classifier.classify_parts_batch(images, body_regions, detect_colors)
+
 def get_compatible_items(selected_item: Dict, target_regions: List[str] = None, 
                         top_k: int = 5) -> Dict[str, List[Dict]]:
     """
@@ -1172,6 +1400,19 @@ def analyze_complete_outfit_image(full_image: Image.Image, classified_parts: Dic
     """
     return classifier.analyze_complete_outfit_image(full_image, classified_parts)
 
+def analyze_complete_outfit_images(full_images: List[Image.Image], classified_parts_list: List[Dict]) -> List[Dict]:
+    """
+    Analisa vários outfits completos em uma única passada do CLIP
+    
+    Args:
+        full_images: Imagens completas
+        classified_parts_list: Classificações das partes de cada imagem
+        
+    Returns:
+        Lista com a análise completa de cada outfit
+    """
+    return classifier.analyze_complete_outfit_images(full_images, classified_parts_list)
+
 def detect_clothing_color(image: Image.Image) -> Dict:
     """
     Detecta a cor predominante de uma peça de roupa
@@ -0,0 +1,492 @@
+# -*- coding: utf-8 -*-
+"""
+Armazenamento dos recortes e visualizações das análises.
+
+Os recortes são codificados em JPEG e gravados por uma thread em segundo
+plano, fora do caminho da requisição. As chaves são particionadas por data e
+hash ("20261019/a3/torso_xxxx.jpg") para manter os diretórios pequenos, e um
+janitor remove os arquivos expirados (TTL) e os mais antigos quando o total
+passa do limite de tamanho.
+
+Backends (CROP_STORAGE_BACKEND):
+    local: disco em CROP_STORAGE_DIR (padrão static/body_parts)
+    s3:    bucket S3 ou compatível (boto3 opcional; s3_server.py é um stand-in local)
+"""
+import hashlib
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
+
+from PIL import Image
+
+from utils.metrics import stage_timer
+
+# Configuração via variáveis de ambiente
+CROP_STORAGE_BACKEND = os.getenv("CROP_STORAGE_BACKEND", "local").lower()
+CROP_STORAGE_DIR = os.getenv("CROP_STORAGE_DIR", os.path.join("static", "body_parts"))
+CROP_URL_PREFIX = "/api/v1/static/body-parts"
+CROP_TTL_SECONDS = float(os.getenv("CROP_TTL_SECONDS", "86400"))
+CROP_STORAGE_MAX_MB = float(os.getenv("CROP_STORAGE_MAX_MB", "2048"))
+CROP_JANITOR_INTERVAL = float(os.getenv("CROP_JANITOR_INTERVAL", "300"))
+CROP_WRITER_QUEUE_SIZE = int(os.getenv("CROP_WRITER_QUEUE_SIZE", "512"))
+CROP_JPEG_QUALITY = int(os.getenv("CROP_JPEG_QUALITY", "95"))
+CROP_S3_BUCKET = os.getenv("CROP_S3_BUCKET", "fashion-crops")
+CROP_S3_PREFIX = os.getenv("CROP_S3_PREFIX", "body_parts/")
+CROP_S3_ENDPOINT_URL = os.getenv("CROP_S3_ENDPOINT_URL") or None
+
+# Conteúdo aceito por submit: bytes já codificados, imagem PIL ou função que gera a imagem
+CropSource = Union[bytes, Image.Image, Callable[[], Image.Image]]
+
+
+def storage_key(filename: str, when: Optional[datetime] = None) -> str:
+    """
+    Chave particionada por data e hash do nome
+
+    Args:
+        filename: Nome do arquivo (ex: torso_ab12cd34_20261019_101500.jpg)
+        when: Data da partição (padrão: agora)
+
+    Returns:
+        Chave "AAAAMMDD/hh/filename"
+    """
+    day = (when or datetime.now()).strftime("%Y%m%d")
+    shard = hashlib.sha1(filename.encode("utf-8")).hexdigest()[:2]
+    return f"{day}/{shard}/{filename}"
+
+
+def eviction_unit(key: str) -> str:
+    """
+    Grupo removido de uma vez pelo janitor: a pasta da sessão
+    ("AAAAMMDD/hh/sessão/arquivo", ver utils/artifacts.py) ou o próprio arquivo
+
+    Remover só o frame ou o manifesto de uma sessão deixaria os recortes
+    ainda não renderizados sem origem (404).
+    """
+    parts = key.split("/")
+    return "/".join(parts[:3]) if len(parts) > 3 else key
+
+
+def crop_url(key: str) -> str:
+    """URL pública de uma chave"""
+    return f"{CROP_URL_PREFIX}/{key}"
+
+
+def is_valid_key(key: str) -> bool:
+    """Rejeita chaves absolutas ou com ".." (path traversal)"""
+    return bool(key) and not key.startswith(("/", "\\")) and ".." not in key.replace("\\", "/").split("/")
+
+
+def encode_jpeg(image: Image.Image, quality: int = CROP_JPEG_QUALITY) -> bytes:
+    """Codifica uma imagem PIL em JPEG"""
+    buffer = io.BytesIO()
+    with stage_timer("jpeg_encode"):
+        image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+class StorageBackend:
+    """Interface dos backends de armazenamento"""
+
+    name = "base"
+
+    def put(self, key: str, data: bytes, content_type: str = "image/jpeg"):
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        """Itera sobre (chave, tamanho em bytes, mtime) de todos os objetos"""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Caminho em disco do objeto, quando o backend é local"""
+        return None
+
+
+class LocalDiskBackend(StorageBackend):
+    """Arquivos em disco, um subdiretório por partição"""
+
+    name = "local"
+
+    def __init__(self, root: str = CROP_STORAGE_DIR):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes, content_type: str = "image/jpeg"):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Escrita atômica: o arquivo só aparece completo
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str):
+        path = self._path(key)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        # Remove as partições que ficaram vazias
+        directory = os.path.dirname(path)
+        while os.path.abspath(directory) != os.path.abspath(self.root):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                yield key, stat.st_size, stat.st_mtime
+
+    def local_path(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        return path if os.path.isfile(path) else None
+
+
+class S3Backend(StorageBackend):
+    """Bucket S3 ou compatível (MinIO, s3_server.py) via boto3"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str = CROP_S3_BUCKET, prefix: str = CROP_S3_PREFIX,
+                 endpoint_url: Optional[str] = CROP_S3_ENDPOINT_URL):
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("CROP_STORAGE_BACKEND=s3 requer o pacote boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix
+        config = None
+        if endpoint_url:
+            # Serviços compatíveis (MinIO, s3_server.py) usam endereçamento por caminho
+            from botocore.config import Config
+            config = Config(s3={"addressing_style": "path"})
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, config=config)
+
+    def put(self, key: str, data: bytes, content_type: str = "image/jpeg"):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data, ContentType=content_type)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def iter_objects(self) -> Iterator[Tuple[str, int, float]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):], obj["Size"], obj["LastModified"].timestamp()
+
+
+def create_storage_backend(backend: str = CROP_STORAGE_BACKEND) -> StorageBackend:
+    """
+    Cria o backend configurado
+
+    Args:
+        backend: "local" ou "s3"
+
+    Returns:
+        Backend de armazenamento
+    """
+    if backend == "s3":
+        return S3Backend()
+    if backend != "local":
+        print(f"⚠️ CROP_STORAGE_BACKEND desconhecido: {backend}. Usando disco local.")
+    return LocalDiskBackend()
+
+
+# ---------------------------------------------------------------------------
+# Armazenamento com escrita em segundo plano
+# ---------------------------------------------------------------------------
+
+class CropStorage:
+    """Escrita assíncrona dos recortes com expiração por TTL e limite de tamanho"""
+
+    def __init__(self, backend: StorageBackend, ttl_seconds: float = CROP_TTL_SECONDS,
+                 max_mb: float = CROP_STORAGE_MAX_MB, queue_size: int = CROP_WRITER_QUEUE_SIZE):
+        """
+        Inicializa o armazenamento
+
+        Args:
+            backend: Backend onde os arquivos são gravados
+            ttl_seconds: Idade máxima de um arquivo (0 desativa)
+            max_mb: Tamanho máximo somado dos arquivos (0 desativa)
+            queue_size: Tamanho da fila de escrita
+        """
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        # Recortes aguardando escrita, servidos direto da memória se pedidos antes
+        self._pending: Dict[str, CropSource] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._janitor: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.written = 0
+        self.inline_writes = 0
+        self.write_errors = 0
+        self.evicted = 0
+        self.last_sweep: Optional[Dict] = None
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._writer_loop, name="crop-writer", daemon=True)
+                self._writer.start()
+
+    def submit(self, key: str, source: CropSource) -> str:
+        """
+        Agenda a gravação de um recorte e retorna a URL imediatamente
+
+        Args:
+            key: Chave do arquivo (ver storage_key)
+            source: Bytes JPEG, imagem PIL ou função que gera a imagem
+
+        Returns:
+            URL pública do recorte
+        """
+        self._ensure_writer()
+        with self._lock:
+            self._pending[key] = source
+        try:
+            self._queue.put_nowait(key)
+        except queue.Full:
+            # Fila cheia: grava na thread que chamou em vez de descartar
+            self.inline_writes += 1
+            self._write(key)
+        return crop_url(key)
+
+    def save(self, filename: str, source: CropSource) -> Tuple[str, str]:
+        """
+        Atalho para submit com a chave particionada do nome
+
+        Returns:
+            Tupla (chave, URL)
+        """
+        key = storage_key(filename)
+        return key, self.submit(key, source)
+
+    def _render(self, source: CropSource) -> bytes:
+        """Codifica o conteúdo agendado em JPEG"""
+        if callable(source):
+            source = source()
+        if isinstance(source, Image.Image):
+            return encode_jpeg(source)
+        return source
+
+    def _write(self, key: str):
+        with self._lock:
+            source = self._pending.get(key)
+        if source is None:
+            return
+        try:
+            data = self._render(source)
+            with stage_timer("jpeg_write"):
+                self.backend.put(key, data)
+            self.written += 1
+        except Exception as e:
+            self.write_errors += 1
+            print(f"❌ Erro ao gravar recorte {key}: {e}")
+        finally:
+            with self._lock:
+                if self._pending.get(key) is source:
+                    del self._pending[key]
+
+    def _writer_loop(self):
+        while True:
+            key = self._queue.get()
+            try:
+                if key is None:
+                    return
+                self._write(key)
+            finally:
+                self._queue.task_done()
+
+    def read(self, key: str) -> Optional[bytes]:
+        """
+        Lê um recorte (da fila de escrita, se ainda não gravado)
+
+        Args:
+            key: Chave do arquivo
+
+        Returns:
+            Bytes JPEG ou None se não existir
+        """
+        with self._lock:
+            source = self._pending.get(key)
+        if source is not None:
+            return self._render(source)
+        return self.backend.get(key)
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Caminho em disco do recorte já gravado (backend local)"""
+        with self._lock:
+            if key in self._pending:
+                return None
+        return self.backend.local_path(key)
+
+    def flush(self, timeout: float = 30.0):
+        """Aguarda a fila de escrita esvaziar"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+
+    def sweep(self) -> Dict:
+        """
+        Remove os arquivos expirados e, se preciso, os mais antigos até o limite de tamanho
+
+        As sessões (frame, manifesto e artefatos) são removidas inteiras, pela
+        data do arquivo mais recente da sessão.
+
+        Returns:
+            Resumo da varredura
+        """
+        now = time.time()
+        # grupo -> [mtime mais recente, tamanho somado, chaves]
+        units: Dict[str, list] = {}
+        for key, size, mtime in self.backend.iter_objects():
+            unit = units.setdefault(eviction_unit(key), [0.0, 0, []])
+            unit[0] = max(unit[0], mtime)
+            unit[1] += size
+            unit[2].append(key)
+
+        def remove(keys) -> int:
+            for key in keys:
+                self.backend.delete(key)
+            return len(keys)
+
+        objects = []
+        expired = 0
+        for newest, size, keys in units.values():
+            if self.ttl_seconds > 0 and now - newest > self.ttl_seconds:
+                expired += remove(keys)
+            else:
+                objects.append((newest, size, keys))
+
+        total_bytes = sum(size for _, size, _ in objects)
+        object_count = sum(len(keys) for _, _, keys in objects)
+        over_size = 0
+        if self.max_bytes > 0 and total_bytes > self.max_bytes:
+            for newest, size, keys in sorted(objects, key=lambda unit: unit[0]):
+                if total_bytes <= self.max_bytes:
+                    break
+                over_size += remove(keys)
+                total_bytes -= size
+
+        self.evicted += expired + over_size
+        self.last_sweep = {
+            "timestamp": now,
+            "expired": expired,
+            "evicted_for_size": over_size,
+            "objects": object_count - over_size,
+            "total_mb": round(total_bytes / (1024 * 1024), 2)
+        }
+        return self.last_sweep
+
+    def _janitor_loop(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"❌ Erro na limpeza dos recortes: {e}")
+
+    def start(self, janitor_interval: float = CROP_JANITOR_INTERVAL):
+        """Inicia a thread de escrita e o janitor"""
+        self._ensure_writer()
+        if janitor_interval > 0 and (self._janitor is None or not self._janitor.is_alive()):
+            self._stop.clear()
+            self._janitor = threading.Thread(
+                target=self._janitor_loop, args=(janitor_interval,), name="crop-janitor", daemon=True
+            )
+            self._janitor.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Grava os recortes pendentes e encerra as threads"""
+        self._stop.set()
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+        self._writer = None
+        if self._janitor is not None:
+            self._janitor.join(timeout)
+            self._janitor = None
+
+    def stats(self) -> Dict:
+        """Métricas do armazenamento"""
+        return {
+            "backend": self.backend.name,
+            "pending_writes": len(self._pending),
+            "written": self.written,
+            "inline_writes": self.inline_writes,
+            "write_errors": self.write_errors,
+            "evicted": self.evicted,
+            "ttl_seconds": self.ttl_seconds,
+            "max_mb": round(self.max_bytes / (1024 * 1024), 2),
+            "last_sweep": self.last_sweep
+        }
+
+
+# Instância global
+crop_storage = CropStorage(create_storage_backend())
+
+
+def save_crop(filename: str, source: CropSource) -> Tuple[str, str]:
+    """
+    Agenda a gravação de um recorte
+
+    Args:
+        filename: Nome do arquivo
+        source: Bytes JPEG, imagem PIL ou função que gera a imagem
+
+    Returns:
+        Tupla (chave, URL)
+    """
+    return crop_storage.save(filename, source)
+
+
+def start_crop_storage():
+    """Inicia a escrita em segundo plano e o janitor"""
+    crop_storage.start()
+
+
+def stop_crop_storage():
+    """Grava os recortes pendentes e encerra as threads"""
+    crop_storage.stop()
@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+"""
+Backend de detecção em processos separados.
+
+MediaPipe e o código Python de detect_body_parts seguram o GIL por longos
+trechos, então threads não conseguem ocupar todos os núcleos. Este módulo
+mantém um pool de processos onde cada worker possui seu próprio
+BodyPartsDetector. Os frames são passados por memória compartilhada (sem
+pickle da imagem) e os resultados voltam como arrays numpy compactos.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.metrics import capture_stages, observe_stages
+
+logger = logging.getLogger(__name__)
+
+# Ordem fixa das partes no array compacto de resultados
+PART_NAMES = ("torso", "legs", "feet", "head")
+
+# Configuração via variáveis de ambiente
+DETECTION_BACKEND = os.getenv("DETECTION_BACKEND", "local")  # "local" ou "process"
+DETECTION_WORKERS = int(os.getenv("DETECTION_WORKERS", "0")) or max(1, (os.cpu_count() or 2) // 2)
+DETECTION_TIMEOUT = float(os.getenv("DETECTION_TIMEOUT", "60"))
+
+# Detector do processo worker (criado no initializer)
+_worker_detector = None
+
+
+def _init_worker():
+    """Inicializa o detector dentro do processo worker"""
+    global _worker_detector
+    # A instância global do detector é preguiçosa: carrega os modelos antes da primeira tarefa
+    from utils.body_parts_detector import detector
+    detector.load_models()
+    _worker_detector = detector
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """
+    Anexa um bloco de memória compartilhada criado pelo processo da API
+
+    O processo da API é o dono do bloco (e quem chama unlink). Os workers
+    compartilham o resource_tracker do processo pai, então basta não
+    rastrear o bloco novamente quando a versão do Python permitir.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    return shared_memory.SharedMemory(name=name)
+
+
+def encode_detection(result: Dict) -> Tuple:
+    """
+    Converte o resultado de detect_body_parts em uma tupla compacta de arrays
+
+    Args:
+        result: Dicionário retornado por BodyPartsDetector.detect_body_parts
+
+    Returns:
+        Tupla (success, error, parts, people, width, height) onde parts é um
+        array int32 (len(PART_NAMES), 4) e people um array float32 (N, 4)
+    """
+    parts = np.full((len(PART_NAMES), 4), -1, dtype=np.int32)
+    for i, part_name in enumerate(PART_NAMES):
+        part = result.get("body_parts", {}).get(part_name)
+        if part is not None:
+            parts[i] = part["bbox"]
+    people = np.asarray(result.get("people", []), dtype=np.float32).reshape(-1, 4)
+    dims = result.get("image_dimensions", {})
+    return (
+        bool(result["success"]),
+        result.get("error"),
+        parts,
+        people,
+        int(dims.get("width", 0)),
+        int(dims.get("height", 0)),
+    )
+
+
+def decode_detection(encoded: Tuple) -> Dict:
+    """
+    Reconstrói o dicionário de detecção a partir da tupla compacta
+
+    Args:
+        encoded: Tupla retornada por encode_detection
+
+    Returns:
+        Dicionário no mesmo formato de BodyPartsDetector.detect_body_parts
+    """
+    success, error, parts, people, width, height = encoded
+    if not success:
+        return {
+            "success": False,
+            "error": error,
+            "body_parts": {},
+            "people": []
+        }
+    body_parts = {}
+    for i, part_name in enumerate(PART_NAMES):
+        x_min, y_min, x_max, y_max = (int(v) for v in parts[i])
+        if x_min < 0:
+            continue
+        body_parts[part_name] = {
+            "bbox": (x_min, y_min, x_max, y_max),
+            "area": (x_max - x_min) * (y_max - y_min)
+        }
+    return {
+        "success": True,
+        "body_parts": body_parts,
+        "people": people.tolist(),
+        "image_dimensions": {"width": width, "height": height}
+    }
+
+
+def encode_people_detection(result: Dict) -> Tuple:
+    """
+    Converte o resultado de detect_people_body_parts em uma tupla compacta
+
+    Args:
+        result: Dicionário retornado por BodyPartsDetector.detect_people_body_parts
+
+    Returns:
+        Tupla (success, error, parts, person_boxes, people_detected, width, height)
+        onde parts é um array int32 (P, len(PART_NAMES), 4) e person_boxes um
+        array float32 (P, 4)
+    """
+    people = result.get("people", [])
+    parts = np.full((len(people), len(PART_NAMES), 4), -1, dtype=np.int32)
+    person_boxes = np.zeros((len(people), 4), dtype=np.float32)
+    for p, person in enumerate(people):
+        person_boxes[p] = person["person_bbox"]
+        for i, part_name in enumerate(PART_NAMES):
+            part = person["body_parts"].get(part_name)
+            if part is not None:
+                parts[p, i] = part["bbox"]
+    dims = result.get("image_dimensions", {})
+    return (
+        bool(result["success"]),
+        result.get("error"),
+        parts,
+        person_boxes,
+        int(result.get("people_detected", 0)),
+        int(dims.get("width", 0)),
+        int(dims.get("height", 0)),
+    )
+
+
+def decode_people_detection(encoded: Tuple) -> Dict:
+    """
+    Reconstrói o dicionário de detecção multi-pessoa a partir da tupla compacta
+
+    Args:
+        encoded: Tupla retornada por encode_people_detection
+
+    Returns:
+        Dicionário no mesmo formato de BodyPartsDetector.detect_people_body_parts
+    """
+    success, error, parts, person_boxes, people_detected, width, height = encoded
+    if not success:
+        return {
+            "success": False,
+            "error": error,
+            "people": [],
+            "people_detected": people_detected
+        }
+    people = []
+    for p in range(len(person_boxes)):
+        single = decode_detection((True, None, parts[p], np.zeros((0, 4)), width, height))
+        people.append({
+            "person_index": p,
+            "person_bbox": person_boxes[p].tolist(),
+            "body_parts": single["body_parts"]
+        })
+    return {
+        "success": True,
+        "people": people,
+        "people_detected": people_detected,
+        "image_dimensions": {"width": width, "height": height}
+    }
+
+
+def _detect_in_worker(shm_name: str, shape: Tuple, dtype: str, settings: Dict,
+                      multi_person: bool = False) -> Tuple:
+    """
+    Executa a detecção no worker lendo o frame da memória compartilhada
+
+    Returns:
+        Tupla (resultado compacto, durações dos estágios) - as métricas do
+        worker não são expostas, então as durações voltam para o processo da API
+    """
+    shm = _attach_shared_memory(shm_name)
+    try:
+        frame = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        try:
+            _worker_detector.apply_settings(settings)
+            with capture_stages() as stages:
+                if multi_person:
+                    result = _worker_detector.detect_people_body_parts(frame)
+                else:
+                    result = _worker_detector.detect_body_parts(frame)
+        finally:
+            del frame
+        return (encode_people_detection(result) if multi_person else encode_detection(result)), stages
+    finally:
+        shm.close()
+
+
+def _collect(payload: Tuple) -> Tuple:
+    """Registra as durações medidas no worker e retorna o resultado compacto"""
+    encoded, stages = payload
+    observe_stages(stages)
+    return encoded
+
+
+def _ping_worker() -> int:
+    """Força a inicialização do worker e retorna seu PID"""
+    return os.getpid()
+
+
+class DetectionPool:
+    """Pool de processos para detecção de partes do corpo"""
+
+    def __init__(self, workers: int = DETECTION_WORKERS, timeout: float = DETECTION_TIMEOUT):
+        """
+        Inicializa o pool de processos
+
+        Args:
+            workers: Número de processos worker
+            timeout: Tempo máximo (segundos) de espera por uma detecção
+        """
+        self.workers = workers
+        self.timeout = timeout
+        # Detecções enviadas e ainda não liberadas (aguardando ou em execução)
+        self.inflight = 0
+        self._inflight_lock = threading.Lock()
+        # Recriações do executor depois de um worker morrer (BrokenProcessPool)
+        self.restarts = 0
+        self._executor_lock = threading.Lock()
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # spawn evita herdar threads do torch/MediaPipe do processo pai via fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+
+    def _recover(self, broken: ProcessPoolExecutor):
+        """
+        Substitui um executor quebrado (um worker morreu) por um novo
+
+        Requisições simultâneas que falharam no mesmo executor recriam o pool uma única vez.
+
+        Args:
+            broken: Executor em que a falha ocorreu
+        """
+        with self._executor_lock:
+            if self._executor is not broken:
+                return
+            logger.warning("Pool de detecção quebrado (worker encerrado); recriando os processos")
+            self._executor = self._create_executor()
+            self.restarts += 1
+        broken.shutdown(wait=False)
+
+    def warmup(self):
+        """Inicia todos os workers (carregando os modelos) antes da primeira requisição"""
+        futures = [self._executor.submit(_ping_worker) for _ in range(self.workers)]
+        pids = {future.result() for future in futures}
+        logger.info(f"Pool de detecção pronto com {len(pids)} processo(s)")
+
+    def _submit(self, pil_image: Image.Image, settings: Dict, multi_person: bool = False):
+        """
+        Copia o frame para memória compartilhada e envia para um worker
+
+        O bloco só é liberado quando o future termina (concluído, com erro ou
+        cancelado): uma detecção que ainda está na fila depois de um timeout
+        não pode encontrar o bloco já removido.
+
+        Returns:
+            (future, executor usado)
+        """
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+        image_np = np.asarray(pil_image)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, image_np.nbytes))
+        try:
+            frame = np.ndarray(image_np.shape, dtype=image_np.dtype, buffer=shm.buf)
+            frame[...] = image_np
+            del frame
+            args = (_detect_in_worker, shm.name, image_np.shape, image_np.dtype.str, settings, multi_person)
+            executor = self._executor
+            try:
+                future = executor.submit(*args)
+            except BrokenProcessPool:
+                self._recover(executor)
+                executor = self._executor
+                future = executor.submit(*args)
+        except Exception:
+            shm.close()
+            shm.unlink()
+            raise
+        with self._inflight_lock:
+            self.inflight += 1
+        future.add_done_callback(lambda _: self._release(shm))
+        return future, executor
+
+    def _release(self, shm: shared_memory.SharedMemory):
+        """Libera o bloco de memória compartilhada"""
+        shm.close()
+        shm.unlink()
+        with self._inflight_lock:
+            self.inflight -= 1
+
+    def _detect(self, pil_image: Image.Image, settings: Dict, multi_person: bool = False) -> Dict:
+        """Detecção bloqueante; se o worker morrer, recria o pool e tenta mais uma vez"""
+        decode = decode_people_detection if multi_person else decode_detection
+        for attempt in range(2):
+            future, executor = self._submit(pil_image, settings, multi_person)
+            try:
+                return decode(_collect(future.result(timeout=self.timeout)))
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                self._recover(executor)
+            finally:
+                # Timeout: tira da fila a detecção que ainda não começou (não ocupa o worker)
+                future.cancel()
+
+    async def _detect_async(self, pil_image: Image.Image, settings: Dict, multi_person: bool = False) -> Dict:
+        """Mesmo que _detect, aguardando o worker sem bloquear o event loop"""
+        decode = decode_people_detection if multi_person else decode_detection
+        for attempt in range(2):
+            future, executor = self._submit(pil_image, settings, multi_person)
+            try:
+                return decode(_collect(await asyncio.wait_for(asyncio.wrap_future(future), timeout=self.timeout)))
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                self._recover(executor)
+            finally:
+                future.cancel()
+
+    def detect_from_pil(self, pil_image: Image.Image, settings: Dict) -> Dict:
+        """
+        Detecta partes do corpo em um worker (bloqueante)
+
+        Args:
+            pil_image: Imagem PIL
+            settings: Configurações do detector (BodyPartsDetector.get_settings)
+
+        Returns:
+            Dicionário com as detecções
+        """
+        return self._detect(pil_image, settings)
+
+    def detect_many(self, pil_images: List[Image.Image], settings: Dict) -> List[Dict]:
+        """
+        Detecta partes do corpo em várias imagens, distribuindo-as entre os workers
+
+        Se um worker morrer, o pool é recriado e o lote é reenviado uma vez.
+
+        Args:
+            pil_images: Lista de imagens PIL
+            settings: Configurações do detector (BodyPartsDetector.get_settings)
+
+        Returns:
+            Lista de detecções na mesma ordem das imagens
+        """
+        for attempt in range(2):
+            submitted = []
+            try:
+                for pil_image in pil_images:
+                    submitted.append(self._submit(pil_image, settings))
+                return [decode_detection(_collect(future.result(timeout=self.timeout))) for future, _ in submitted]
+            except BrokenProcessPool:
+                if attempt:
+                    raise
+                for _, executor in submitted:
+                    self._recover(executor)
+            finally:
+                for future, _ in submitted:
+                    future.cancel()
+
+    async def detect_from_pil_async(self, pil_image: Image.Image, settings: Dict) -> Dict:
+        """
+        Detecta partes do corpo em um worker sem bloquear o event loop
+
+        Args:
+            pil_image: Imagem PIL
+            settings: Configurações do detector (BodyPartsDetector.get_settings)
+
+        Returns:
+            Dicionário com as detecções
+        """
+        return await self._detect_async(pil_image, settings)
+
+    def detect_people_from_pil(self, pil_image: Image.Image, settings: Dict) -> Dict:
+        """
+        Detecta as partes do corpo de todas as pessoas em um worker (bloqueante)
+
+        Args:
+            pil_image: Imagem PIL
+            settings: Configurações do detector (BodyPartsDetector.get_settings)
+
+        Returns:
+            Dicionário com a lista de pessoas e suas partes do corpo
+        """
+        return self._detect(pil_image, settings, multi_person=True)
+
+    async def detect_people_from_pil_async(self, pil_image: Image.Image, settings: Dict) -> Dict:
+        """
+        Detecta as partes do corpo de todas as pessoas sem bloquear o event loop
+
+        Args:
+            pil_image: Imagem PIL
+            settings: Configurações do detector (BodyPartsDetector.get_settings)
+
+        Returns:
+            Dicionário com a lista de pessoas e suas partes do corpo
+        """
+        return await self._detect_async(pil_image, settings, multi_person=True)
+
+    def shutdown(self):
+        """Encerra os processos worker depois de concluir as detecções já enviadas"""
+        self._executor.shutdown(wait=True)
+
+
+# Instância global do pool (None quando o backend local está ativo)
+_pool: Optional[DetectionPool] = None
+
+
+def get_detection_pool() -> Optional[DetectionPool]:
+    """Retorna o pool ativo ou None se a detecção roda no próprio processo"""
+    return _pool
+
+
+def get_detection_backend() -> Dict:
+    """
+    Retorna informações sobre o backend de detecção ativo
+
+    Returns:
+        Dicionário com backend e número de workers
+    """
+    return {
+        "backend": "process" if _pool is not None else "local",
+        "workers": _pool.workers if _pool is not None else 0,
+        "restarts": _pool.restarts if _pool is not None else 0
+    }
+
+
+def start_detection_pool(workers: int = DETECTION_WORKERS) -> DetectionPool:
+    """
+    Ativa o backend de processos (substituindo um pool existente)
+
+    O novo pool é aquecido antes da troca; o antigo termina as detecções já
+    enviadas antes de encerrar os processos.
+
+    Args:
+        workers: Número de processos worker
+
+    Returns:
+        Pool ativo
+    """
+    global _pool
+    pool = DetectionPool(workers=workers)
+    pool.warmup()
+    previous, _pool = _pool, pool
+    if previous is not None:
+        previous.shutdown()
+    return pool
+
+
+def stop_detection_pool():
+    """Desativa o backend de processos, voltando para a detecção local (sem cancelar as detecções em andamento)"""
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
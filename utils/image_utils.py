@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
 from PIL import Image
+import io
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from utils.metrics import stage_timer
+from utils.tracing import current_span
 
 def ensure_rgb_image(image: Image.Image) -> Image.Image:
     """
@@ -20,4 +27,110 @@ def ensure_rgb_image(image: Image.Image) -> Image.Image:
         # Converte outros formatos para RGB
         return image.convert('RGB')
     else:
-        return image 
\ No newline at end of file
+        return image 
+
+def decode_image(image_bytes: bytes) -> Image.Image:
+    """
+    Decodifica os bytes de uma imagem (estágio "decode" das métricas)
+    
+    Args:
+        image_bytes: Bytes da imagem
+        
+    Returns:
+        Imagem PIL em formato RGB, já decodificada
+    """
+    with stage_timer("decode"):
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+        span = current_span()
+        if span is not None:
+            span.set_attributes({
+                "image.bytes": len(image_bytes),
+                "image.format": image.format or "unknown",
+                "image.width": image.width,
+                "image.height": image.height
+            })
+        return ensure_rgb_image(image)
+
+# Tamanho máximo de imagens enviadas como corpo binário cru
+RAW_IMAGE_MAX_MB = float(os.getenv("RAW_IMAGE_MAX_MB", "25"))
+
+
+class ImageTooLargeError(ValueError):
+    """Corpo da requisição acima de RAW_IMAGE_MAX_MB"""
+
+
+async def read_raw_image_body(request, max_bytes: Optional[int] = None) -> Tuple[bytes, str]:
+    """
+    Lê uma imagem enviada como corpo binário (application/octet-stream ou image/*)
+
+    Evita o overhead de base64 (+33%) e do parse JSON: os chunks do corpo são
+    concatenados uma única vez, sem cópias intermediárias.
+
+    Args:
+        request: Requisição Starlette/FastAPI
+        max_bytes: Limite de tamanho (padrão RAW_IMAGE_MAX_MB)
+
+    Returns:
+        Tupla (bytes da imagem, content-type)
+    """
+    max_bytes = max_bytes or int(RAW_IMAGE_MAX_MB * 1024 * 1024)
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "application/octet-stream" and not content_type.startswith("image/"):
+        raise ValueError("Content-Type deve ser application/octet-stream ou image/*")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ImageTooLargeError(f"Imagem excede o limite de {RAW_IMAGE_MAX_MB} MB")
+
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        if chunk:
+            size += len(chunk)
+            if size > max_bytes:
+                raise ImageTooLargeError(f"Imagem excede o limite de {RAW_IMAGE_MAX_MB} MB")
+            chunks.append(chunk)
+    if size == 0:
+        raise ValueError("Corpo da requisição está vazio")
+    return (chunks[0] if len(chunks) == 1 else b"".join(chunks)), content_type
+
+
+def encode_image_bytes(image: Image.Image, format: str = "JPEG", quality: int = 95) -> bytes:
+    """
+    Codifica uma imagem PIL em bytes
+
+    Args:
+        image: Imagem PIL
+        format: Formato de saída (JPEG, PNG, WEBP)
+        quality: Qualidade para formatos com perda
+
+    Returns:
+        Bytes da imagem codificada
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_multipart_mixed(parts: List[Tuple[Dict[str, str], bytes]]) -> Tuple[bytes, str]:
+    """
+    Monta um corpo multipart/mixed
+
+    Args:
+        parts: Lista de (headers da parte, conteúdo)
+
+    Returns:
+        Tupla (corpo, content-type com o boundary)
+    """
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for headers, content in parts:
+        body += f"--{boundary}\r\n".encode("ascii")
+        for name, value in headers.items():
+            body += f"{name}: {value}\r\n".encode("latin-1")
+        body += b"\r\n"
+        body += content
+        body += b"\r\n"
+    body += f"--{boundary}--\r\n".encode("ascii")
+    return bytes(body), f"multipart/mixed; boundary={boundary}"
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+"""
+Fila de jobs persistente em SQLite com um pool de workers em threads.
+
+Requisições pesadas (análise completa, lotes, vídeo) são enfileiradas e
+processadas em segundo plano, reutilizando o classificador e o detector já
+carregados no processo. A fila sobrevive a reinícios: jobs que estavam em
+execução voltam para a fila na inicialização. Resultados expiram após
+JOB_RESULT_TTL_SECONDS.
+"""
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+# Configuração via variáveis de ambiente
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join("data", "jobs.db"))
+# Desativada por padrão: a fila grava os payloads (imagens, vídeos) em pickle no JOBS_DB_PATH
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+
+# Prioridades (maior valor é processado primeiro)
+JOB_PRIORITIES = {"low": 0, "normal": 5, "high": 10}
+
+# Estados de um job
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+# Handlers por tipo de job: handler(payload) -> resultado serializável em JSON
+_handlers: Dict[str, Callable[[Any], Dict]] = {}
+
+
+def register_job_handler(kind: str, handler: Callable[[Any], Dict]):
+    """
+    Registra a função que processa um tipo de job
+
+    Args:
+        kind: Tipo do job (ex: "analysis", "video")
+        handler: Função que recebe o payload e retorna o resultado
+    """
+    _handlers[kind] = handler
+
+
+class JobQueue:
+    """Fila de jobs persistente com workers em threads"""
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, result_ttl: float = JOB_RESULT_TTL_SECONDS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        """
+        Inicializa a fila e recupera jobs interrompidos
+
+        Args:
+            db_path: Caminho do banco SQLite
+            result_ttl: Tempo (segundos) que um resultado fica disponível
+            poll_interval: Intervalo máximo entre verificações da fila
+        """
+        self.db_path = db_path
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        # Workers ainda no loop; com close() pedido, o último a sair fecha o banco
+        self._active_workers = 0
+        self._closing = False
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload BLOB,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    expires_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at)")
+            # Jobs interrompidos por um reinício voltam para a fila
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?",
+                (STATUS_QUEUED, STATUS_RUNNING)
+            )
+
+    @property
+    def workers(self) -> int:
+        """Número de workers ativos"""
+        return sum(1 for thread in self._threads if thread.is_alive())
+
+    def start(self, workers: int = JOB_WORKERS):
+        """
+        Inicia os workers
+
+        Args:
+            workers: Número de threads processando a fila
+        """
+        self._stopping.clear()
+        for i in range(workers):
+            with self._lock:
+                self._active_workers += 1
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        """Sinaliza os workers para parar e aguarda o job em andamento"""
+        self._stopping.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+    def close(self):
+        """
+        Para os workers e fecha o banco
+
+        Um job que passe do timeout de stop() continua até o fim; nesse caso o
+        banco é fechado pelo último worker, depois de gravar o estado final.
+        """
+        with self._lock:
+            self._closing = True
+        self.stop()
+        with self._lock:
+            if self._active_workers == 0:
+                self._conn.close()
+
+    def _worker_exited(self):
+        with self._lock:
+            self._active_workers -= 1
+            if self._closing and self._active_workers == 0:
+                self._conn.close()
+
+    def submit(self, kind: str, payload: Any, priority: str = "normal") -> str:
+        """
+        Enfileira um job
+
+        Args:
+            kind: Tipo do job (precisa de um handler registrado)
+            payload: Entrada do job (serializada com pickle)
+            priority: "low", "normal" ou "high"
+
+        Returns:
+            ID do job
+        """
+        if kind not in _handlers:
+            raise ValueError(f"Tipo de job desconhecido: {kind}")
+        if priority not in JOB_PRIORITIES:
+            raise ValueError(f"Prioridade inválida: {priority}. Use: {', '.join(JOB_PRIORITIES)}")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, priority, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, STATUS_QUEUED, JOB_PRIORITIES[priority], pickle.dumps(payload), time.time())
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        Retorna o estado (e o resultado, se concluído) de um job
+
+        Args:
+            job_id: ID do job
+
+        Returns:
+            Dicionário com o job ou None se não existir/expirou
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, priority, result, error, cancel_requested, created_at, started_at, finished_at, expires_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == STATUS_QUEUED:
+                position = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND (priority > ? OR (priority = ? AND created_at < ?))",
+                    (STATUS_QUEUED, row["priority"], row["priority"], row["created_at"])
+                ).fetchone()[0]
+        if row["expires_at"] is not None and row["expires_at"] < time.time():
+            return None
+        priority_name = next((name for name, value in JOB_PRIORITIES.items() if value == row["priority"]), str(row["priority"]))
+        return {
+            "job_id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "priority": priority_name,
+            "queue_position": position,
+            "cancel_requested": bool(row["cancel_requested"]),
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "expires_at": row["expires_at"],
+            "error": row["error"],
+            "result": json.loads(row["result"]) if row["result"] else None
+        }
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancela um job
+
+        Jobs na fila são cancelados imediatamente; jobs em execução terminam a
+        etapa atual e têm o resultado descartado.
+
+        Args:
+            job_id: ID do job
+
+        Returns:
+            Novo estado do job ou None se não existir
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == STATUS_QUEUED:
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, payload = NULL, finished_at = ?, expires_at = ? WHERE id = ?",
+                    (STATUS_CANCELLED, now, now + self.result_ttl, job_id)
+                )
+                return STATUS_CANCELLED
+            if row["status"] == STATUS_RUNNING:
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row["status"]
+
+    def stats(self) -> Dict:
+        """Contagem de jobs por estado"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS total FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING) + FINISHED_STATUSES}
+        counts.update({row["status"]: row["total"] for row in rows})
+        return {
+            "workers": self.workers,
+            "result_ttl_seconds": self.result_ttl,
+            "jobs": counts
+        }
+
+    def purge_expired(self) -> int:
+        """Remove jobs concluídos cujo resultado expirou"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+            )
+        return cursor.rowcount
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        """Marca o próximo job da fila como em execução e o retorna"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, kind, payload FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1",
+                    (STATUS_QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                        (STATUS_RUNNING, time.time(), row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return row
+
+    def _finish(self, job_id: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Grava o resultado (ou erro) de um job"""
+        now = time.time()
+        with self._lock:
+            cancelled = self._conn.execute(
+                "SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()["cancel_requested"]
+            if cancelled:
+                status, result, error = STATUS_CANCELLED, None, None
+            else:
+                status = STATUS_FAILED if error is not None else STATUS_SUCCEEDED
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, payload = NULL, result = ?, error = ?, finished_at = ?, expires_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, now, now + self.result_ttl, job_id)
+            )
+
+    def _worker_loop(self):
+        """Processa jobs até a fila ser parada"""
+        try:
+            self._process_jobs()
+        finally:
+            self._worker_exited()
+
+    def _process_jobs(self):
+        while not self._stopping.is_set():
+            try:
+                row = self._claim_next()
+            except Exception as e:
+                print(f"❌ Erro ao ler a fila de jobs: {e}")
+                row = None
+            if row is None:
+                self.purge_expired()
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+                continue
+            try:
+                result = _handlers[row["kind"]](pickle.loads(row["payload"]))
+                self._finish(row["id"], result=result)
+            except Exception as e:
+                self._finish(row["id"], error=str(e))
+
+
+# Fila global (criada na inicialização da API)
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> Optional[JobQueue]:
+    """Retorna a fila de jobs ativa (ou None se não iniciada)"""
+    return _queue
+
+
+def start_job_queue(workers: int = JOB_WORKERS) -> JobQueue:
+    """
+    Abre a fila persistente e inicia os workers
+
+    Args:
+        workers: Número de workers
+
+    Returns:
+        Fila de jobs ativa
+    """
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+        _queue.start(workers)
+    return _queue
+
+
+def stop_job_queue():
+    """Para os workers e fecha a fila"""
+    global _queue
+    if _queue is not None:
+        _queue.close()
+        _queue = None
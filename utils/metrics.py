@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas no formato de exposição do Prometheus (texto 0.0.4).
+
+Registro próprio e sem dependências: contadores, gauges e histogramas com
+rótulos, guardados em dicionários protegidos por lock. O custo no caminho da
+requisição é uma busca binária no histograma e uma soma; tudo o que pode ser
+lido de outros módulos (filas, caches, memória do processo) é coletado apenas
+quando /metrics é consultado.
+
+Estágios medidos (stage_duration_seconds):
+
+    decode, pose, yolo, crop, clip_encode, color, jpeg_encode, jpeg_write, serialize
+"""
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from utils.request_timing import current_timings, bind_thread, unbind_thread
+from utils.tracing import start_child_span, end_child_span, record_span, add_to_attribute
+
+# Configuração via variáveis de ambiente
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_PREFIX = os.getenv("METRICS_PREFIX", "fashion_")
+
+# Buckets padrão (segundos): de 1 ms a 30 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """Família de métricas com rótulos"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return lines + self._samples()
+
+
+class Counter(_Metric):
+    """Contador monotônico"""
+
+    type_name = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def set_total(self, value: float, *labels: str):
+        """Espelha um contador mantido por outro módulo (usado nos coletores)"""
+        with self._lock:
+            self._values[labels] = float(value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Gauge(Counter):
+    """Valor que sobe e desce"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, *labels: str):
+        self.set_total(value, *labels)
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Histograma com buckets fixos (contagem, soma e buckets cumulativos)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, *labels: str) -> Optional[Dict]:
+        """Contagem e soma de uma série (None se ainda não observada)"""
+        with self._lock:
+            state = self._values.get(labels)
+            return {"count": state[2], "sum": state[1]} if state is not None else None
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(labels, list(state[0]), state[1], state[2]) for labels, state in self._values.items()]
+        lines = []
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Conjunto de métricas expostas em /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        Registra uma função chamada a cada coleta para atualizar gauges
+
+        Args:
+            collector: Função sem argumentos (exceções são ignoradas)
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Gera o texto no formato de exposição do Prometheus
+
+        Returns:
+            Todas as métricas, uma família por bloco HELP/TYPE
+        """
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as e:
+                print(f"⚠️ Erro no coletor de métricas {getattr(collector, '__name__', collector)}: {e}")
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# Requisições HTTP (rótulo route = template da rota, não o caminho)
+http_requests_total = registry.register(Counter(
+    f"{METRICS_PREFIX}http_requests_total", "Requisições HTTP por rota e status", ("method", "route", "status")))
+http_request_duration_seconds = registry.register(Histogram(
+    f"{METRICS_PREFIX}http_request_duration_seconds", "Latência das requisições HTTP por rota", ("method", "route")))
+http_requests_in_progress = registry.register(Gauge(
+    f"{METRICS_PREFIX}http_requests_in_progress", "Requisições HTTP em andamento"))
+
+# Estágios do pipeline
+stage_duration_seconds = registry.register(Histogram(
+    f"{METRICS_PREFIX}stage_duration_seconds", "Duração de cada estágio do processamento", ("stage",)))
+batch_size = registry.register(Histogram(
+    f"{METRICS_PREFIX}batch_size", "Tamanho dos lotes enviados aos modelos", ("kind",), buckets=BATCH_SIZE_BUCKETS))
+model_load_seconds = registry.register(Gauge(
+    f"{METRICS_PREFIX}model_load_seconds", "Tempo de carregamento de cada modelo", ("model",)))
+model_warmup_seconds = registry.register(Gauge(
+    f"{METRICS_PREFIX}model_warmup_seconds", "Tempo da inferência de aquecimento de cada modelo", ("model",)))
+
+# Coletados na consulta
+executor_queue_depth = registry.register(Gauge(
+    f"{METRICS_PREFIX}executor_queue_depth", "Itens aguardando ou em execução em cada executor", ("executor",)))
+cache_hits_total = registry.register(Counter(
+    f"{METRICS_PREFIX}cache_hits_total", "Acertos de cada cache", ("cache",)))
+cache_misses_total = registry.register(Counter(
+    f"{METRICS_PREFIX}cache_misses_total", "Faltas de cada cache", ("cache",)))
+cache_hit_ratio = registry.register(Gauge(
+    f"{METRICS_PREFIX}cache_hit_ratio", "Taxa de acerto de cada cache", ("cache",)))
+process_resident_memory_bytes = registry.register(Gauge(
+    "process_resident_memory_bytes", "Memória residente do processo (RSS)"))
+process_cpu_seconds_total = registry.register(Counter(
+    "process_cpu_seconds_total", "Tempo de CPU do processo (usuário + sistema)"))
+process_start_time_seconds = registry.register(Gauge(
+    "process_start_time_seconds", "Início do processo (epoch)"))
+process_start_time_seconds.set(time.time())
+
+
+# ---------------------------------------------------------------------------
+# Estágios
+# ---------------------------------------------------------------------------
+
+_capture = threading.local()
+
+
+class stage_timer:
+    """
+    Mede um estágio e registra em stage_duration_seconds, nos tempos da
+    requisição em andamento (Server-Timing, utils/request_timing.py) e como
+    span filho quando a requisição é rastreada (utils/tracing.py)
+
+    Uso:
+        with stage_timer("pose"):
+            results = self.pose.process(image_rgb)
+    """
+
+    __slots__ = ("stage", "started", "start_ns", "cpu_started", "profile", "timings", "previous", "span")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.span = start_child_span(self.stage)
+        self.timings = current_timings()
+        self.profile = None
+        if self.timings is not None:
+            # Permite ao profiler contínuo atribuir as amostras desta thread à rota
+            self.previous = bind_thread(self.timings)
+            self.profile = self.timings.thread_profile()
+            if self.profile is not None:
+                self.profile.__enter__()
+        self.start_ns = time.time_ns()
+        self.cpu_started = time.thread_time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.started
+        cpu = time.thread_time() - self.cpu_started
+        if self.timings is not None:
+            if self.profile is not None:
+                self.profile.__exit__(exc_type, exc, tb)
+            unbind_thread(self.previous)
+        if self.span is not None:
+            self.span[0].set_attribute("cpu_ms", round(cpu * 1000, 3))
+            end_child_span(self.span, exc)
+        observe_stage(self.stage, wall, cpu, self.start_ns)
+        return False
+
+
+def observe_stage(stage: str, seconds: float, cpu_seconds: float = 0.0, start_ns: int = 0):
+    """
+    Registra a duração de um estágio
+
+    Args:
+        stage: Nome do estágio
+        seconds: Tempo de parede em segundos
+        cpu_seconds: Tempo de CPU da thread em segundos
+        start_ns: Início do estágio (epoch em nanossegundos), devolvido pelos workers
+    """
+    timings = current_timings()
+    if timings is not None:
+        timings.add(stage, seconds, cpu_seconds)
+    captured = getattr(_capture, "stages", None)
+    if captured is not None:
+        captured.append((stage, seconds, cpu_seconds, start_ns))
+    if METRICS_ENABLED:
+        stage_duration_seconds.observe(seconds, stage)
+
+
+def observe_stages(stages: List[Tuple[str, float, float, int]], process: str = "detection_worker"):
+    """
+    Registra durações medidas em outro processo (workers de detecção)
+
+    Args:
+        stages: Tuplas (estágio, parede, CPU, início em ns) de capture_stages
+        process: Origem, registrada no span de cada estágio
+    """
+    for stage, seconds, cpu_seconds, start_ns in stages:
+        if start_ns:
+            record_span(stage, start_ns, seconds, {"cpu_ms": round(cpu_seconds * 1000, 3), "process": process})
+        observe_stage(stage, seconds, cpu_seconds)
+
+
+class capture_stages:
+    """
+    Acumula, além de registrar, as durações dos estágios da thread atual
+
+    Usado nos workers de processo para devolver as durações ao processo da
+    API junto com o resultado.
+    """
+
+    def __enter__(self) -> List[Tuple[str, float, float, int]]:
+        self.previous = getattr(_capture, "stages", None)
+        _capture.stages = []
+        return _capture.stages
+
+    def __exit__(self, exc_type, exc, tb):
+        _capture.stages = self.previous
+        return False
+
+
+def observe_batch(kind: str, size: int):
+    """
+    Registra o tamanho de um lote
+
+    Args:
+        kind: Tipo do lote (ex: "clip_encode", "yolo")
+        size: Número de itens
+    """
+    # Atributo do span da etapa que montou o lote (ex: classify_parts)
+    add_to_attribute(f"{kind}.batch_size", size)
+    if METRICS_ENABLED:
+        batch_size.observe(size, kind)
+
+
+def record_model_load(model: str, seconds: float):
+    """
+    Registra o tempo de carregamento de um modelo
+
+    Args:
+        model: Nome do modelo (ex: "clip", "yolo", "pose")
+        seconds: Duração em segundos
+    """
+    model_load_seconds.set(seconds, model)
+
+
+def record_model_warmup(model: str, seconds: float):
+    """
+    Registra o tempo da inferência de aquecimento de um modelo
+
+    Args:
+        model: Nome do modelo (ex: "clip", "yolo", "pose")
+        seconds: Duração em segundos
+    """
+    model_warmup_seconds.set(seconds, model)
+
+
+# ---------------------------------------------------------------------------
+# Coletores
+# ---------------------------------------------------------------------------
+
+def _resident_memory_bytes() -> Optional[int]:
+    """RSS atual via /proc (Linux) ou o pico via getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+def _collect_process():
+    rss = _resident_memory_bytes()
+    if rss is not None:
+        process_resident_memory_bytes.set(rss)
+    times = os.times()
+    process_cpu_seconds_total.set_total(times.user + times.system)
+
+
+def _collect_caches():
+    from utils.cache import result_cache, embedding_cache
+    for name, cache in (("results", result_cache), ("embeddings", embedding_cache)):
+        lookups = cache.hits + cache.misses
+        cache_hits_total.set_total(cache.hits, name)
+        cache_misses_total.set_total(cache.misses, name)
+        cache_hit_ratio.set(cache.hits / lookups if lookups else 0.0, name)
+
+
+def _collect_queues():
+    from utils.crop_storage import crop_storage
+    from utils.detection_pool import get_detection_pool
+    from utils.job_queue import get_job_queue
+    executor_queue_depth.set(crop_storage._queue.qsize(), "crop_writer")
+    pool = get_detection_pool()
+    executor_queue_depth.set(pool.inflight if pool is not None else 0, "detection_pool")
+    job_queue = get_job_queue()
+    if job_queue is not None:
+        jobs = job_queue.stats()["jobs"]
+        executor_queue_depth.set(jobs.get("queued", 0), "jobs")
+
+
+registry.add_collector(_collect_process)
+registry.add_collector(_collect_caches)
+registry.add_collector(_collect_queues)
+
+
+def render_metrics() -> str:
+    """Texto de /metrics"""
+    return registry.render()
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+class MetricsMiddleware:
+    """Middleware ASGI que conta requisições e mede a latência por rota"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        http_requests_in_progress.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_progress.dec()
+            # Template da rota (ex: /api/v1/jobs/{job_id}) para limitar a cardinalidade
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_request_duration_seconds.observe(time.perf_counter() - started, scope["method"], route_path)
+            http_requests_total.inc(scope["method"], route_path, str(status["code"]))
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Ciclo de vida dos modelos: carregamento em paralelo, aquecimento e prontidão.
+
+Os pacotes pesados (clip, mediapipe, ultralytics) só são importados aqui,
+na inicialização da API, e não na importação dos routers. Os três modelos
+(CLIP, YOLO e MediaPipe Pose) são carregados em paralelo, cada um em sua
+thread, e em seguida passam por uma inferência de aquecimento em uma imagem
+sintética, para que a primeira requisição real não pague a inicialização
+dos grafos e as primeiras alocações.
+
+O estado de cada modelo (pending -> loading -> warming -> ready, ou failed)
+e os tempos de carregamento e aquecimento são expostos em /health/ready.
+
+Configuração via variáveis de ambiente:
+    MODEL_LOAD_IN_BACKGROUND: carrega em segundo plano (a API aceita conexões
+        e /health/live responde antes de /health/ready; padrão false)
+    MODEL_WARMUP: roda a inferência de aquecimento (padrão true)
+    MODEL_WARMUP_RUNS: inferências de aquecimento por modelo (padrão 1)
+    MODEL_WARMUP_SIZE: resolução da imagem sintética (padrão 640x960)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from utils.metrics import record_model_warmup
+
+# Configuração via variáveis de ambiente
+MODEL_LOAD_IN_BACKGROUND = os.getenv("MODEL_LOAD_IN_BACKGROUND", "false").lower() in ("1", "true", "yes")
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() in ("1", "true", "yes")
+MODEL_WARMUP_RUNS = int(os.getenv("MODEL_WARMUP_RUNS", "1"))
+MODEL_WARMUP_SIZE = os.getenv("MODEL_WARMUP_SIZE", "640x960")
+
+MODELS = ("clip", "yolo", "pose")
+
+
+def warmup_image(width: int, height: int) -> Image.Image:
+    """
+    Imagem sintética determinística (silhueta sobre fundo em gradiente) para o aquecimento
+
+    Args:
+        width: Largura em pixels
+        height: Altura em pixels
+
+    Returns:
+        Imagem PIL RGB
+    """
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = np.linspace(210, 150, height, dtype=np.uint8)[:, None, None]
+    center, half = width // 2, max(width // 8, 1)
+    regions = (
+        # (topo, base, cor)
+        (0.06, 0.18, (224, 172, 140)),
+        (0.18, 0.50, (180, 30, 40)),
+        (0.50, 0.88, (30, 50, 120)),
+        (0.88, 0.96, (40, 30, 25)),
+    )
+    for top, bottom, color in regions:
+        canvas[int(top * height):int(bottom * height), center - half:center + half] = color
+    return Image.fromarray(canvas, "RGB")
+
+
+def _model_steps(image: Image.Image) -> Dict[str, Tuple[Callable, Callable]]:
+    """(carregamento, aquecimento) de cada modelo"""
+    from utils.body_parts_detector import detector
+    from utils.clip_classifier import classifier
+    image_rgb = np.asarray(image)
+
+    # Direto nos modelos (sem stage_timer: o aquecimento não entra nas métricas dos estágios)
+    def warm_pose():
+        with detector._pose_lock:
+            detector.pose.process(image_rgb)
+
+    def warm_yolo():
+        with detector._yolo_lock:
+            detector.yolo_model(image_rgb, verbose=False)
+
+    def warm_clip():
+        # Caminho individual e caminhos em lote (multi-pessoa, /batch, stream e vídeo):
+        # cada conjunto de prompts (regiões, cores, estilo, coordenação) é codificado aqui
+        classifier.classify_image(image)
+        regions = ["torso", "legs", "feet", "head", None]
+        classifier.classify_parts_batch([image] * len(regions), regions, detect_colors=True)
+        classifier.analyze_complete_outfit_images([image], [{}])
+
+    return {
+        "clip": (classifier.load_model, warm_clip),
+        "yolo": (detector.load_yolo, warm_yolo),
+        "pose": (detector.load_pose, warm_pose),
+    }
+
+
+class ModelLifecycle:
+    """Carrega e aquece os modelos em paralelo e acompanha a prontidão"""
+
+    def __init__(self, warmup: bool = MODEL_WARMUP, warmup_runs: int = MODEL_WARMUP_RUNS,
+                 warmup_size: str = MODEL_WARMUP_SIZE):
+        """
+        Args:
+            warmup: Roda a inferência de aquecimento depois do carregamento
+            warmup_runs: Inferências de aquecimento por modelo
+            warmup_size: Resolução da imagem sintética (LxA)
+        """
+        self.warmup = warmup
+        self.warmup_runs = max(1, warmup_runs)
+        width, height = (int(value) for value in warmup_size.lower().split("x"))
+        self.warmup_size = (width, height)
+        self._lock = threading.Lock()
+        self._models = {name: self._initial_state() for name in MODELS}
+        self._thread: Optional[threading.Thread] = None
+        self._finished = threading.Event()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.live_since = time.time()
+
+    @staticmethod
+    def _initial_state() -> Dict:
+        return {"status": "pending", "load_seconds": None, "warmup_seconds": None, "error": None}
+
+    def _update(self, name: str, **fields):
+        with self._lock:
+            self._models[name].update(fields)
+
+    def _bring_up(self, name: str, load: Callable, warm: Callable):
+        """Carrega e aquece um modelo (roda em uma thread do pool)"""
+        try:
+            self._update(name, status="loading")
+            started = time.perf_counter()
+            load()
+            self._update(name, status="warming" if self.warmup else "ready",
+                         load_seconds=round(time.perf_counter() - started, 3))
+            if self.warmup:
+                started = time.perf_counter()
+                for _ in range(self.warmup_runs):
+                    warm()
+                seconds = time.perf_counter() - started
+                record_model_warmup(name, seconds)
+                self._update(name, status="ready", warmup_seconds=round(seconds, 3))
+        except Exception as e:
+            print(f"❌ Erro ao carregar o modelo {name}: {e}")
+            self._update(name, status="failed", error=str(e))
+
+    def load(self):
+        """Carrega e aquece os três modelos em paralelo (bloqueia até terminar)"""
+        self.started_at = time.time()
+        self.finished_at = None
+        self._finished.clear()
+        with self._lock:
+            self._models = {name: self._initial_state() for name in MODELS}
+        try:
+            steps = _model_steps(warmup_image(*self.warmup_size))
+            with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix="model-load") as executor:
+                for future in [executor.submit(self._bring_up, name, load, warm)
+                               for name, (load, warm) in steps.items()]:
+                    future.result()
+        finally:
+            self.finished_at = time.time()
+            self._finished.set()
+        ready = self.is_ready()
+        print(f"{'✅' if ready else '❌'} Modelos {'prontos' if ready else 'com falha'} em "
+              f"{self.finished_at - self.started_at:.1f}s")
+
+    def start(self, background: bool = MODEL_LOAD_IN_BACKGROUND):
+        """
+        Inicia o carregamento
+
+        Args:
+            background: Se True, carrega em uma thread e retorna imediatamente
+        """
+        if not background:
+            self.load()
+            return
+        self._thread = threading.Thread(target=self.load, name="model-lifecycle", daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera o fim do carregamento; retorna is_ready()"""
+        self._finished.wait(timeout)
+        return self.is_ready()
+
+    def is_ready(self) -> bool:
+        with self._lock:
+            return all(state["status"] == "ready" for state in self._models.values())
+
+    def status(self) -> Dict:
+        """
+        Estado de cada modelo e tempos totais
+
+        Returns:
+            {"ready", "loading", "warmup", "started_at", "ready_seconds", "models": {nome: estado}}
+        """
+        with self._lock:
+            models = {name: dict(state) for name, state in self._models.items()}
+        ready = all(state["status"] == "ready" for state in models.values())
+        total = None
+        if self.started_at is not None and self.finished_at is not None:
+            total = round(self.finished_at - self.started_at, 3)
+        return {
+            "ready": ready,
+            "loading": self.started_at is not None and not self._finished.is_set(),
+            "warmup": self.warmup,
+            "started_at": self.started_at,
+            "ready_seconds": total,
+            "models": models
+        }
+
+
+# Instância global
+model_lifecycle = ModelLifecycle()
+
+
+def start_model_loading(background: bool = MODEL_LOAD_IN_BACKGROUND):
+    """Carrega e aquece os modelos (em paralelo; opcionalmente em segundo plano)"""
+    model_lifecycle.start(background)
+
+
+def get_liveness() -> Dict:
+    """Estado de /health/live: o processo responde (não depende dos modelos)"""
+    return {"status": "alive", "uptime_seconds": round(time.time() - model_lifecycle.live_since, 3)}
+
+
+def get_readiness() -> Dict:
+    """
+    Estado de /health/ready: modelos carregados e aquecidos e, com o backend de
+    processos, o pool de detecção ativo
+
+    Returns:
+        Dicionário com "ready", o estado de cada modelo e o backend de detecção
+    """
+    from utils.detection_pool import DETECTION_BACKEND, get_detection_backend
+    readiness = model_lifecycle.status()
+    backend = get_detection_backend()
+    readiness["detection_backend"] = backend
+    if DETECTION_BACKEND == "process" and backend["backend"] != "process":
+        readiness["ready"] = False
+    readiness["status"] = "ready" if readiness["ready"] else "not_ready"
+    return readiness
@@ -0,0 +1,376 @@
+# -*- coding: utf-8 -*-
+"""
+Tempo de cada estágio por requisição e profiling sob demanda.
+
+Cada requisição HTTP recebe um RequestTimings em um contextvar (que segue a
+requisição para o threadpool). stage_timer (utils/metrics.py) acumula nele o
+tempo de parede e de CPU de cada estágio, e o middleware devolve o resumo no
+header Server-Timing:
+
+    Server-Timing: decode;dur=3.1;desc="cpu=3.0ms", pose;dur=41.7;desc="cpu=80.2ms", total;dur=93.4
+
+Com ?profile=1 e o header X-Admin-Token, a requisição roda sob cProfile. O
+cProfile mede uma thread por vez: o perfil junta a thread do event loop
+(incluindo o que outras requisições executarem nela no mesmo intervalo) e as
+threads que executam os estágios desta requisição. O resultado é gravado em
+PROFILE_DIR e baixado por /api/v1/admin/profiles/{id}.
+"""
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs
+
+from utils.admin_auth import ADMIN_TOKEN_HEADER, is_admin_token
+
+# Configuração via variáveis de ambiente
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "true").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("data", "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+PROFILE_URL_PREFIX = "/api/v1/admin/profiles"
+
+
+class RequestProfile:
+    """Perfis cProfile das threads que trabalham em uma requisição"""
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def start(self) -> cProfile.Profile:
+        """Inicia o perfil da thread atual (ver _ThreadProfile)"""
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+        return profile
+
+    def save(self, meta: Dict) -> Optional[str]:
+        """
+        Junta os perfis e grava em PROFILE_DIR
+
+        Args:
+            meta: Metadados gravados ao lado do perfil (método, caminho, duração)
+
+        Returns:
+            ID do perfil ou None se nenhuma thread foi perfilada
+        """
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stats.dump_stats(os.path.join(PROFILE_DIR, f"{self.id}.prof"))
+        with open(os.path.join(PROFILE_DIR, f"{self.id}.json"), "w") as f:
+            json.dump({"id": self.id, "created": time.time(), "threads": len(profiles), **meta}, f)
+        _prune_profiles()
+        return self.id
+
+
+_thread_state = threading.local()
+
+# Um perfil por vez: o cProfile da thread do event loop é único
+_profile_slot = threading.Lock()
+
+
+class _ThreadProfile:
+    """Perfila a thread atual durante um estágio (sem aninhar perfis na mesma thread)"""
+
+    __slots__ = ("request_profile", "profile")
+
+    def __init__(self, request_profile: RequestProfile):
+        self.request_profile = request_profile
+        self.profile = None
+
+    def __enter__(self):
+        if not getattr(_thread_state, "profiling", False):
+            _thread_state.profiling = True
+            self.profile = self.request_profile.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile = None
+            _thread_state.profiling = False
+        return False
+
+
+class RequestTimings:
+    """Tempo de parede e de CPU de cada estágio de uma requisição"""
+
+    def __init__(self, scope: Optional[Dict] = None):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, List[float]] = {}
+        self.profile: Optional[RequestProfile] = None
+        self._scope = scope
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        """Template da rota (ex: /api/v1/jobs/{job_id}), conhecido após o roteamento"""
+        route = self._scope.get("route") if self._scope is not None else None
+        return getattr(route, "path", None) or "unmatched"
+
+    def add(self, stage: str, wall: float, cpu: float):
+        """
+        Acumula a duração de um estágio
+
+        Args:
+            stage: Nome do estágio
+            wall: Tempo de parede (segundos)
+            cpu: Tempo de CPU da thread (segundos)
+        """
+        with self._lock:
+            entry = self.stages.get(stage)
+            if entry is None:
+                self.stages[stage] = [wall, cpu, 1]
+            else:
+                entry[0] += wall
+                entry[1] += cpu
+                entry[2] += 1
+
+    def thread_profile(self) -> Optional[_ThreadProfile]:
+        """Perfil da thread atual durante um estágio (None sem ?profile=1)"""
+        return _ThreadProfile(self.profile) if self.profile is not None else None
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> Dict:
+        """
+        Resumo para o bloco "timings" das respostas
+
+        Returns:
+            {"total_ms", "stages": {estágio: {"wall_ms", "cpu_ms", "count"}}}
+        """
+        with self._lock:
+            stages = {
+                stage: {"wall_ms": round(wall * 1000, 2), "cpu_ms": round(cpu * 1000, 2), "count": count}
+                for stage, (wall, cpu, count) in self.stages.items()
+            }
+        return {"total_ms": round(self.total_ms(), 2), "stages": stages}
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing"""
+        with self._lock:
+            items = list(self.stages.items())
+        metrics = [
+            f'{stage};dur={wall * 1000:.2f};desc="cpu={cpu * 1000:.2f}ms n={count}"'
+            for stage, (wall, cpu, count) in items
+        ]
+        metrics.append(f"total;dur={self.total_ms():.2f}")
+        return ", ".join(metrics)
+
+
+_current: "contextvars.ContextVar[Optional[RequestTimings]]" = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Tempos da requisição em andamento (None fora de uma requisição HTTP)"""
+    return _current.get()
+
+
+# Requisição atendida por cada thread durante um estágio (lida pelo profiler contínuo)
+_thread_requests: Dict[int, RequestTimings] = {}
+
+
+def bind_thread(timings: RequestTimings) -> Optional[RequestTimings]:
+    """
+    Associa a thread atual à requisição durante um estágio
+
+    Args:
+        timings: Tempos da requisição
+
+    Returns:
+        Associação anterior (para unbind_thread)
+    """
+    ident = threading.get_ident()
+    previous = _thread_requests.get(ident)
+    _thread_requests[ident] = timings
+    return previous
+
+
+def unbind_thread(previous: Optional[RequestTimings]):
+    """Restaura a associação anterior da thread atual"""
+    ident = threading.get_ident()
+    if previous is None:
+        _thread_requests.pop(ident, None)
+    else:
+        _thread_requests[ident] = previous
+
+
+def thread_route(ident: int) -> Optional[str]:
+    """Rota da requisição que a thread está atendendo (None fora de um estágio)"""
+    timings = _thread_requests.get(ident)
+    return timings.route if timings is not None else None
+
+
+# ---------------------------------------------------------------------------
+# Perfis gravados
+# ---------------------------------------------------------------------------
+
+def _prune_profiles():
+    """Mantém apenas os PROFILE_KEEP perfis mais recentes"""
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith(".prof")]
+    except FileNotFoundError:
+        return
+    paths = sorted((os.path.join(PROFILE_DIR, name) for name in names), key=os.path.getmtime, reverse=True)
+    for path in paths[PROFILE_KEEP:]:
+        for stale in (path, path[:-len(".prof")] + ".json"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles() -> List[Dict]:
+    """Metadados dos perfis gravados (mais recentes primeiro)"""
+    profiles = []
+    try:
+        names = os.listdir(PROFILE_DIR)
+    except FileNotFoundError:
+        return profiles
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta["url"] = f"{PROFILE_URL_PREFIX}/{meta['id']}"
+        profiles.append(meta)
+    return sorted(profiles, key=lambda meta: meta.get("created", 0), reverse=True)
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """
+    Caminho do arquivo .prof (formato pstats/snakeviz)
+
+    Args:
+        profile_id: ID do perfil
+
+    Returns:
+        Caminho ou None se o ID for inválido ou não existir
+    """
+    if not profile_id.isalnum():
+        return None
+    path = os.path.join(PROFILE_DIR, f"{profile_id}.prof")
+    return path if os.path.exists(path) else None
+
+
+def profile_text(profile_id: str, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+    """
+    Relatório pstats em texto
+
+    Args:
+        profile_id: ID do perfil
+        sort: Ordenação do pstats (cumulative, tottime, calls...)
+        limit: Número de funções listadas
+
+    Returns:
+        Texto ou None se o perfil não existir
+    """
+    path = profile_path(profile_id)
+    if path is None:
+        return None
+    stream = io.StringIO()
+    pstats.Stats(path, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+def _profile_requested(scope) -> bool:
+    query = scope.get("query_string", b"")
+    if b"profile=" not in query:
+        return False
+    values = parse_qs(query.decode("latin-1")).get("profile", [])
+    return any(value.lower() in ("1", "true", "yes") for value in values)
+
+
+def _admin_token(scope) -> Optional[str]:
+    name = ADMIN_TOKEN_HEADER.encode("latin-1")
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _error_response(scope, receive, send, status_code: int, detail: str):
+    from fastapi.responses import JSONResponse
+    response = JSONResponse(status_code=status_code, content={
+        "error": "HTTP Error",
+        "detail": detail,
+        "status_code": status_code
+    })
+    await response(scope, receive, send)
+
+
+class TimingMiddleware:
+    """Middleware ASGI que publica os tempos dos estágios no header Server-Timing"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REQUEST_TIMING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope)
+        loop_profile = None
+        if _profile_requested(scope):
+            if not is_admin_token(_admin_token(scope)):
+                await _error_response(scope, receive, send, 403, "profile=1 exige o header X-Admin-Token (ADMIN_TOKEN)")
+                return
+            if not _profile_slot.acquire(blocking=False):
+                await _error_response(scope, receive, send, 409, "Outro profiling em andamento")
+                return
+            timings.profile = RequestProfile()
+            loop_profile = _ThreadProfile(timings.profile)
+        token = _current.set(timings)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                if loop_profile is not None:
+                    loop_profile.__exit__(None, None, None)
+                    profile_id = timings.profile.save({
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "status": message["status"],
+                        "total_ms": round(timings.total_ms(), 2)
+                    })
+                    if profile_id is not None:
+                        headers.append((b"x-profile-id", profile_id.encode("latin-1")))
+                        headers.append((b"x-profile-url", f"{PROFILE_URL_PREFIX}/{profile_id}".encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if loop_profile is not None:
+                loop_profile.__enter__()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if loop_profile is not None:
+                # Encerra o perfil se a resposta não chegou a começar (erro) e libera o slot
+                loop_profile.__exit__(None, None, None)
+                _profile_slot.release()
+            _current.reset(token)
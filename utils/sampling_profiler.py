@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Profiler de amostragem contínuo, para uso em produção.
+
+Uma thread lê as pilhas de todas as threads (sys._current_frames) a uma taxa
+fixa e acumula pilhas "folded" (formato do flamegraph.pl e do speedscope)
+em baldes de um segundo. Não instrumenta chamadas: o custo é proporcional à
+taxa de amostragem e ao número de threads, e não ao trabalho das
+requisições. A thread mede o próprio custo (overhead em status()).
+
+Cada amostra é atribuída à rota da requisição que a thread está atendendo
+(stage_timer associa a thread à requisição durante os estágios) ou, fora dos
+estágios, ao nome da thread ("thread:crop-writer", "thread:MainThread").
+Threads ociosas (esperando em locks de fila, select ou sleep) são apenas
+contadas.
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+
+from utils.request_timing import thread_route
+
+# Configuração via variáveis de ambiente
+PROFILER_HZ = float(os.getenv("PROFILER_HZ", "50"))
+PROFILER_RETENTION_SECONDS = int(os.getenv("PROFILER_RETENTION_SECONDS", "600"))
+PROFILER_MAX_RUN_SECONDS = float(os.getenv("PROFILER_MAX_RUN_SECONDS", "900"))
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "128"))
+PROFILER_AUTOSTART = os.getenv("PROFILER_AUTOSTART", "false").lower() in ("1", "true", "yes")
+
+# Frames folha que indicam espera (a thread não está trabalhando)
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+_IDLE_FUNCTIONS = frozenset(("sleep", "wait", "select", "poll"))
+
+_THREAD_NUMBER = re.compile(r"[-_ ]?(\d+(_\d+)?|[0-9a-f]{6,})$")
+
+
+def _thread_label(name: str) -> str:
+    """Nome da thread sem o número/ID (ThreadPoolExecutor-0_3 -> thread:ThreadPoolExecutor)"""
+    return "thread:" + (_THREAD_NUMBER.sub("", name) or name)
+
+
+class SamplingProfiler:
+    """Amostrador de pilhas de todas as threads do processo"""
+
+    def __init__(self, hz: float = PROFILER_HZ, retention_seconds: int = PROFILER_RETENTION_SECONDS,
+                 max_depth: int = PROFILER_MAX_DEPTH):
+        """
+        Inicializa o profiler (parado)
+
+        Args:
+            hz: Amostras por segundo
+            retention_seconds: Janela de pilhas mantidas em memória
+            max_depth: Profundidade máxima das pilhas (frames mais externos são cortados)
+        """
+        self.hz = hz
+        self.retention_seconds = retention_seconds
+        self.max_depth = max_depth
+        # (segundo, Counter {(rota, pilha): amostras}, [amostras ociosas])
+        self._buckets: "deque[Tuple[int, Counter, List[int]]]" = deque()
+        self._labels: Dict[object, str] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.started_at: Optional[float] = None
+        self.stops_at: Optional[float] = None
+        self.samples = 0
+        self.sampling_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, hz: Optional[float] = None, duration: Optional[float] = None):
+        """
+        Inicia a amostragem (reinicia se já estiver rodando)
+
+        Args:
+            hz: Amostras por segundo (padrão: o atual)
+            duration: Parada automática em segundos (limitada a PROFILER_MAX_RUN_SECONDS)
+        """
+        self.stop()
+        if hz is not None:
+            self.hz = hz
+        duration = min(duration or PROFILER_MAX_RUN_SECONDS, PROFILER_MAX_RUN_SECONDS)
+        self._stop.clear()
+        self.started_at = time.time()
+        self.stops_at = self.started_at + duration
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        print(f"✅ Profiler de amostragem iniciado ({self.hz:g} Hz, até {duration:.0f}s)")
+
+    def stop(self):
+        """Para a amostragem (as pilhas coletadas continuam disponíveis)"""
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            thread.join(timeout=5)
+            print("🛑 Profiler de amostragem parado")
+
+    def clear(self):
+        """Descarta as pilhas coletadas"""
+        with self._lock:
+            self._buckets.clear()
+
+    def _frame_label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            module = os.path.splitext(os.path.basename(filename))[0]
+            label = self._labels[code] = f"{module}.{code.co_name}:{code.co_firstlineno}"
+        return label
+
+    def _is_idle(self, frame) -> bool:
+        code = frame.f_code
+        return code.co_name in _IDLE_FUNCTIONS or code.co_filename.endswith(_IDLE_FILES)
+
+    def _sample(self, own_ident: int, thread_names: Dict[int, str]) -> Tuple[List[Tuple[str, str]], int]:
+        """Lê as pilhas de todas as threads (exceto a do profiler)"""
+        stacks, idle = [], 0
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if self._is_idle(frame):
+                idle += 1
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.reverse()
+            route = thread_route(ident) or _thread_label(thread_names.get(ident, "unknown"))
+            stacks.append((route, ";".join(labels)))
+        return stacks, idle
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        interval = 1.0 / self.hz
+        thread_names: Dict[int, str] = {}
+        names_refreshed = 0.0
+        next_sample = time.perf_counter()
+        while not self._stop.is_set():
+            now = time.time()
+            if self.stops_at is not None and now >= self.stops_at:
+                print("🛑 Profiler de amostragem parado (duração máxima atingida)")
+                break
+            started = time.perf_counter()
+            if started - names_refreshed > 1.0:
+                thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                names_refreshed = started
+            stacks, idle = self._sample(own_ident, thread_names)
+            second = int(now)
+            with self._lock:
+                if not self._buckets or self._buckets[-1][0] != second:
+                    self._buckets.append((second, Counter(), [0]))
+                    while self._buckets and self._buckets[0][0] < second - self.retention_seconds:
+                        self._buckets.popleft()
+                bucket = self._buckets[-1]
+                bucket[1].update(stacks)
+                bucket[2][0] += idle
+            self.samples += 1
+            self.sampling_seconds += time.perf_counter() - started
+            next_sample += interval
+            delay = next_sample - time.perf_counter()
+            if delay < 0:
+                # Atrasado (GIL ocupado): não tenta compensar as amostras perdidas
+                next_sample = time.perf_counter()
+                delay = 0
+            self._stop.wait(delay)
+
+    def _window(self, seconds: Optional[float]) -> Tuple[Counter, int]:
+        cutoff = time.time() - seconds if seconds else 0
+        total, idle = Counter(), 0
+        # O balde mais recente é atualizado pela thread de amostragem: soma sob o lock
+        with self._lock:
+            for second, stacks, idle_count in self._buckets:
+                if second >= cutoff:
+                    total.update(stacks)
+                    idle += idle_count[0]
+        return total, idle
+
+    def folded(self, seconds: Optional[float] = None, route: Optional[str] = None,
+               by_route: bool = True) -> str:
+        """
+        Pilhas no formato folded ("frame;frame;frame contagem" por linha)
+
+        Args:
+            seconds: Janela (últimos N segundos; padrão: toda a retenção)
+            route: Mantém apenas as amostras desta rota
+            by_route: Usa a rota como frame raiz
+
+        Returns:
+            Texto para flamegraph.pl ou speedscope
+        """
+        stacks, _ = self._window(seconds)
+        merged: Counter = Counter()
+        for (stack_route, stack), count in stacks.items():
+            if route is not None and stack_route != route:
+                continue
+            merged[f"{stack_route};{stack}" if by_route else stack] += count
+        return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+    def routes(self, seconds: Optional[float] = None, top: int = 10) -> Dict:
+        """
+        Amostras por rota e as funções mais frequentes de cada rota
+
+        Args:
+            seconds: Janela (últimos N segundos)
+            top: Número de funções listadas por rota
+
+        Returns:
+            {"busy_samples", "idle_samples", "routes": [{"route", "samples", "share", "top_self", "top_total"}]}
+        """
+        stacks, idle = self._window(seconds)
+        per_route: Dict[str, Dict[str, Counter]] = {}
+        totals: Counter = Counter()
+        for (route, stack), count in stacks.items():
+            totals[route] += count
+            entry = per_route.setdefault(route, {"self": Counter(), "total": Counter()})
+            frames = stack.split(";")
+            entry["self"][frames[-1]] += count
+            for frame in set(frames):
+                entry["total"][frame] += count
+        busy = sum(totals.values())
+        routes = []
+        for route, samples in totals.most_common():
+            routes.append({
+                "route": route,
+                "samples": samples,
+                "share": round(samples / busy, 4) if busy else 0.0,
+                "top_self": [{"frame": frame, "samples": count} for frame, count in per_route[route]["self"].most_common(top)],
+                "top_total": [{"frame": frame, "samples": count} for frame, count in per_route[route]["total"].most_common(top)]
+            })
+        return {"busy_samples": busy, "idle_samples": idle, "routes": routes}
+
+    def status(self) -> Dict:
+        """Estado do profiler e o custo medido da amostragem"""
+        elapsed = (time.time() - self.started_at) if self.started_at else 0.0
+        with self._lock:
+            window = (self._buckets[-1][0] - self._buckets[0][0] + 1) if self._buckets else 0
+        return {
+            "running": self.running,
+            "hz": self.hz,
+            "started_at": self.started_at,
+            "stops_at": self.stops_at if self.running else None,
+            "samples": self.samples,
+            "window_seconds": window,
+            "retention_seconds": self.retention_seconds,
+            # Fração de uma CPU gasta pela thread de amostragem
+            "overhead": round(self.sampling_seconds / elapsed, 5) if elapsed else 0.0,
+            "avg_sample_ms": round(self.sampling_seconds / self.samples * 1000, 3) if self.samples else 0.0
+        }
+
+
+# Instância global do profiler
+sampling_profiler = SamplingProfiler()
+
+
+def start_sampling_profiler_if_enabled():
+    """Inicia o profiler na subida da API quando PROFILER_AUTOSTART=true"""
+    if PROFILER_AUTOSTART:
+        sampling_profiler.start()
+
+
+def stop_sampling_profiler():
+    """Para o profiler (no desligamento da API)"""
+    sampling_profiler.stop()
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Serialização JSON rápida e projeção das respostas.
+
+FastJSONResponse usa orjson quando instalado (com fallback para o json da
+biblioteca padrão). ResponseShape aplica os parâmetros de query `fields`,
+`top_k` e `compact`, para que o cliente receba apenas o que usa, e `timings`,
+que acrescenta o tempo de cada estágio da requisição.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import Query
+from fastapi.responses import JSONResponse
+
+from utils.cache import etag_for, result_headers
+from utils.metrics import stage_timer
+from utils.request_timing import current_timings
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Serializa para JSON compacto em UTF-8
+
+    Args:
+        content: Objeto serializável (dicts, listas, escalares e arrays numpy com orjson)
+
+    Returns:
+        Bytes do JSON
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse serializado com orjson (ou json compacto sem orjson)"""
+
+    def render(self, content: Any) -> bytes:
+        with stage_timer("serialize"):
+            return dumps(content)
+
+
+def _select(data: Any, path: List[str]) -> Any:
+    """Extrai o caminho (com "*" para qualquer chave) mantendo a estrutura"""
+    if not path:
+        return data
+    if isinstance(data, list):
+        return [_select(item, path) for item in data]
+    if not isinstance(data, dict):
+        return data
+    head, rest = path[0], path[1:]
+    keys = data.keys() if head == "*" else ([head] if head in data else [])
+    return {key: _select(data[key], rest) for key in keys}
+
+
+def _merge(target: Dict, source: Dict) -> Dict:
+    """Une duas seleções da mesma estrutura"""
+    for key, value in source.items():
+        if key in target and isinstance(target[key], dict) and isinstance(value, dict):
+            _merge(target[key], value)
+        elif key in target and isinstance(target[key], list) and isinstance(value, list):
+            target[key] = [
+                _merge(a, b) if isinstance(a, dict) and isinstance(b, dict) else b
+                for a, b in zip(target[key], value)
+            ]
+        else:
+            target[key] = value
+    return target
+
+
+def project_fields(data: Dict, fields: List[str]) -> Dict:
+    """
+    Mantém apenas os campos pedidos
+
+    Args:
+        data: Resposta completa
+        fields: Caminhos separados por ponto; "*" casa qualquer chave e listas
+            são percorridas item a item (ex: "summary", "classifications.*.top_prediction.name")
+
+    Returns:
+        Nova resposta apenas com os campos pedidos
+    """
+    projected = {}
+    for field in fields:
+        selected = _select(data, field.split("."))
+        if isinstance(selected, dict):
+            _merge(projected, selected)
+    return projected
+
+
+def truncate_top_k(data: Any, top_k: int) -> Any:
+    """
+    Limita as listas de predições e os dicionários de cores às k maiores
+
+    Args:
+        data: Resposta
+        top_k: Número de itens mantidos
+
+    Returns:
+        Nova resposta com predictions[:k] e all_colors com as k cores mais prováveis
+    """
+    if isinstance(data, list):
+        return [truncate_top_k(item, top_k) for item in data]
+    if not isinstance(data, dict):
+        return data
+    truncated = {}
+    for key, value in data.items():
+        if key == "predictions" and isinstance(value, list):
+            truncated[key] = [truncate_top_k(item, top_k) for item in value[:top_k]]
+        elif key == "all_colors" and isinstance(value, dict):
+            truncated[key] = dict(sorted(value.items(), key=lambda item: item[1], reverse=True)[:top_k])
+        else:
+            truncated[key] = truncate_top_k(value, top_k)
+    return truncated
+
+
+def compact_arrays(data: Any) -> Any:
+    """
+    Converte listas de dicionários com as mesmas chaves em colunas + linhas
+
+    [{"name": "Saia", "probability": 0.9}, ...] vira
+    {"columns": ["name", "probability"], "rows": [["Saia", 0.9], ...]}.
+    O campo "percentage" é omitido (derivável de "probability").
+
+    Args:
+        data: Resposta
+
+    Returns:
+        Nova resposta no formato compacto
+    """
+    if isinstance(data, dict):
+        return {key: compact_arrays(value) for key, value in data.items() if key != "percentage"}
+    if isinstance(data, list):
+        items = [compact_arrays(item) for item in data]
+        if len(items) > 1 and all(isinstance(item, dict) for item in items):
+            columns = list(items[0].keys())
+            if all(list(item.keys()) == columns for item in items[1:]):
+                return {"columns": columns, "rows": [list(item.values()) for item in items]}
+        return items
+    return data
+
+
+class ResponseShape:
+    """Parâmetros de projeção de uma requisição (ver response_shape)"""
+
+    def __init__(self, fields: Optional[str] = None, top_k: Optional[int] = None, compact: bool = False,
+                 timings: bool = False):
+        self.fields = [field.strip() for field in fields.split(",") if field.strip()] if fields else []
+        self.top_k = top_k
+        self.compact = compact
+        self.timings = timings
+
+    @property
+    def is_default(self) -> bool:
+        """True se a resposta completa foi pedida"""
+        return not self.fields and self.top_k is None and not self.compact and not self.timings
+
+    def apply(self, data: Dict) -> Dict:
+        """
+        Aplica a projeção à resposta (sem alterar o objeto original)
+
+        Args:
+            data: Resposta completa
+
+        Returns:
+            Resposta projetada
+        """
+        if self.is_default:
+            return data
+        if self.fields:
+            data = project_fields(data, self.fields)
+        if self.top_k is not None:
+            data = truncate_top_k(data, self.top_k)
+        if self.compact:
+            data = compact_arrays(data)
+        if self.timings:
+            timings = current_timings()
+            data = {**data, "timings": timings.as_dict() if timings is not None else None}
+        return data
+
+    def etag(self, etag: str) -> str:
+        """ETag da representação projetada (cada projeção tem o seu)"""
+        if self.is_default:
+            return etag
+        return etag_for(
+            f"{etag}|fields={','.join(self.fields)}|top_k={self.top_k}|compact={self.compact}|timings={self.timings}"
+        )
+
+    def headers(self, meta: Dict) -> Dict[str, str]:
+        """result_headers com o ETag da representação projetada"""
+        return result_headers({**meta, "etag": self.etag(meta["etag"])})
+
+
+def response_shape(
+    fields: Optional[str] = Query(None, description="Campos da resposta separados por vírgula (ex: summary,classifications.*.top_prediction)"),
+    top_k: Optional[int] = Query(None, ge=1, description="Mantém apenas as k predições/cores mais prováveis"),
+    compact: bool = Query(False, description="Listas de objetos como colunas + linhas"),
+    timings: bool = Query(False, description="Inclui o tempo de parede e de CPU de cada estágio da requisição")
+) -> ResponseShape:
+    """Dependência FastAPI com os parâmetros de projeção"""
+    return ResponseShape(fields, top_k, compact, timings)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescência de requisições idênticas em andamento (single-flight).
+
+Quando várias requisições com a mesma imagem e os mesmos parâmetros chegam
+enquanto a primeira ainda está sendo processada, todas aguardam a mesma
+computação em vez de rodar o pipeline completo de novo. Diferente de um
+cache, nada é guardado depois que a computação termina.
+"""
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+# Configuração via variáveis de ambiente
+REQUEST_COALESCING = os.getenv("REQUEST_COALESCING", "true").lower() in ("1", "true", "yes")
+
+
+def content_key(namespace: str, data: bytes, **params) -> str:
+    """
+    Monta a chave de coalescência a partir do conteúdo e dos parâmetros
+
+    Args:
+        namespace: Operação (ex: "analysis", "classification")
+        data: Bytes da imagem enviada
+        **params: Parâmetros que alteram o resultado
+
+    Returns:
+        Chave "namespace:sha256:parâmetros"
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{namespace}:{digest}:{json.dumps(params, sort_keys=True, default=str)}"
+
+
+class SingleFlight:
+    """Agrupa chamadas concorrentes com a mesma chave em uma única execução"""
+
+    def __init__(self, name: str):
+        """
+        Inicializa o grupo
+
+        Args:
+            name: Nome usado nas métricas
+        """
+        self.name = name
+        self.enabled = REQUEST_COALESCING
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.requests = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Executa fn() ou aguarda a execução em andamento com a mesma chave
+
+        A computação roda em uma task própria, então a desconexão do cliente
+        que a iniciou não cancela o resultado dos demais.
+
+        Args:
+            key: Chave da computação (ver content_key)
+            fn: Função que cria a corrotina da computação
+
+        Returns:
+            Tupla (resultado, True se a chamada foi coalescida)
+        """
+        self.requests += 1
+        if not self.enabled:
+            self.executions += 1
+            return await fn(), False
+
+        task = self._in_flight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+        return await asyncio.shield(task), coalesced
+
+    def _forget(self, key: str, task: asyncio.Task):
+        """Remove a computação concluída e marca a exceção como recuperada"""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict:
+        """Métricas de coalescência"""
+        return {
+            "enabled": self.enabled,
+            "requests": self.requests,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "coalesced_ratio": round(self.coalesced / self.requests, 4) if self.requests else 0.0,
+            "in_flight": len(self._in_flight)
+        }
+
+
+# Grupos globais por tipo de operação
+analysis_flight = SingleFlight("analysis")
+classification_flight = SingleFlight("classification")
+artifact_flight = SingleFlight("artifacts")
+_flights = {flight.name: flight for flight in (analysis_flight, classification_flight, artifact_flight)}
+
+
+def get_coalescing_stats() -> Dict:
+    """Métricas de todos os grupos"""
+    return {name: flight.stats() for name, flight in _flights.items()}
+
+
+def set_coalescing_enabled(enabled: bool):
+    """Ativa ou desativa a coalescência em todos os grupos"""
+    for flight in _flights.values():
+        flight.enabled = enabled
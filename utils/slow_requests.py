@@ -0,0 +1,333 @@
+# -*- coding: utf-8 -*-
+"""
+Captura das requisições lentas para reprodução offline.
+
+Requisições que passam de SLOW_REQUEST_THRESHOLD_MS são gravadas em um
+armazenamento local limitado: o corpo vai para um blob endereçado pelo
+SHA-256 (imagens repetidas são gravadas uma vez) e os metadados para uma
+linha de captures.jsonl, com os parâmetros, os tempos de cada estágio, a
+versão dos modelos e as configurações da detecção. replay_requests.py
+reenvia as capturas ao pipeline em processo ou a um servidor e compara os
+tempos entre builds.
+
+Formato de cada linha de captures.jsonl (REPLAY_FORMAT):
+
+    {
+      "format": "fashion-extractor-replay/1",
+      "id": "3f2a9c1b7d4e",
+      "captured_at": 1792369428.9,
+      "request": {
+        "method": "POST", "path": "/api/v1/analysis/complete", "route": "/api/v1/analysis/complete",
+        "query": "multi_person=true", "headers": {"content-type": "multipart/form-data; boundary=..."},
+        "body": {"sha256": "ab12...", "size": 183422, "path": "blobs/ab12....bin"}
+      },
+      "response": {"status": 200, "duration_ms": 2431.7, "cache": "MISS"},
+      "timings": {"decode": {"wall_ms": 8.1, "cpu_ms": 8.0, "count": 1}, ...},
+      "models": {"model_version": "...", "clip_model": "ViT-B/32", "clip_weights": "", "device": "cpu"},
+      "settings": {"margin_percentage": 0.1, "cascade_mode": false, "detection_backend": "thread"},
+      "build": "", "trace_id": null
+    }
+
+"body" é null em requisições sem corpo e {"truncated": true, "size": ...}
+quando o corpo passa de SLOW_REQUEST_MAX_BODY_MB. O caminho do blob é
+relativo ao arquivo; arquivos de replay escritos à mão podem apontar para
+qualquer imagem.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from utils.request_timing import current_timings
+from utils.tracing import current_span
+
+# Configuração via variáveis de ambiente
+SLOW_REQUEST_CAPTURE = os.getenv("SLOW_REQUEST_CAPTURE", "false").lower() in ("1", "true", "yes")
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "2000"))
+SLOW_REQUEST_DIR = os.getenv("SLOW_REQUEST_DIR", os.path.join("data", "slow_requests"))
+SLOW_REQUEST_KEEP = int(os.getenv("SLOW_REQUEST_KEEP", "200"))
+SLOW_REQUEST_MAX_BODY_MB = float(os.getenv("SLOW_REQUEST_MAX_BODY_MB", "25"))
+BUILD_ID = os.getenv("BUILD_ID", "")
+
+REPLAY_FORMAT = "fashion-extractor-replay/1"
+CAPTURES_FILE = "captures.jsonl"
+
+# Header enviado por replay_requests.py (requisições reproduzidas não são capturadas de novo)
+REPLAY_HEADER = "x-replay-id"
+
+# Headers necessários para reproduzir a requisição (sem credenciais)
+_CAPTURED_HEADERS = (b"content-type", b"accept", b"if-none-match")
+
+# Caminhos que nunca são capturados
+_SKIP_PREFIXES = ("/api/v1/admin", "/metrics", "/api/v1/static", "/static")
+
+
+class SlowRequestStore:
+    """Armazenamento limitado das capturas (JSONL + blobs por conteúdo)"""
+
+    def __init__(self, directory: str = SLOW_REQUEST_DIR, keep: int = SLOW_REQUEST_KEEP):
+        """
+        Inicializa o armazenamento
+
+        Args:
+            directory: Pasta das capturas
+            keep: Número máximo de capturas mantidas (as mais antigas saem primeiro)
+        """
+        self.directory = directory
+        self.keep = keep
+        self.path = os.path.join(directory, CAPTURES_FILE)
+        self._lock = threading.Lock()
+        self._count: Optional[int] = None
+        self.captured = 0
+        self.errors = 0
+
+    def _read_records(self) -> List[Dict]:
+        records = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _write_blob(self, body: bytes) -> Dict:
+        digest = hashlib.sha256(body).hexdigest()
+        relative = f"blobs/{digest}.bin"
+        path = os.path.join(self.directory, relative)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        return {"sha256": digest, "size": len(body), "path": relative}
+
+    def _prune(self):
+        """Mantém as `keep` capturas mais recentes e remove os blobs sem referência"""
+        records = self._read_records()[-self.keep:]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+        os.replace(tmp_path, self.path)
+        self._count = len(records)
+        referenced = {
+            os.path.basename(record["request"]["body"]["path"])
+            for record in records
+            if (record["request"].get("body") or {}).get("path")
+        }
+        blob_dir = os.path.join(self.directory, "blobs")
+        for name in os.listdir(blob_dir) if os.path.isdir(blob_dir) else ():
+            if name not in referenced:
+                try:
+                    os.remove(os.path.join(blob_dir, name))
+                except FileNotFoundError:
+                    pass
+
+    def save(self, record: Dict, body: Optional[bytes]) -> str:
+        """
+        Grava uma captura
+
+        Args:
+            record: Metadados (sem o corpo; ver o formato no topo do módulo)
+            body: Corpo da requisição (None se vazio ou grande demais)
+
+        Returns:
+            ID da captura
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if body:
+                record["request"]["body"] = self._write_blob(body)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record) + "\n")
+            if self._count is None:
+                self._count = len(self._read_records())
+            else:
+                self._count += 1
+            # Reescreve o arquivo só quando passa da folga (não a cada captura)
+            if self._count > self.keep * 1.25:
+                self._prune()
+            self.captured += 1
+        return record["id"]
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        """Capturas mais recentes primeiro"""
+        with self._lock:
+            records = self._read_records()
+        return list(reversed(records[-limit:]))
+
+    def get(self, capture_id: str) -> Optional[Dict]:
+        with self._lock:
+            records = self._read_records()
+        for record in reversed(records):
+            if record.get("id") == capture_id:
+                return record
+        return None
+
+    def body_path(self, record: Dict) -> Optional[str]:
+        """Caminho do blob com o corpo da captura"""
+        body = record["request"].get("body") or {}
+        if not body.get("path"):
+            return None
+        path = os.path.join(self.directory, body["path"])
+        return path if os.path.exists(path) else None
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": SLOW_REQUEST_CAPTURE,
+            "threshold_ms": SLOW_REQUEST_THRESHOLD_MS,
+            "directory": self.directory,
+            "keep": self.keep,
+            "captured": self.captured,
+            "errors": self.errors
+        }
+
+
+# Instância global
+slow_request_store = SlowRequestStore()
+
+
+def model_info() -> Dict:
+    """Versões dos modelos e o dispositivo (gravados em cada captura)"""
+    from utils.cache import model_version
+    from utils.clip_classifier import classifier
+    return {
+        "model_version": model_version(),
+        "clip_model": classifier.model_name,
+        "clip_weights": os.getenv("CLIP_WEIGHTS", ""),
+        "device": classifier.get_device_info()
+    }
+
+
+def detection_settings() -> Dict:
+    """Configurações que mudam o resultado e o custo da detecção"""
+    from utils.body_parts_detector import get_margin_percentage, get_cascade_mode
+    from utils.detection_pool import DETECTION_BACKEND
+    return {
+        "margin_percentage": get_margin_percentage(),
+        "cascade_mode": get_cascade_mode(),
+        "detection_backend": DETECTION_BACKEND
+    }
+
+
+def _save_capture(record: Dict, body: Optional[bytes]):
+    try:
+        record["models"] = model_info()
+        record["settings"] = detection_settings()
+        capture_id = slow_request_store.save(record, body)
+        print(f"🐢 Requisição lenta capturada: {record['request']['path']} "
+              f"({record['response']['duration_ms']:.0f} ms) -> {capture_id}")
+    except Exception as e:
+        slow_request_store.errors += 1
+        print(f"⚠️ Falha ao gravar a captura da requisição lenta: {e}")
+
+
+# Gravações em andamento (referência forte até terminarem)
+_pending_saves = set()
+
+
+def _schedule_capture(record: Dict, body: Optional[bytes]):
+    """Grava a captura no threadpool sem esperar (fora da latência medida da requisição)"""
+    task = asyncio.get_running_loop().create_task(run_in_threadpool(_save_capture, record, body))
+    _pending_saves.add(task)
+    task.add_done_callback(_pending_saves.discard)
+
+
+class SlowRequestMiddleware:
+    """
+    Middleware ASGI que grava as requisições acima de SLOW_REQUEST_THRESHOLD_MS
+
+    Fica dentro do TimingMiddleware para ler os tempos dos estágios. O corpo é
+    mantido como a lista de chunks recebidos (sem cópia) e só é juntado se a
+    requisição for lenta; a gravação roda no threadpool depois da resposta, sem
+    ser aguardada (não entra na latência registrada pelos outros middlewares).
+    """
+
+    def __init__(self, app, threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS,
+                 max_body_bytes: int = int(SLOW_REQUEST_MAX_BODY_MB * 1024 * 1024)):
+        self.app = app
+        self.threshold = threshold_ms / 1000
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not SLOW_REQUEST_CAPTURE
+                or scope["path"].startswith(_SKIP_PREFIXES)):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {}
+        for key, value in scope.get("headers", ()):
+            if key == REPLAY_HEADER.encode("latin-1"):
+                await self.app(scope, receive, send)
+                return
+            if key in _CAPTURED_HEADERS:
+                headers[key.decode("latin-1")] = value.decode("latin-1")
+
+        started = time.perf_counter()
+        chunks: List[bytes] = []
+        state = {"size": 0, "status": None, "cache": None}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                state["size"] += len(body)
+                if state["size"] <= self.max_body_bytes:
+                    chunks.append(body)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                for key, value in message.get("headers", ()):
+                    if key == b"x-cache":
+                        state["cache"] = value.decode("latin-1")
+            await send(message)
+
+        await self.app(scope, receive_wrapper, send_wrapper)
+
+        elapsed = time.perf_counter() - started
+        if elapsed < self.threshold or state["status"] is None:
+            return
+        timings = current_timings()
+        span = current_span()
+        truncated = state["size"] > self.max_body_bytes
+        record = {
+            "format": REPLAY_FORMAT,
+            "id": uuid.uuid4().hex[:12],
+            "captured_at": round(time.time(), 3),
+            "request": {
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", None),
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "headers": headers,
+                "body": {"truncated": True, "size": state["size"]} if truncated else None
+            },
+            "response": {
+                "status": state["status"],
+                "duration_ms": round(elapsed * 1000, 2),
+                "cache": state["cache"]
+            },
+            "timings": timings.as_dict()["stages"] if timings is not None else {},
+            "build": BUILD_ID,
+            "trace_id": span.trace_id if span is not None else None
+        }
+        body = b"".join(chunks) if state["size"] and not truncated else None
+        _schedule_capture(record, body)
+
+
+def get_slow_request_stats() -> Dict:
+    return slow_request_store.stats()
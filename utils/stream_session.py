@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Sessão de análise em tempo real (ex: espelho/quiosque na loja).
+
+Cada conexão possui um detector em modo de rastreamento e um cache por parte
+do corpo com o último recorte classificado. Um recorte só volta ao CLIP quando
+muda visualmente ou o resultado fica velho. Se o processamento não acompanha o
+orçamento de latência, a sessão degrada: classifica com menos frequência e,
+no nível mais alto, reduz a resolução e roda apenas a pose.
+"""
+import os
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.clip_classifier import classifier, CLIPClassifier
+from utils.video_analyzer import create_tracking_detector, frame_signature, motion_score
+
+# Configuração via variáveis de ambiente
+STREAM_LATENCY_BUDGET_MS = float(os.getenv("STREAM_LATENCY_BUDGET_MS", "250"))
+STREAM_PART_CHANGE_THRESHOLD = float(os.getenv("STREAM_PART_CHANGE_THRESHOLD", "10.0"))
+STREAM_PART_MAX_AGE_SECONDS = float(os.getenv("STREAM_PART_MAX_AGE_SECONDS", "5.0"))
+STREAM_DEGRADED_MAX_SIDE = int(os.getenv("STREAM_DEGRADED_MAX_SIDE", "480"))
+
+# Níveis de degradação
+DEGRADATION_NONE = 0  # Classifica todos os frames (respeitando o cache)
+DEGRADATION_SPARSE = 1  # Classifica apenas a cada N frames
+DEGRADATION_POSE_ONLY = 2  # Resolução reduzida e apenas pose
+
+
+class StreamSession:
+    """Estado de uma conexão de análise em tempo real"""
+
+    def __init__(self, clip_classifier: CLIPClassifier = classifier,
+                 latency_budget_ms: float = STREAM_LATENCY_BUDGET_MS):
+        """
+        Inicializa a sessão
+
+        Args:
+            clip_classifier: Classificador CLIP carregado
+            latency_budget_ms: Latência de processamento alvo por frame
+        """
+        self.classifier = clip_classifier
+        self.latency_budget_ms = latency_budget_ms
+        self.tracker = create_tracking_detector()
+        self.part_cache: Dict[str, Dict] = {}
+        self.latency_ewma_ms: Optional[float] = None
+        self.degradation = DEGRADATION_NONE
+        self.classify_interval = 1
+        self.frames_processed = 0
+
+    def close(self):
+        """Libera o detector da sessão"""
+        self.tracker.close()
+
+    def _update_degradation(self, processing_ms: float):
+        """Ajusta o nível de degradação pela média móvel da latência"""
+        if self.latency_ewma_ms is None:
+            self.latency_ewma_ms = processing_ms
+        else:
+            self.latency_ewma_ms = 0.8 * self.latency_ewma_ms + 0.2 * processing_ms
+
+        if self.latency_ewma_ms > self.latency_budget_ms:
+            if self.classify_interval < 8:
+                self.classify_interval *= 2
+                self.degradation = DEGRADATION_SPARSE
+            else:
+                self.degradation = DEGRADATION_POSE_ONLY
+        elif self.latency_ewma_ms < 0.5 * self.latency_budget_ms:
+            if self.degradation == DEGRADATION_POSE_ONLY:
+                self.degradation = DEGRADATION_SPARSE
+            elif self.classify_interval > 1:
+                self.classify_interval //= 2
+                if self.classify_interval == 1:
+                    self.degradation = DEGRADATION_NONE
+
+    def process_frame(self, jpeg_bytes: bytes) -> Dict:
+        """
+        Processa um frame JPEG
+
+        Args:
+            jpeg_bytes: Frame codificado em JPEG
+
+        Returns:
+            Dicionário com as partes detectadas e suas classificações
+        """
+        started = time.perf_counter()
+        frame_bgr = cv2.imdecode(np.frombuffer(jpeg_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame_bgr is None:
+            raise ValueError("Frame JPEG inválido")
+        frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+
+        scale = 1.0
+        if self.degradation == DEGRADATION_POSE_ONLY:
+            h, w = frame_rgb.shape[:2]
+            if max(h, w) > STREAM_DEGRADED_MAX_SIDE:
+                scale = STREAM_DEGRADED_MAX_SIDE / max(h, w)
+                frame_rgb = cv2.resize(frame_rgb, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+
+        detection = self.tracker.detect_body_parts(frame_rgb, detect_people=False)
+        self.frames_processed += 1
+
+        parts = {}
+        classified = 0
+        if detection["success"]:
+            should_classify = (
+                self.degradation != DEGRADATION_POSE_ONLY
+                and self.frames_processed % self.classify_interval == 0
+            )
+            parts, classified = self._classify_parts(frame_rgb, detection, scale, should_classify)
+
+        processing_ms = (time.perf_counter() - started) * 1000
+        self._update_degradation(processing_ms)
+
+        return {
+            "pose_detected": detection["success"],
+            "parts": parts,
+            "parts_classified": classified,
+            "processing_ms": round(processing_ms, 2),
+            "degradation_level": self.degradation,
+            "classify_interval": self.classify_interval
+        }
+
+    def _classify_parts(self, frame_rgb: np.ndarray, detection: Dict, scale: float,
+                        should_classify: bool):
+        """Classifica apenas as partes que mudaram desde o último resultado em cache"""
+        now = time.monotonic()
+        frame_image = Image.fromarray(frame_rgb)
+        stale_names, stale_images, stale_signatures = [], [], {}
+
+        for part_name in (detection["body_parts"] if should_classify else ()):
+            cached = self.part_cache.get(part_name)
+            part_image = self.tracker.crop_body_part(frame_image, detection, part_name)
+            if part_image is None or part_image.width < 2 or part_image.height < 2:
+                continue
+            signature = frame_signature(np.asarray(part_image))
+            if (cached is not None
+                    and now - cached["updated_at"] < STREAM_PART_MAX_AGE_SECONDS
+                    and motion_score(signature, cached["signature"]) < STREAM_PART_CHANGE_THRESHOLD):
+                continue
+            stale_names.append(part_name)
+            stale_images.append(part_image)
+            stale_signatures[part_name] = signature
+
+        if stale_images:
+            results = self.classifier.classify_parts_batch(stale_images, stale_names)
+            for part_name, part_result in zip(stale_names, results):
+                self.part_cache[part_name] = {
+                    "signature": stale_signatures[part_name],
+                    "updated_at": now,
+                    "result": {
+                        "prompt": part_result["top_prediction"]["prompt"],
+                        "name": part_result["top_prediction"]["name"],
+                        "probability": part_result["top_prediction"]["probability"],
+                        "is_empty": part_result["top_prediction"]["is_empty"],
+                        "color": part_result["color_analysis"]["dominant_color"]
+                    }
+                }
+
+        parts = {}
+        for part_name, part_data in detection["body_parts"].items():
+            # As boxes voltam na escala do frame original
+            bbox = [int(coord / scale) for coord in part_data["bbox"]]
+            cached = self.part_cache.get(part_name)
+            parts[part_name] = {
+                "bbox": bbox,
+                "classification": cached["result"] if cached else None,
+                "fresh": part_name in stale_signatures,
+                "age_seconds": round(now - cached["updated_at"], 3) if cached else None
+            }
+        return parts, len(stale_images)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Codificação de eventos para respostas progressivas (NDJSON e Server-Sent Events).
+"""
+import json
+from typing import Dict
+
+# Formatos de streaming suportados e seus media types
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream"
+}
+
+# Headers que evitam buffering por proxies (ex: nginx) e caches
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"
+}
+
+
+def resolve_stream_format(requested: str = None, accept: str = "") -> str:
+    """
+    Escolhe o formato do stream pelo parâmetro explícito ou pelo header Accept
+
+    Args:
+        requested: Formato pedido ("ndjson" ou "sse"), se houver
+        accept: Valor do header Accept
+
+    Returns:
+        "ndjson" ou "sse"
+    """
+    if requested:
+        if requested not in STREAM_MEDIA_TYPES:
+            raise ValueError(f"Formato de stream inválido: {requested}. Use 'ndjson' ou 'sse'")
+        return requested
+    return "sse" if "text/event-stream" in (accept or "") else "ndjson"
+
+
+def encode_event(event: str, data: Dict, stream_format: str, event_id: int = None) -> bytes:
+    """
+    Codifica um evento no formato do stream
+
+    Args:
+        event: Nome do evento (ex: "detection", "part", "done")
+        data: Conteúdo do evento
+        stream_format: "ndjson" ou "sse"
+        event_id: Identificador sequencial do evento (opcional)
+
+    Returns:
+        Bytes prontos para enviar ao cliente
+    """
+    if stream_format == "sse":
+        payload = json.dumps(data, ensure_ascii=False)
+        lines = [f"event: {event}"]
+        if event_id is not None:
+            lines.append(f"id: {event_id}")
+        lines.append(f"data: {payload}")
+        return ("\n".join(lines) + "\n\n").encode("utf-8")
+    return (json.dumps({"event": event, **data}, ensure_ascii=False) + "\n").encode("utf-8")
@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+"""
+Rastreamento (tracing) das requisições com spans compatíveis com OpenTelemetry.
+
+Cada requisição HTTP amostrada recebe um span raiz ("POST /api/v1/analysis/complete")
+e as etapas do pipeline viram spans filhos: os estágios medidos por
+stage_timer (decode, pose, yolo, crop, clip_encode, color, serialize...) e as
+etapas dos routers (detection, classify_parts, compatibility,
+full_image_analysis, storage.commit). O span atual fica em um contextvar, que
+segue a requisição para o threadpool; os estágios medidos nos workers de
+detecção (outro processo) são registrados no processo da API com os horários
+medidos no worker.
+
+Os IDs e o header W3C traceparent seguem o OpenTelemetry: um traceparent
+recebido continua o trace do cliente e a resposta devolve o traceparent do
+span raiz. Os spans terminados vão para uma fila limitada e uma thread os
+exporta em lotes (spans são descartados, e contados, se a fila encher).
+
+Exportadores (TRACE_EXPORTER, separados por vírgula; vazio desativa):
+    jsonl: um span por linha em TRACE_JSONL_PATH (padrão data/traces.jsonl)
+    otlp:  OTLP/HTTP com corpo JSON em OTEL_EXPORTER_OTLP_ENDPOINT + /v1/traces
+           (Jaeger, Tempo, OpenTelemetry Collector; otlp_collector.py é um stand-in local)
+
+Outros destinos podem ser plugados com register_exporter.
+"""
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Dict, List, Optional
+from urllib.parse import unquote
+
+# Configuração via variáveis de ambiente
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "").lower()
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH", os.path.join("data", "traces.jsonl"))
+TRACE_JSONL_MAX_MB = float(os.getenv("TRACE_JSONL_MAX_MB", "100"))
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "4096"))
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", "256"))
+TRACE_EXPORT_INTERVAL = float(os.getenv("TRACE_EXPORT_INTERVAL", "2.0"))
+OTEL_SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "fashion-extractor-api")
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+OTEL_EXPORTER_OTLP_TRACES_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT", "")
+OTEL_EXPORTER_OTLP_HEADERS = os.getenv("OTEL_EXPORTER_OTLP_HEADERS", "")
+# Em milissegundos, como na especificação do OpenTelemetry
+OTEL_EXPORTER_OTLP_TIMEOUT = float(os.getenv("OTEL_EXPORTER_OTLP_TIMEOUT", "10000"))
+
+INSTRUMENTATION_SCOPE = "fashion_extractor_api"
+
+# Tipos e status de span (valores do OTLP)
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+# ---------------------------------------------------------------------------
+# Spans
+# ---------------------------------------------------------------------------
+
+class Span:
+    """Uma operação medida dentro de um trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_span_id", "name", "kind",
+                 "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, start_ns: Optional[int] = None,
+                 attributes: Optional[Dict] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict):
+        self.attributes.update(attributes)
+
+    def add_to_attribute(self, key: str, amount: float = 1):
+        """Soma em um atributo numérico (ex: acertos de cache em várias chamadas)"""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set_error(self, exc: BaseException):
+        """Marca o span como erro com o tipo e a mensagem da exceção"""
+        self.status = STATUS_ERROR
+        self.status_message = str(exc)[:500]
+        self.attributes["exception.type"] = type(exc).__name__
+
+    def end(self, end_ns: Optional[int] = None):
+        """Encerra o span e o entrega ao exportador"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        tracer.on_end(self)
+
+    @property
+    def traceparent(self) -> str:
+        """Valor do header W3C traceparent deste span (sempre amostrado)"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict:
+        """Representação de uma linha do exportador JSONL"""
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_span_id,
+            "name": self.name,
+            "kind": "server" if self.kind == SPAN_KIND_SERVER else "internal",
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": {STATUS_UNSET: "unset", STATUS_OK: "ok", STATUS_ERROR: "error"}[self.status],
+            "status_message": self.status_message or None,
+            "attributes": self.attributes,
+            "service": OTEL_SERVICE_NAME
+        }
+
+
+class _NoopSpan:
+    """Span usado quando a requisição não é rastreada (todas as operações são no-op)"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value):
+        pass
+
+    def set_attributes(self, attributes: Dict):
+        pass
+
+    def add_to_attribute(self, key: str, amount: float = 1):
+        pass
+
+    def set_error(self, exc: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    """Span em andamento (None fora de uma requisição rastreada)"""
+    return _current_span.get()
+
+
+def start_child_span(name: str, attributes: Optional[Dict] = None):
+    """
+    Abre um span filho do span atual e o torna o span atual
+
+    Usado por stage_timer; prefira o gerenciador de contexto span().
+
+    Returns:
+        Tupla (span, token do contextvar) ou None se a requisição não é rastreada
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(name, parent.trace_id, parent.span_id, attributes=attributes)
+    return child, _current_span.set(child)
+
+
+def end_child_span(opened, exc: Optional[BaseException] = None):
+    """Encerra um span aberto por start_child_span e restaura o span anterior"""
+    child, token = opened
+    if exc is not None:
+        child.set_error(exc)
+    _current_span.reset(token)
+    child.end()
+
+
+class span:
+    """
+    Mede uma etapa como span filho do span atual
+
+    Fora de uma requisição rastreada não cria nada e entrega um span no-op.
+
+    Uso:
+        with span("classify_parts", {"parts.count": len(crops)}) as current:
+            results = classify(...)
+            current.set_attribute("parts.classified", len(results))
+    """
+
+    __slots__ = ("name", "attributes", "opened")
+
+    def __init__(self, name: str, attributes: Optional[Dict] = None):
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.opened = start_child_span(self.name, self.attributes)
+        return self.opened[0] if self.opened is not None else NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.opened is not None:
+            end_child_span(self.opened, exc)
+        return False
+
+
+def set_attribute(key: str, value):
+    """Define um atributo no span atual (no-op fora de uma requisição rastreada)"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+def add_to_attribute(key: str, amount: float = 1):
+    """Soma em um atributo numérico do span atual"""
+    current = _current_span.get()
+    if current is not None:
+        current.add_to_attribute(key, amount)
+
+
+def record_span(name: str, start_ns: int, duration_seconds: float, attributes: Optional[Dict] = None):
+    """
+    Registra um span já terminado como filho do span atual
+
+    Usado para os estágios medidos em outro processo (workers de detecção).
+
+    Args:
+        name: Nome do span
+        start_ns: Início (epoch em nanossegundos)
+        duration_seconds: Duração em segundos
+        attributes: Atributos do span
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return
+    child = Span(name, parent.trace_id, parent.span_id, start_ns=start_ns, attributes=attributes)
+    child.end(start_ns + int(duration_seconds * 1e9))
+
+
+def parse_traceparent(value: Optional[str]):
+    """
+    Lê um header W3C traceparent
+
+    Args:
+        value: Valor do header (ex: 00-<trace_id>-<span_id>-01)
+
+    Returns:
+        Tupla (trace_id, span_id pai, amostrado) ou None se inválido
+    """
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[0]) != 2 or parts[0] == "ff":
+        return None
+    trace_id, parent_id, flags = parts[1], parts[2], parts[3]
+    if len(trace_id) != 32 or len(parent_id) != 16 or len(flags) != 2:
+        return None
+    try:
+        int(trace_id, 16), int(parent_id, 16)
+        sampled = bool(int(flags, 16) & 0x01)
+    except ValueError:
+        return None
+    if trace_id == "0" * 32 or parent_id == "0" * 16:
+        return None
+    return trace_id, parent_id, sampled
+
+
+# ---------------------------------------------------------------------------
+# Exportadores
+# ---------------------------------------------------------------------------
+
+class SpanExporter:
+    """Interface dos exportadores de spans"""
+
+    name = "base"
+
+    def export(self, spans: List[Span]):
+        """Envia um lote de spans (exceções contam como falha de exportação)"""
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class JsonlSpanExporter(SpanExporter):
+    """Grava um span por linha em um arquivo JSONL (rotacionado em .1 ao passar do limite)"""
+
+    name = "jsonl"
+
+    def __init__(self, path: str = TRACE_JSONL_PATH, max_mb: float = TRACE_JSONL_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def export(self, spans: List[Span]):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lines = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            size = f.tell()
+        if self.max_bytes and size > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+
+
+def _otlp_value(value) -> Dict:
+    """Valor de atributo no formato AnyValue do OTLP/JSON"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # int64 é serializado como string no OTLP/JSON
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_otlp_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict) -> List[Dict]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def otlp_payload(spans: List[Span], service_name: str = OTEL_SERVICE_NAME) -> Dict:
+    """
+    Corpo ExportTraceServiceRequest no formato OTLP/JSON
+
+    Args:
+        spans: Spans terminados
+        service_name: Valor do atributo de recurso service.name
+
+    Returns:
+        Dicionário pronto para json.dumps
+    """
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": span.kind,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": _otlp_attributes(span.attributes),
+            "status": {"code": span.status}
+        }
+        if span.parent_span_id:
+            otlp_span["parentSpanId"] = span.parent_span_id
+        if span.status_message:
+            otlp_span["status"]["message"] = span.status_message
+        otlp_spans.append(otlp_span)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({
+                "service.name": service_name,
+                "process.pid": os.getpid(),
+                "telemetry.sdk.language": "python"
+            })},
+            "scopeSpans": [{"scope": {"name": INSTRUMENTATION_SCOPE}, "spans": otlp_spans}]
+        }]
+    }
+
+
+def _parse_headers(value: str) -> Dict[str, str]:
+    """Lê OTEL_EXPORTER_OTLP_HEADERS (chave=valor separados por vírgula)"""
+    headers = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, _, header_value = item.partition("=")
+            headers[key.strip()] = unquote(header_value.strip())
+    return headers
+
+
+class OtlpHttpSpanExporter(SpanExporter):
+    """Envia os spans para um coletor OTLP/HTTP (corpo JSON)"""
+
+    name = "otlp"
+
+    def __init__(self, endpoint: Optional[str] = None, headers: Optional[Dict[str, str]] = None,
+                 timeout_ms: float = OTEL_EXPORTER_OTLP_TIMEOUT):
+        """
+        Inicializa o exportador
+
+        Args:
+            endpoint: URL completa do coletor (padrão: OTEL_EXPORTER_OTLP_TRACES_ENDPOINT
+                ou OTEL_EXPORTER_OTLP_ENDPOINT + /v1/traces)
+            headers: Headers extras (ex: autenticação do coletor)
+            timeout_ms: Timeout de cada envio em milissegundos
+        """
+        self.endpoint = endpoint or OTEL_EXPORTER_OTLP_TRACES_ENDPOINT or (
+            OTEL_EXPORTER_OTLP_ENDPOINT.rstrip("/") + "/v1/traces"
+        )
+        self.headers = {"Content-Type": "application/json", **(headers or _parse_headers(OTEL_EXPORTER_OTLP_HEADERS))}
+        self.timeout = timeout_ms / 1000
+
+    def export(self, spans: List[Span]):
+        body = json.dumps(otlp_payload(spans), default=str).encode("utf-8")
+        # Uma nova tentativa para falhas transitórias (coletor reiniciando, 429/503)
+        for attempt in range(2):
+            request = urllib.request.Request(self.endpoint, data=body, headers=self.headers, method="POST")
+            try:
+                with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                    response.read()
+                return
+            except urllib.error.HTTPError as e:
+                if e.code not in (429, 502, 503, 504) or attempt:
+                    raise
+            except urllib.error.URLError:
+                if attempt:
+                    raise
+            time.sleep(0.5)
+
+
+# Fábricas dos exportadores por nome (TRACE_EXPORTER)
+_EXPORTERS: Dict[str, Callable[[], SpanExporter]] = {
+    "jsonl": JsonlSpanExporter,
+    "otlp": OtlpHttpSpanExporter
+}
+
+
+def register_exporter(name: str, factory: Callable[[], SpanExporter]):
+    """
+    Registra um exportador selecionável por TRACE_EXPORTER
+
+    Args:
+        name: Nome usado em TRACE_EXPORTER
+        factory: Função sem argumentos que cria o exportador
+    """
+    _EXPORTERS[name.lower()] = factory
+
+
+# ---------------------------------------------------------------------------
+# Tracer
+# ---------------------------------------------------------------------------
+
+class Tracer:
+    """Amostragem, fila de spans terminados e a thread de exportação em lotes"""
+
+    def __init__(self, sample_rate: float = TRACE_SAMPLE_RATE, queue_size: int = TRACE_QUEUE_SIZE,
+                 batch_size: int = TRACE_BATCH_SIZE, interval: float = TRACE_EXPORT_INTERVAL):
+        self.sample_rate = sample_rate
+        self.batch_size = batch_size
+        self.interval = interval
+        self.exporters: List[SpanExporter] = []
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    def add_exporter(self, exporter: SpanExporter):
+        self.exporters.append(exporter)
+
+    def should_sample(self, parent_sampled: Optional[bool] = None) -> bool:
+        """Decide se uma nova requisição é rastreada (respeita a decisão do traceparent recebido)"""
+        if not self.enabled:
+            return False
+        if parent_sampled is not None:
+            return parent_sampled
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def on_end(self, span: Span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]):
+        delivered = False
+        for exporter in self.exporters:
+            try:
+                exporter.export(batch)
+                delivered = True
+            except Exception as e:
+                self.export_errors += 1
+                self.last_error = f"{exporter.name}: {e}"
+                print(f"⚠️ Falha ao exportar spans ({exporter.name}): {e}")
+        # Exportado se ao menos um exportador recebeu o lote; senão os spans se perderam
+        if delivered:
+            self.exported += len(batch)
+        else:
+            self.dropped += len(batch)
+
+    def flush(self):
+        """Exporta todos os spans da fila (na thread atual)"""
+        while True:
+            batch = self._drain()
+            if not batch:
+                return
+            self._export(batch)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self):
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+        names = ", ".join(exporter.name for exporter in self.exporters)
+        print(f"✅ Tracing ativo (exportadores: {names}, amostragem {self.sample_rate:g})")
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join(timeout=10)
+        self.flush()
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "exporters": [exporter.name for exporter in self.exporters],
+            "sample_rate": self.sample_rate,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "export_errors": self.export_errors,
+            "last_error": self.last_error
+        }
+
+
+def create_exporters(names: str = TRACE_EXPORTER) -> List[SpanExporter]:
+    """
+    Cria os exportadores configurados
+
+    Args:
+        names: Nomes separados por vírgula (jsonl, otlp ou registrados)
+
+    Returns:
+        Lista de exportadores (vazia desativa o tracing)
+    """
+    exporters = []
+    for name in filter(None, (item.strip() for item in names.split(","))):
+        if name == "none":
+            continue
+        factory = _EXPORTERS.get(name)
+        if factory is None:
+            print(f"⚠️ TRACE_EXPORTER desconhecido: {name}. Ignorado.")
+            continue
+        exporters.append(factory())
+    return exporters
+
+
+# Instância global
+tracer = Tracer()
+
+
+def start_tracing():
+    """Cria os exportadores de TRACE_EXPORTER e inicia a thread de exportação"""
+    for exporter in create_exporters():
+        tracer.add_exporter(exporter)
+    tracer.start()
+
+
+def stop_tracing():
+    """Exporta os spans pendentes e encerra a thread"""
+    tracer.stop()
+
+
+def get_tracing_stats() -> Dict:
+    return tracer.stats()
+
+
+# ---------------------------------------------------------------------------
+# Middleware
+# ---------------------------------------------------------------------------
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TraceMiddleware:
+    """Middleware ASGI que abre o span raiz de cada requisição amostrada"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        parent = parse_traceparent(_header(scope, b"traceparent"))
+        if not tracer.should_sample(parent[2] if parent is not None else None):
+            await self.app(scope, receive, send)
+            return
+
+        root = Span(
+            scope["method"],
+            parent[0] if parent is not None else f"{random.getrandbits(128):032x}",
+            parent[1] if parent is not None else None,
+            kind=SPAN_KIND_SERVER,
+            attributes={"http.request.method": scope["method"], "url.path": scope["path"]}
+        )
+        content_length = _header(scope, b"content-length")
+        if content_length and content_length.isdigit():
+            root.attributes["http.request.body.size"] = int(content_length)
+        token = _current_span.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                root.attributes["http.response.status_code"] = status
+                if status >= 500:
+                    root.status = STATUS_ERROR
+                message = {**message, "headers": [*message.get("headers", []), (b"traceparent", root.traceparent.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            # Template da rota, conhecido após o roteamento
+            route = getattr(scope.get("route"), "path", None)
+            if route:
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.route"] = route
+            root.end()
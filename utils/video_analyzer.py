@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Análise de outfit em vídeos curtos (ex: vídeos de prova de roupa).
+
+A pose roda em modo de rastreamento (static_image_mode=False) em todos os
+frames amostrados, mantendo a continuidade dos landmarks. YOLO e CLIP rodam
+apenas em keyframes, escolhidos por movimento (diferença entre miniaturas em
+tons de cinza) e confirmados por mudança no embedding CLIP do frame. Assim o
+custo acompanha as mudanças de cena, não o número de frames.
+"""
+import os
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.body_parts_detector import BodyPartsDetector, detector
+from utils.clip_classifier import classifier, CLIPClassifier
+
+# Configuração via variáveis de ambiente
+VIDEO_MOTION_THRESHOLD = float(os.getenv("VIDEO_MOTION_THRESHOLD", "12.0"))  # Diferença média (0-255)
+VIDEO_EMBEDDING_THRESHOLD = float(os.getenv("VIDEO_EMBEDDING_THRESHOLD", "0.95"))  # Similaridade de cosseno
+VIDEO_MAX_KEYFRAME_INTERVAL = int(os.getenv("VIDEO_MAX_KEYFRAME_INTERVAL", "150"))  # Em frames amostrados
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "1800"))
+
+# Tamanho da miniatura usada para medir movimento
+SIGNATURE_SIZE = 64
+
+
+def create_tracking_detector() -> BodyPartsDetector:
+    """
+    Cria um detector em modo de rastreamento que reutiliza o YOLO já carregado
+
+    O modelo é compartilhado com o detector global (e com as requisições), então o
+    lock do YOLO também é: as inferências continuam serializadas.
+
+    Returns:
+        BodyPartsDetector com static_image_mode=False
+    """
+    return BodyPartsDetector(
+        margin_percentage=detector.margin_percentage,
+        cascade_mode=False,
+        static_image_mode=False,
+        yolo_model=detector.yolo_model,
+        yolo_lock=detector._yolo_lock
+    )
+
+
+def frame_signature(frame_rgb: np.ndarray) -> np.ndarray:
+    """
+    Calcula uma miniatura em tons de cinza usada para medir movimento
+
+    Args:
+        frame_rgb: Frame RGB
+
+    Returns:
+        Array float32 (SIGNATURE_SIZE, SIGNATURE_SIZE)
+    """
+    small = cv2.resize(frame_rgb, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY).astype(np.float32)
+
+
+def motion_score(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Diferença absoluta média entre duas miniaturas (0-255)"""
+    return float(np.mean(np.abs(signature_a - signature_b)))
+
+
+class OutfitAggregator:
+    """Agrega classificações e cores por parte do corpo ao longo de vários frames"""
+
+    def __init__(self):
+        self.parts = {}
+
+    def add(self, part_name: str, part_result: Dict):
+        """
+        Adiciona o resultado de classificação de uma parte em um keyframe
+
+        Args:
+            part_name: Nome da parte do corpo
+            part_result: Dicionário com top_prediction e color_analysis
+        """
+        part = self.parts.setdefault(part_name, {"observations": 0, "items": {}, "colors": {}})
+        part["observations"] += 1
+        top = part_result["top_prediction"]
+        item = part["items"].setdefault(top["prompt"], {"prediction": top, "score": 0.0, "votes": 0})
+        item["score"] += top["probability"]
+        item["votes"] += 1
+        color_analysis = part_result.get("color_analysis", {})
+        color = color_analysis.get("dominant_color")
+        if color:
+            part["colors"][color] = part["colors"].get(color, 0.0) + color_analysis.get("confidence", 0.0)
+
+    def summary(self) -> Dict:
+        """
+        Retorna a classificação consolidada de cada parte
+
+        Returns:
+            Dicionário {parte: {"top_prediction", "agreement", "dominant_color", ...}}
+        """
+        result = {}
+        for part_name, part in self.parts.items():
+            best = max(part["items"].values(), key=lambda item: item["score"])
+            top_prediction = dict(best["prediction"])
+            top_prediction["probability"] = best["score"] / best["votes"]
+            top_prediction["percentage"] = f"{top_prediction['probability']:.2%}"
+            total_color = sum(part["colors"].values())
+            dominant_color = max(part["colors"].items(), key=lambda c: c[1])[0] if part["colors"] else "unknown"
+            result[part_name] = {
+                "top_prediction": top_prediction,
+                "agreement": best["votes"] / part["observations"],
+                "observations": part["observations"],
+                "alternatives": sorted(
+                    ({"prompt": prompt, "votes": item["votes"]} for prompt, item in part["items"].items()),
+                    key=lambda alt: alt["votes"], reverse=True
+                ),
+                "dominant_color": dominant_color,
+                "color_distribution": {
+                    color: round(score / total_color, 3) for color, score in part["colors"].items()
+                } if total_color > 0 else {}
+            }
+        return result
+
+
+class VideoAnalyzer:
+    """Analisa o outfit de um vídeo rodando modelos pesados apenas em keyframes"""
+
+    def __init__(self, clip_classifier: CLIPClassifier = classifier, frame_stride: int = 1,
+                 motion_threshold: float = VIDEO_MOTION_THRESHOLD,
+                 embedding_threshold: float = VIDEO_EMBEDDING_THRESHOLD,
+                 max_keyframe_interval: int = VIDEO_MAX_KEYFRAME_INTERVAL,
+                 max_frames: int = VIDEO_MAX_FRAMES):
+        """
+        Inicializa o analisador de vídeo
+
+        Args:
+            clip_classifier: Classificador CLIP carregado
+            frame_stride: Processa um a cada N frames
+            motion_threshold: Movimento mínimo para um frame ser candidato a keyframe
+            embedding_threshold: Similaridade acima da qual o candidato é descartado
+            max_keyframe_interval: Força um keyframe após N frames amostrados
+            max_frames: Número máximo de frames lidos do vídeo
+        """
+        self.classifier = clip_classifier
+        self.frame_stride = max(1, frame_stride)
+        self.motion_threshold = motion_threshold
+        self.embedding_threshold = embedding_threshold
+        self.max_keyframe_interval = max_keyframe_interval
+        self.max_frames = max_frames
+
+    def analyze(self, video_path: str) -> Dict:
+        """
+        Analisa um arquivo de vídeo
+
+        Args:
+            video_path: Caminho do vídeo
+
+        Returns:
+            Dicionário com a análise agregada e a linha do tempo dos keyframes
+        """
+        capture = cv2.VideoCapture(video_path)
+        if not capture.isOpened():
+            raise ValueError("Não foi possível abrir o vídeo")
+
+        fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+        tracker = create_tracking_detector()
+        aggregator = OutfitAggregator()
+        timeline = []
+        stats = {
+            "frames_read": 0,
+            "frames_processed": 0,
+            "frames_with_pose": 0,
+            "keyframe_candidates": 0,
+            "keyframes": 0
+        }
+        last_signature: Optional[np.ndarray] = None
+        last_embedding = None
+        frames_since_keyframe = 0
+
+        try:
+            while stats["frames_read"] < self.max_frames:
+                ok, frame_bgr = capture.read()
+                if not ok:
+                    break
+                frame_index = stats["frames_read"]
+                stats["frames_read"] += 1
+                if frame_index % self.frame_stride:
+                    continue
+                stats["frames_processed"] += 1
+                frames_since_keyframe += 1
+
+                frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+
+                # Pose em modo de rastreamento em todos os frames amostrados
+                detection = tracker.detect_body_parts(frame_rgb, detect_people=False)
+                if not detection["success"]:
+                    continue
+                stats["frames_with_pose"] += 1
+
+                # Candidato a keyframe por movimento (ou intervalo máximo)
+                signature = frame_signature(frame_rgb)
+                is_candidate = (
+                    last_signature is None
+                    or motion_score(signature, last_signature) >= self.motion_threshold
+                    or frames_since_keyframe >= self.max_keyframe_interval
+                )
+                if not is_candidate:
+                    continue
+                stats["keyframe_candidates"] += 1
+                last_signature = signature
+
+                # Confirma a mudança de cena pelo embedding CLIP do frame
+                frame_image = Image.fromarray(frame_rgb)
+                embedding = self.classifier.encode_images([frame_image])[0]
+                forced = frames_since_keyframe >= self.max_keyframe_interval
+                if last_embedding is not None and not forced:
+                    similarity = float((embedding @ last_embedding).item())
+                    if similarity >= self.embedding_threshold:
+                        continue
+                last_embedding = embedding
+                frames_since_keyframe = 0
+
+                timeline.append(self._analyze_keyframe(
+                    tracker, frame_rgb, frame_image, detection, frame_index, fps, aggregator
+                ))
+                stats["keyframes"] += 1
+        finally:
+            capture.release()
+            tracker.close()
+
+        parts = aggregator.summary()
+        return {
+            "success": stats["keyframes"] > 0,
+            "error": None if stats["keyframes"] > 0 else "Nenhuma pose detectada no vídeo",
+            "video": {
+                "fps": fps,
+                "frames_read": stats["frames_read"],
+                "duration_seconds": round(stats["frames_read"] / fps, 3) if fps else None
+            },
+            "processing": {
+                **stats,
+                "frame_stride": self.frame_stride,
+                "keyframe_ratio": round(stats["keyframes"] / stats["frames_processed"], 4) if stats["frames_processed"] else 0.0
+            },
+            "parts": parts,
+            "outfit_compatibility": self.classifier.analyze_outfit_compatibility(parts) if parts else {},
+            "keyframes": timeline
+        }
+
+    def _analyze_keyframe(self, tracker: BodyPartsDetector, frame_rgb: np.ndarray, frame_image: Image.Image,
+                          detection: Dict, frame_index: int, fps: float, aggregator: OutfitAggregator) -> Dict:
+        """Roda YOLO e a classificação em lote das peças em um keyframe"""
+        people = tracker.detect_people(frame_rgb)
+
+        part_names: List[str] = []
+        part_images: List[Image.Image] = []
+        for part_name in detection["body_parts"]:
+            part_image = tracker.crop_body_part(frame_image, detection, part_name)
+            if part_image is not None and part_image.width > 1 and part_image.height > 1:
+                part_names.append(part_name)
+                part_images.append(part_image)
+
+        parts = {}
+        for part_name, part_result in zip(part_names, self.classifier.classify_parts_batch(part_images, part_names)):
+            aggregator.add(part_name, part_result)
+            parts[part_name] = {
+                "bbox": detection["body_parts"][part_name]["bbox"],
+                "prompt": part_result["top_prediction"]["prompt"],
+                "name": part_result["top_prediction"]["name"],
+                "probability": part_result["top_prediction"]["probability"],
+                "color": part_result["color_analysis"]["dominant_color"]
+            }
+
+        return {
+            "frame_index": frame_index,
+            "timestamp_seconds": round(frame_index / fps, 3) if fps else None,
+            "people_detected": len(people),
+            "parts": parts
+        }
+
+
+def analyze_video(video_path: str, **options) -> Dict:
+    """
+    Função utilitária para analisar um vídeo com o classificador global
+
+    Args:
+        video_path: Caminho do vídeo
+        **options: Parâmetros de VideoAnalyzer (frame_stride, motion_threshold, ...)
+
+    Returns:
+        Dicionário com a análise do vídeo
+    """
+    return VideoAnalyzer(**options).analyze(video_path)